@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -7,3 +9,20 @@ import os
 engine = create_engine(os.getenv("DB_URL"), echo=True, future=True)
 Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Async engine used by the request handlers, so that queries never block the event loop.
+# ASYNC_DB_URL can be set explicitly, otherwise DB_URL is reused with the asyncpg driver.
+async_db_url = os.getenv("ASYNC_DB_URL") or make_url(
+    os.getenv("DB_URL")).set(drivername="postgresql+asyncpg")
+
+async_engine = create_async_engine(
+    async_db_url,
+    echo=os.getenv("DB_ECHO", "false") == "true",
+    pool_size=int(os.getenv("DB_POOL_SIZE", 20)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 30)),
+    pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    pool_pre_ping=True
+)
+AsyncSession = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False)
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+
+import httpx
+
+from utils.utilities import log
+
+
+class HttpClient:
+
+    # One pooled client for every outbound HTTP call of the application, so requests to the same host
+    # reuse kept-alive connections instead of paying for a new TCP and TLS handshake each time.
+    # HTTP/2 is used when the h2 package is installed, unless HTTP2_ENABLED turns it off.
+
+    def __init__(self):
+        self.client: httpx.AsyncClient | None = None
+        self.http2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+        self.timeout = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", 10)), connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)))
+        self.limits = httpx.Limits(max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+                                   max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)),
+                                   keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30)))
+
+    def start(self):
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(http2=self.http2, timeout=self.timeout, limits=self.limits)
+            log("HTTP CLIENT STARTED", {"http2": self.http2})
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
+
+    def get(self) -> httpx.AsyncClient:
+        # scripts and jobs running outside the app's lifespan get the client on first use
+        self.start()
+        return self.client
+
+
+http = HttpClient()
@@ -1,5 +1,8 @@
-import redis
+import redis.asyncio as redis
 import os
 
-r = redis.Redis(host=os.getenv("REDIS_HOST"), port=os.getenv(
-    "REDIS_PORT"), decode_responses=True)
+# a burst of requests waits up to REDIS_POOL_TIMEOUT seconds for a free connection instead of failing
+pool = redis.BlockingConnectionPool(host=os.getenv("REDIS_HOST"), port=os.getenv(
+    "REDIS_PORT"), max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)), timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 5)), decode_responses=True)
+
+r = redis.Redis(connection_pool=pool)
@@ -1,11 +1,67 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+import os
+import socket
+from uuid import uuid4
+
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from sqlalchemy import create_engine
+
+from config.redis import r as redis
+
+# APScheduler 3's job store is synchronous, so its queries run on the event loop whatever engine it is
+# given. It gets a small dedicated pool without statement echo: a few short primary key queries per job
+# run, that never wait behind the app's own connections nor flood the logs. The trade-off is accepted
+# rather than moving the store off the loop, which APScheduler 3 does not support.
+jobstore_engine = create_engine(os.getenv("DB_URL"), echo=False, future=True, pool_size=2, max_overflow=0, pool_pre_ping=True)
 
 
 class Scheduler:
 
     def new_scheduler(self):
-        scheduler = BackgroundScheduler()
+        # jobs are persisted in the database, so a restart or a change of leader neither loses nor repeats them
+        scheduler = AsyncIOScheduler(
+            jobstores={"default": SQLAlchemyJobStore(engine=jobstore_engine)},
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME", 300))}
+        )
         return scheduler
 
-    def start(self, scheduler):
-        scheduler.start()
+    def start(self, scheduler, paused: bool = False):
+        scheduler.start(paused=paused)
+
+
+renew_script = redis.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+release_script = redis.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+class Leader:
+
+    # Only one instance across all workers and pods runs the background jobs. Leadership is a Redis
+    # key holding the leader's id with a TTL, which the leader keeps renewing. If the leader dies the
+    # key expires and another instance takes over.
+
+    def __init__(self):
+        self.key = os.getenv("SCHEDULER_LEADER_KEY", "scheduler:leader")
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid4()}"
+        self.ttl = int(os.getenv("SCHEDULER_LEADER_TTL", 15))
+        self.renew_interval = self.ttl / 3
+
+    async def acquire(self) -> bool:
+        return bool(await redis.set(self.key, self.id, nx=True, ex=self.ttl))
+
+    async def renew(self) -> bool:
+        return bool(await renew_script(keys=[self.key], args=[self.id, self.ttl * 1000]))
+
+    async def release(self):
+        await release_script(keys=[self.key], args=[self.id])
@@ -1,25 +1,163 @@
+import asyncio
+import os
+
 from fastapi import WebSocket
 from typing import List,Dict
 
+from config.redis import r as redis
+from utils.utilities import log
+
+
+class Connection:
+    # Every socket gets its own bounded queue drained by its own writer task, so a slow
+    # client only ever delays itself and a dead one is dropped without touching the rest.
+
+    def __init__(self, websocket: WebSocket, bid_id: str, queue_size: int):
+        self.websocket = websocket
+        self.bid_id = bid_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task | None = None
+
+    def send(self, message: str) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+
 class ConnectionManager:
     def __init__(self):
         # Use a dictionary to store active connections for each bid_id (rooms)
-        self.rooms: Dict[str, List[WebSocket]] = {}
+        self.rooms: Dict[str, List[Connection]] = {}
+        self.queue_size = int(os.getenv("WS_SEND_QUEUE_SIZE", 100))
+        self.send_timeout = float(os.getenv("WS_SEND_TIMEOUT", 5))
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.slow_consumers_evicted = 0
+        self.dead_sockets_pruned = 0
+        self.listener: asyncio.Task | None = None
+        # the event loop only keeps weak references to tasks, so pending closes are held here until done
+        self.closing: set = set()
+
+    def channel(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:ws"
+
+    def start(self):
+        self.listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+
+    async def listen(self):
+        # every worker receives every bid's messages over Redis and delivers them to its own sockets
+        while True:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(self.channel("*"))
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self.fan_out(bid_id=message["channel"][len("bid:"):-len(":ws")], message=message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("SOCKET BACKPLANE DISCONNECTED", str(e))
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
 
     async def connect(self, websocket: WebSocket, bid_id: str):
         await websocket.accept()
+        connection = Connection(websocket=websocket, bid_id=bid_id, queue_size=self.queue_size)
+        connection.writer = asyncio.create_task(self.write(connection))
         if bid_id in self.rooms:
-            self.rooms[bid_id].append(websocket)
+            self.rooms[bid_id].append(connection)
         else:
-            self.rooms[bid_id] = [websocket]
+            self.rooms[bid_id] = [connection]
 
     def disconnect(self, websocket: WebSocket, bid_id: str):
-        if bid_id in self.rooms:
-            self.rooms[bid_id].remove(websocket)
+        for connection in self.rooms.get(bid_id, []):
+            if connection.websocket is websocket:
+                self.remove(connection)
+                return
+
+    def remove(self, connection: Connection):
+        room = self.rooms.get(connection.bid_id)
+        if room and connection in room:
+            room.remove(connection)
+            if not room:
+                del self.rooms[connection.bid_id]
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    async def write(self, connection: Connection):
+        try:
+            while True:
+                message = await connection.queue.get()
+                await asyncio.wait_for(connection.websocket.send_text(message), timeout=self.send_timeout)
+                self.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log("PRUNING DEAD SOCKET", {"bid_id": connection.bid_id, "error": str(e)})
+            self.dead_sockets_pruned += 1
+            self.remove(connection)
+
+    def evict(self, connection: Connection):
+        log("EVICTING SLOW CONSUMER", {"bid_id": connection.bid_id, "queue_depth": connection.queue.qsize()})
+        self.slow_consumers_evicted += 1
+        self.remove(connection)
+        task = asyncio.create_task(self.close(connection))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def close(self, connection: Connection):
+        try:
+            # 1013: try again later, the client reconnects and resyncs from a snapshot
+            await asyncio.wait_for(connection.websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    async def send(self, websocket: WebSocket, bid_id: str, message: str):
+        # messages to a single client go through its queue too, so they stay in order with broadcasts
+        for connection in self.rooms.get(bid_id, []):
+            if connection.websocket is websocket:
+                if not connection.send(message):
+                    self.messages_dropped += 1
+                    self.evict(connection)
+                return
 
     async def broadcast(self, bid_id: str, message: str):
-        if bid_id in self.rooms:
-            for connection in self.rooms[bid_id]:
-                await connection.send_text(message)
+        # published once, the listener of every worker (this one included) fans it out locally
+        try:
+            await redis.publish(self.channel(bid_id), message)
+        except Exception as e:
+            log("SOCKET BACKPLANE PUBLISH FAILED", str(e))
+            self.fan_out(bid_id=bid_id, message=message)
+
+    def fan_out(self, bid_id: str, message: str):
+        # only enqueues, the writers deliver concurrently
+        for connection in list(self.rooms.get(bid_id, [])):
+            if not connection.send(message):
+                self.messages_dropped += 1
+                self.evict(connection)
+
+    def metrics(self) -> dict:
+        queue_depths = [connection.queue.qsize() for room in self.rooms.values() for connection in room]
+        return {
+            "rooms": len(self.rooms),
+            "connections": len(queue_depths),
+            "max_queue_depth": max(queue_depths, default=0),
+            "total_queue_depth": sum(queue_depths),
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "slow_consumers_evicted": self.slow_consumers_evicted,
+            "dead_sockets_pruned": self.dead_sockets_pruned
+        }
 
 manager = ConnectionManager()
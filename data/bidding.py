@@ -1,3 +1,5 @@
+from string import Template
+
 valid_load_status = ['draft', 'not_started', 'live', 'pending',
                      'partially_confirmed', 'confirmed', 'completed', 'cancelled']
 valid_rebid_status = ['not_started', 'pending',
@@ -23,37 +25,92 @@ assignment_events = {
                     }
 
 
-status_wise_fetch_query = """
+# Shipper feeds, one row per (bid, assigned transporter, fleet). The bids are filtered first, and
+# everything per bid (lanes, rate counts, settings, names) is aggregated once for those bids and
+# joined in, instead of being looked up with correlated subqueries for every row.
+bid_feed_query = """
+            WITH loads AS (
+                SELECT
+                    t_bidding_load.bl_id,
+                    t_bidding_load.bid_time,
+                    t_bidding_load.bid_end_time,
+                    t_bidding_load.bid_extended_time,
+                    t_bidding_load.reporting_from_time,
+                    t_bidding_load.reporting_to_time,
+                    t_bidding_load.bid_mode,
+                    t_bidding_load.bl_cancellation_reason,
+                    t_bidding_load.enable_tracking,
+                    t_bidding_load.no_of_fleets,
+                    t_bidding_load.fleet_type,
+                    t_bidding_load.rate_quote_type,
+                    t_bidding_load.completion_reason,
+                    t_bidding_load.show_current_lowest_rate_transporter,
+                    t_bidding_load.bl_shipper_id,
+                    t_bidding_load.bl_branch_id,
+                    t_bidding_load.updated_at,
+                    t_bidding_load.created_at
+                FROM t_bidding_load
+                WHERE
+                    t_bidding_load.is_active = true
+                    AND t_bidding_load.load_status = :load_status
+                    $filters
+            ),
+            lanes AS (
+                SELECT
+                    t_map_load_src_dest_pair.mlsdp_bidding_load_id AS bl_id,
+                    (array_agg(t_map_load_src_dest_pair.src_city) FILTER (WHERE t_map_load_src_dest_pair.is_prime = true))[1] AS src_city,
+                    (array_agg(t_map_load_src_dest_pair.dest_city) FILTER (WHERE t_map_load_src_dest_pair.is_prime = true))[1] AS dest_city,
+                    array_agg(t_map_load_src_dest_pair.src_city) AS src_cities,
+                    array_agg(t_map_load_src_dest_pair.src_street_address) AS src_street_addresses,
+                    array_agg(t_map_load_src_dest_pair.src_state) AS src_states,
+                    array_agg(t_map_load_src_dest_pair.dest_city) AS dest_cities,
+                    array_agg(t_map_load_src_dest_pair.dest_street_address) AS dest_street_addresses,
+                    array_agg(t_map_load_src_dest_pair.dest_state) AS dest_states
+                FROM t_map_load_src_dest_pair
+                JOIN loads ON loads.bl_id = t_map_load_src_dest_pair.mlsdp_bidding_load_id
+                WHERE t_map_load_src_dest_pair.is_active = true
+                GROUP BY t_map_load_src_dest_pair.mlsdp_bidding_load_id
+            ),
+            rates AS (
+                SELECT
+                    t_bid_transaction.bid_id AS bl_id,
+                    count(*) AS total_no_of_bids,
+                    count(DISTINCT t_bid_transaction.transporter_id) AS participants
+                FROM t_bid_transaction
+                JOIN loads ON loads.bl_id = t_bid_transaction.bid_id
+                WHERE t_bid_transaction.rate > 0
+                GROUP BY t_bid_transaction.bid_id
+            )
             SELECT
-                t_bidding_load.bl_id,
-                t_bidding_load.bid_time,
-                t_bidding_load.bid_end_time,
-                t_bidding_load.bid_extended_time,
-                t_bidding_load.reporting_from_time,
-                t_bidding_load.reporting_to_time,
-                t_bidding_load.bid_mode,
-                t_bidding_load.bl_cancellation_reason,
-                t_bidding_load.enable_tracking,
-                t_bidding_load.no_of_fleets,
-                t_bidding_load.fleet_type,
-                t_bidding_load.rate_quote_type,
-                t_bidding_load.completion_reason,
-                (select name from t_lkp_fleet where t_lkp_fleet.id = t_bidding_load.fleet_type) as fleet_name,
-                t_bidding_load.show_current_lowest_rate_transporter,
-                t_bidding_load.bl_shipper_id,
-                t_bidding_load.bl_branch_id,
-				t_bid_settings.enable_price_match,
-				t_bid_settings.price_match_duration,
-				(select name from t_shipper where t_shipper.shpr_id = t_bidding_load.bl_shipper_id) as shipper_name,
-                (select name from t_branch where t_branch.branch_id = t_bidding_load.bl_branch_id) as branch_name,
-                t_map_load_src_dest_pair.src_city,
-                t_map_load_src_dest_pair.dest_city,
-				(select array_agg(src_city) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_cities,
-                (select array_agg(src_street_address) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_street_addresses,
-                (select array_agg(src_state) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_states,
-				(select array_agg(dest_city) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_cities,
-                (select array_agg(dest_street_address) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_street_addresses,
-                (select array_agg(dest_state) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_states,
+                loads.bl_id,
+                loads.bid_time,
+                loads.bid_end_time,
+                loads.bid_extended_time,
+                loads.reporting_from_time,
+                loads.reporting_to_time,
+                loads.bid_mode,
+                loads.bl_cancellation_reason,
+                loads.enable_tracking,
+                loads.no_of_fleets,
+                loads.fleet_type,
+                loads.rate_quote_type,
+                loads.completion_reason,
+                t_lkp_fleet.name AS fleet_name,
+                loads.show_current_lowest_rate_transporter,
+                loads.bl_shipper_id,
+                loads.bl_branch_id,
+                settings.enable_price_match,
+                settings.price_match_duration,
+                t_shipper.name AS shipper_name,
+                t_branch.name AS branch_name,
+                lanes.src_city,
+                lanes.dest_city,
+                lanes.src_cities,
+                lanes.src_street_addresses,
+                lanes.src_states,
+                lanes.dest_cities,
+                lanes.dest_street_addresses,
+                lanes.dest_states,
                 t_load_assigned.la_transporter_id,
                 t_load_assigned.trans_pos_in_bid,
                 t_load_assigned.price,
@@ -66,134 +123,39 @@ status_wise_fetch_query = """
                 t_tracking_fleet.fleet_no,
                 t_tracking_fleet.src_addrs,
                 t_tracking_fleet.dest_addrs,
-                t_load_assigned.is_active as la_active,
-                t_transporter.is_active as tr_active,
-                t_tracking_fleet.is_active as trf_active,
-                (select count(*) from t_bid_transaction where t_bid_transaction.bid_id = t_bidding_load.bl_id and t_bid_transaction.rate > 0) as total_no_of_bids,
-				(select count(distinct(t_bid_transaction.transporter_id)) from t_bid_transaction where t_bid_transaction.bid_id = t_bidding_load.bl_id and t_bid_transaction.rate > 0) as participants
-            FROM t_bidding_load
-            LEFT JOIN t_bid_settings ON ( t_bid_settings.is_active = true AND t_bid_settings.bdsttng_shipper_id = t_bidding_load.bl_shipper_id
-                                            AND (
-                                                CASE
-                                                    WHEN t_bidding_load.bl_branch_id IS NULL THEN
-                                                        TRUE
-                                                        AND t_bid_settings.bdsttng_branch_id IS NULL 
-                                                    ELSE
-                                                        (
-                                                            t_bid_settings.bdsttng_branch_id = t_bidding_load.bl_branch_id
-                                                            OR (
-                                                                NOT EXISTS (
-                                                                    SELECT 1
-                                                                    FROM t_bid_settings bs
-                                                                    WHERE bs.bdsttng_branch_id = t_bidding_load.bl_branch_id
-                                                                    AND bs.bdsttng_shipper_id = t_bidding_load.bl_shipper_id
-                                                                    AND bs.is_active = true
-                                                                )
-                                                                AND t_bid_settings.bdsttng_branch_id IS NULL
-                                                            )
-                                                        )
-                                                END
-                                            )
-                                        )
-            LEFT JOIN t_load_assigned ON t_load_assigned.la_bidding_load_id = t_bidding_load.bl_id
+                t_load_assigned.is_active AS la_active,
+                t_transporter.is_active AS tr_active,
+                t_tracking_fleet.is_active AS trf_active,
+                COALESCE(rates.total_no_of_bids, 0) AS total_no_of_bids,
+                COALESCE(rates.participants, 0) AS participants
+            FROM loads
+            LEFT JOIN t_lkp_fleet ON t_lkp_fleet.id = loads.fleet_type
+            LEFT JOIN t_shipper ON t_shipper.shpr_id = loads.bl_shipper_id
+            LEFT JOIN t_branch ON t_branch.branch_id = loads.bl_branch_id
+            LEFT JOIN lanes ON lanes.bl_id = loads.bl_id
+            LEFT JOIN rates ON rates.bl_id = loads.bl_id
+            -- the branch's own settings if it has any, the shipper's otherwise
+            LEFT JOIN LATERAL (
+                SELECT t_bid_settings.enable_price_match, t_bid_settings.price_match_duration
+                FROM t_bid_settings
+                WHERE
+                    t_bid_settings.is_active = true
+                    AND t_bid_settings.bdsttng_shipper_id = loads.bl_shipper_id
+                    AND (t_bid_settings.bdsttng_branch_id IS NULL OR t_bid_settings.bdsttng_branch_id = loads.bl_branch_id)
+                ORDER BY t_bid_settings.bdsttng_branch_id IS NULL
+                LIMIT 1
+            ) settings ON true
+            LEFT JOIN t_load_assigned ON t_load_assigned.la_bidding_load_id = loads.bl_id
             LEFT JOIN t_transporter ON t_transporter.trnsp_id = t_load_assigned.la_transporter_id
-            LEFT JOIN t_map_load_src_dest_pair ON (t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true and t_map_load_src_dest_pair.is_prime=true)
             LEFT JOIN t_tracking_fleet ON (t_tracking_fleet.tf_transporter_id = t_load_assigned.la_transporter_id and t_tracking_fleet.tf_bidding_load_id = t_load_assigned.la_bidding_load_id and t_tracking_fleet.is_active = true)
-            WHERE
-                t_bidding_load.is_active = true
-                AND t_bidding_load.load_status = :load_status
             ORDER BY
-                COALESCE(t_bidding_load.updated_at, '1111-11-11 11:11:11.111') DESC, t_bidding_load.created_at DESC
+                COALESCE(loads.updated_at, '1111-11-11 11:11:11.111') DESC, loads.created_at DESC
                 """
 
+status_wise_fetch_query = Template(bid_feed_query).safe_substitute(filters="$shipper_id_filter")
 
-filter_wise_fetch_query = """
-            SELECT
-                t_bidding_load.bl_id,
-                t_bidding_load.bid_time,
-                t_bidding_load.bid_end_time,
-                t_bidding_load.bid_extended_time,
-                t_bidding_load.reporting_from_time,
-                t_bidding_load.reporting_to_time,
-                t_bidding_load.bid_mode,
-                t_bidding_load.bl_cancellation_reason,
-                t_bidding_load.enable_tracking,
-                t_bidding_load.no_of_fleets,
-                t_bidding_load.fleet_type,
-                t_bidding_load.rate_quote_type,
-                t_bidding_load.completion_reason,
-                (select name from t_lkp_fleet where t_lkp_fleet.id = t_bidding_load.fleet_type) as fleet_name,
-                t_bidding_load.show_current_lowest_rate_transporter,
-                t_bidding_load.bl_shipper_id,
-                t_bidding_load.bl_branch_id,
-				t_bid_settings.enable_price_match,
-				t_bid_settings.price_match_duration,
-				(select name from t_shipper where t_shipper.shpr_id = t_bidding_load.bl_shipper_id) as shipper_name,
-                (select name from t_branch where t_branch.branch_id = t_bidding_load.bl_branch_id) as branch_name,
-                t_map_load_src_dest_pair.src_city,
-                t_map_load_src_dest_pair.dest_city,
-				(select array_agg(src_city) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_cities,
-                (select array_agg(src_street_address) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_street_addresses,
-                (select array_agg(src_state) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as src_states,
-				(select array_agg(dest_city) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_cities,
-                (select array_agg(dest_street_address) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_street_addresses,
-                (select array_agg(dest_state) from t_map_load_src_dest_pair where t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true) as dest_states,
-                t_load_assigned.la_transporter_id,
-                t_load_assigned.trans_pos_in_bid,
-                t_load_assigned.price,
-                t_load_assigned.price_difference_percent,
-                t_load_assigned.no_of_fleets_assigned,
-                t_load_assigned.is_assigned,
-                t_transporter.name,
-                t_transporter.contact_no,
-                t_tracking_fleet.tf_id,
-                t_tracking_fleet.fleet_no,
-                t_tracking_fleet.src_addrs,
-                t_tracking_fleet.dest_addrs,
-                t_load_assigned.is_active as la_active,
-                t_transporter.is_active as tr_active,
-                t_tracking_fleet.is_active as trf_active,
-                (select count(*) from t_bid_transaction where t_bid_transaction.bid_id = t_bidding_load.bl_id and t_bid_transaction.rate > 0) as total_no_of_bids,
-				(select count(distinct(t_bid_transaction.transporter_id)) from t_bid_transaction where t_bid_transaction.bid_id = t_bidding_load.bl_id and t_bid_transaction.rate > 0) as participants
-            FROM t_bidding_load
-            LEFT JOIN t_bid_settings ON ( t_bid_settings.is_active = true AND t_bid_settings.bdsttng_shipper_id = t_bidding_load.bl_shipper_id
-                                            AND (
-                                                CASE
-                                                    WHEN t_bidding_load.bl_branch_id IS NULL THEN
-                                                        TRUE
-                                                        AND t_bid_settings.bdsttng_branch_id IS NULL 
-                                                    ELSE
-                                                        (
-                                                            t_bid_settings.bdsttng_branch_id = t_bidding_load.bl_branch_id
-                                                            OR (
-                                                                NOT EXISTS (
-                                                                    SELECT 1
-                                                                    FROM t_bid_settings bs
-                                                                    WHERE bs.bdsttng_branch_id = t_bidding_load.bl_branch_id
-                                                                    AND bs.bdsttng_shipper_id = t_bidding_load.bl_shipper_id
-                                                                    AND bs.is_active = true
-                                                                )
-                                                                AND t_bid_settings.bdsttng_branch_id IS NULL
-                                                            )
-                                                        )
-                                                END
-                                            )
-                                        )
-            LEFT JOIN t_load_assigned ON t_load_assigned.la_bidding_load_id = t_bidding_load.bl_id
-            LEFT JOIN t_transporter ON t_transporter.trnsp_id = t_load_assigned.la_transporter_id
-            LEFT JOIN t_map_load_src_dest_pair ON (t_map_load_src_dest_pair.mlsdp_bidding_load_id = t_bidding_load.bl_id and t_map_load_src_dest_pair.is_active=true and t_map_load_src_dest_pair.is_prime = true)
-            LEFT JOIN t_tracking_fleet ON (t_tracking_fleet.tf_transporter_id = t_load_assigned.la_transporter_id and t_tracking_fleet.tf_bidding_load_id = t_load_assigned.la_bidding_load_id and t_tracking_fleet.is_active = true)
-            WHERE
-                t_bidding_load.is_active = true
-                AND t_bidding_load.load_status = :load_status
-                $shipper_id_filter
-                $regioncluster_id_filter
-                $branch_id_filter
-                $from_date_filter
-                $to_date_filter
-            ORDER BY
-                COALESCE(t_bidding_load.updated_at, '1111-11-11 11:11:11.111') DESC, t_bidding_load.created_at DESC
-                ;"""
+filter_wise_fetch_query = Template(bid_feed_query).safe_substitute(
+    filters="$shipper_id_filter $regioncluster_id_filter $branch_id_filter $from_date_filter $to_date_filter")
 
 
 live_bid_details = '''
@@ -219,6 +181,85 @@ GROUP BY
     t_bid_transaction.created_at;
 '''
 
+lock_bid_for_rate_submission = '''
+SELECT bl_id FROM t_bidding_load WHERE bl_id = :bid_id AND is_active = true FOR NO KEY UPDATE
+'''
+
+rate_submission_context = '''
+SELECT
+    bl.bl_id,
+    bl.load_status,
+    bl.bid_time,
+    bl.bid_end_time,
+    bl.bid_mode,
+    bl.bl_shipper_id,
+    bl.show_current_lowest_rate_transporter,
+    bl.bid_price_decrement,
+    bl.is_decrement_in_percentage,
+    bl.no_of_tries,
+    (SELECT tt.name FROM t_transporter tt WHERE tt.trnsp_id = :transporter_id) AS transporter_name,
+    (SELECT MIN(bt.rate) FROM t_bid_transaction bt WHERE bt.bid_id = bl.bl_id AND bt.rate > 0) AS lowest_rate,
+    tb.attempts,
+    tb.transporter_lowest_rate,
+    tb.last_comment
+FROM t_bidding_load bl
+CROSS JOIN LATERAL (
+    SELECT
+        COUNT(*) AS attempts,
+        MIN(bt.rate) AS transporter_lowest_rate,
+        (ARRAY_AGG(bt.comment ORDER BY bt.created_at DESC) FILTER (WHERE bt.comment IS NOT NULL AND bt.comment <> ''))[1] AS last_comment
+    FROM t_bid_transaction bt
+    WHERE bt.bid_id = bl.bl_id AND bt.transporter_id = :transporter_id AND bt.rate > 0
+) tb
+WHERE bl.bl_id = :bid_id AND bl.is_active = true
+'''
+
+live_bid_state = '''
+SELECT DISTINCT ON (bt.transporter_id)
+    bt.transporter_id,
+    tt.name AS transporter_name,
+    bt.rate,
+    bt.comment,
+    bt.created_at,
+    COUNT(*) OVER (PARTITION BY bt.transporter_id) AS attempts
+FROM t_bid_transaction bt
+JOIN t_transporter tt ON tt.trnsp_id = bt.transporter_id
+WHERE bt.bid_id = :bid_id AND bt.rate > 0 AND bt.is_active = true
+ORDER BY bt.transporter_id, bt.rate ASC, bt.created_at ASC
+'''
+
+transporter_price_summary = '''
+WITH best AS (
+    SELECT DISTINCT ON (bt.bid_id, bt.transporter_id)
+        bt.bid_id,
+        bt.transporter_id,
+        bt.rate,
+        bt.created_at
+    FROM t_bid_transaction bt
+    WHERE bt.bid_id IN :bid_ids AND bt.rate > 0 AND bt.is_active = true
+    ORDER BY bt.bid_id, bt.transporter_id, bt.rate ASC, bt.created_at ASC
+),
+ranked AS (
+    SELECT
+        bid_id,
+        transporter_id,
+        rate,
+        MIN(rate) OVER (PARTITION BY bid_id) AS bid_lowest_price,
+        ROW_NUMBER() OVER (PARTITION BY bid_id ORDER BY rate ASC, created_at ASC) AS position
+    FROM best
+)
+SELECT
+    bl.bl_id AS bid_id,
+    bl.no_of_tries,
+    bl.show_current_lowest_rate_transporter,
+    (SELECT MIN(r.bid_lowest_price) FROM ranked r WHERE r.bid_id = bl.bl_id) AS bid_lowest_price,
+    tr.rate AS transporter_lowest_price,
+    tr.position
+FROM t_bidding_load bl
+LEFT JOIN ranked tr ON tr.bid_id = bl.bl_id AND tr.transporter_id = :transporter_id
+WHERE bl.bl_id IN :bid_ids
+'''
+
 lost_participated_transporter_bids = '''
 SELECT DISTINCT bt.bid_id
 FROM t_bid_transaction bt
@@ -1,7 +1,7 @@
 import os
 
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from jose import jwt
 from jose.exceptions import JWTError
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -29,13 +29,13 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     error_response = ErrorResponse(
                         data=[], dev_msg="Token not found!", client_msg=os.getenv("GENERIC_LOGIN_ERROR")
                     )
-                    return JSONResponse(content=error_response, status_code=401)
+                    return ORJSONResponse(content=error_response, status_code=401)
 
                 if not auth_header.startswith("Bearer"):
                     error_response = ErrorResponse(
                         data=[], dev_msg="Token is invalid because no Bearer!", client_msg=os.getenv("GENERIC_LOGIN_ERROR")
                     )
-                    return JSONResponse(content=error_response, status_code=401)
+                    return ORJSONResponse(content=error_response, status_code=401)
 
                 split_token = auth_header.split(" ")
 
@@ -43,7 +43,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     error_response = ErrorResponse(
                         data=[], dev_msg="Token is invalid because no token after Bearer!", client_msg=os.getenv("GENERIC_LOGIN_ERROR")
                     )
-                    return JSONResponse(content=error_response, status_code=401)
+                    return ORJSONResponse(content=error_response, status_code=401)
 
                 token = split_token[1]
 
@@ -53,7 +53,7 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     error_response = ErrorResponse(
                         data=[], dev_msg="Token not found/invalid!", client_msg=os.getenv("GENERIC_LOGIN_ERROR")
                     )
-                    return JSONResponse(content=error_response, status_code=401)
+                    return ORJSONResponse(content=error_response, status_code=401)
 
                 payload = jwt.decode(token=token, key=os.getenv("JWT_SECRET"), algorithms=[os.getenv("JWT_ALGORITHM")], 
                                      options={
@@ -67,19 +67,29 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     error_response = ErrorResponse(
                         data=[], dev_msg="User ID Invalid", client_msg=os.getenv("UNAUTHORIZED_ERR")
                     )
-                    return JSONResponse(content=error_response, status_code=403)
+                    return ORJSONResponse(content=error_response, status_code=403)
 
                 if request.url.path.startswith("/api/v1/shipper") and payload.get("user_type") not in valid_view_bids:
                     error_response = ErrorResponse(
                         data=[], dev_msg="User is not a shipper!", client_msg=os.getenv("UNAUTHORIZED_ERR")
                     )
-                    return JSONResponse(content=error_response, status_code=403)
+                    return ORJSONResponse(content=error_response, status_code=403)
 
                 if request.url.path.startswith("/api/v1/transporter") and payload.get("user_type") != trns:
                     error_response = ErrorResponse(
                         data=[], dev_msg="User is not a transporter!", client_msg=os.getenv("UNAUTHORIZED_ERR")
                     )
-                    return JSONResponse(content=error_response, status_code=403)
+                    return ORJSONResponse(content=error_response, status_code=403)
+
+                if request.url.path.startswith("/api/v1/admin"):
+                    # admin routes act on every user's data, so unlike the rest their token's signature is verified
+                    payload = jwt.decode(token=token, key=os.getenv("JWT_SECRET"), algorithms=[os.getenv("JWT_ALGORITHM")])
+
+                    if payload.get("user_type") != acu:
+                        error_response = ErrorResponse(
+                            data=[], dev_msg="User is not an aculead!", client_msg=os.getenv("UNAUTHORIZED_ERR")
+                        )
+                        return ORJSONResponse(content=error_response, status_code=403)
 
                 request.state.current_user = payload
 
@@ -90,11 +100,11 @@ class AuthMiddleware(BaseHTTPMiddleware):
             error_response = ErrorResponse(
                 data=[], dev_msg=str(jwt_error), client_msg="You could not be authenticated, please try again with correct credentials!"
             )
-            return JSONResponse(content=error_response, status_code=401)
+            return ORJSONResponse(content=error_response, status_code=401)
 
         except Exception as e:
             log("IN EXCEPT")
             error_response = ErrorResponse(
                 data=[], dev_msg=str(e), client_msg="You could not be authenticated, please try again with correct credentials!"
             )
-            return JSONResponse(content=error_response, status_code=401)
+            return ORJSONResponse(content=error_response, status_code=401)
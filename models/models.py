@@ -1,5 +1,5 @@
 from sqlalchemy import (JSON, BigInteger, Boolean, Column, DateTime, Double,
-                        Enum, ForeignKey, Integer, String, text)
+                        Enum, ForeignKey, Index, Integer, String, text)
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.orm import relationship
 
@@ -347,6 +347,46 @@ class LoadAssigned(Base, Persistance):
     history = Column(String, nullable=True)
 
 
+class AssignmentEvent(Base, Persistance):
+    __tablename__ = "t_assignment_event"
+    __table_args__ = (
+        Index("ix_assignment_event_bid_transporter_time", "ae_bidding_load_id", "ae_transporter_id", "event_time"),
+    )
+
+    ae_id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"), nullable=False)
+    ae_bidding_load_id = Column(UUID(as_uuid=True), ForeignKey("t_bidding_load.bl_id"), nullable=False)
+    ae_transporter_id = Column(UUID(as_uuid=True), ForeignKey("t_transporter.trnsp_id"), nullable=False)
+    event = Column(String, nullable=False)
+    # rate for price match events, number of vehicles for assignment events
+    value = Column(Double, nullable=True)
+    reason = Column(String, nullable=True)
+    event_time = Column(DateTime, nullable=False)
+
+
+class NotificationOutbox(Base, Persistance):
+    __tablename__ = "t_notification_outbox"
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "next_attempt_at", postgresql_where=text("status IN ('pending', 'sending')")),
+    )
+
+    no_id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"), nullable=False)
+    no_bidding_load_id = Column(UUID(as_uuid=True), ForeignKey("t_bidding_load.bl_id"), nullable=True)
+    # who receives it is resolved when it is sent: bid_kams, transporter_kams or shipper_users
+    audience = Column(String, nullable=False)
+    transporter_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=True)
+    message = Column(String, nullable=False)
+    type = Column(String, nullable=True)
+    deep_link = Column(String, nullable=False)
+    dedupe_key = Column(String, nullable=True, unique=True)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    # last receiver reached by a chunked fan-out, a retry resumes after it
+    fanout_cursor = Column(String, nullable=True)
+
+
 class Notification(Base, Persistance):
     __tablename__ = "t_notification"
 
@@ -0,0 +1,60 @@
+import os
+
+from fastapi import APIRouter, Request
+
+from schemas.bidding import EligibilityInvalidationReq, HistoryBackfillReq
+from utils.bids.backfill import history_backfill
+from utils.bids.eligibility import Eligibility
+from utils.response import ErrorResponse, ServerError, SuccessResponse
+
+# only reachable with a signed Aculead token, see AuthMiddleware
+admin_router = APIRouter(prefix="/admin", tags=["Admin routes"])
+
+eligibility = Eligibility()
+
+
+@admin_router.post("/eligibility/invalidate")
+async def invalidate_eligibility(request: Request, req: EligibilityInvalidationReq):
+
+    # called when shipper, segment, blacklist or branch mappings change
+    try:
+        (invalidated, error) = await eligibility.invalidate(transporter_ids=req.transporter_ids, user_ids=req.user_ids)
+
+        if error:
+            return ErrorResponse(data=[], client_msg=os.getenv("GENERIC_ERROR"), dev_msg=error)
+
+        return SuccessResponse(data=invalidated, client_msg="Eligibility invalidated successfully", dev_msg=f"{invalidated} cached eligibilities invalidated")
+
+    except Exception as err:
+        return ServerError(err=err, errMsg=str(err))
+
+
+@admin_router.post("/backfill/assignment-history")
+async def backfill_assignment_history(request: Request, req: HistoryBackfillReq):
+
+    # runs in the background in batches, resumes from its checkpoint when started again
+    try:
+        (started, error) = await history_backfill.start(batch_size=req.batch_size, dry_run=req.dry_run, max_batches=req.max_batches, restart=req.restart)
+
+        if not started:
+            return ErrorResponse(data=[], client_msg="Assignment history backfill could not be started", dev_msg=error)
+
+        return SuccessResponse(data={"dry_run": req.dry_run, "batch_size": req.batch_size}, client_msg="Assignment history backfill started", dev_msg="Assignment history backfill started")
+
+    except Exception as err:
+        return ServerError(err=err, errMsg=str(err))
+
+
+@admin_router.get("/backfill/assignment-history")
+async def backfill_assignment_history_progress(request: Request, dry_run: bool = False):
+
+    try:
+        (progress, error) = await history_backfill.progress(dry_run=dry_run)
+
+        if error:
+            return ErrorResponse(data=[], client_msg=os.getenv("GENERIC_ERROR"), dev_msg=error)
+
+        return SuccessResponse(data=progress, client_msg="Assignment history backfill progress fetched", dev_msg="Assignment history backfill progress fetched")
+
+    except Exception as err:
+        return ServerError(err=err, errMsg=str(err))
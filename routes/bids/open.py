@@ -1,10 +1,9 @@
 from fastapi import APIRouter, Request
-import pytz, os,  ast
+import pytz, os
 from datetime import datetime, timedelta
-from config.db_config import Session
 
-from models.models import LoadAssigned
 from utils.bids.bidding import Bid
+from utils.bids.lifecycle import lifecycle
 from utils.response import ErrorResponse, ServerError, SuccessResponse
 
 open_router = APIRouter(prefix="", tags=["Open routes"])
@@ -44,39 +43,9 @@ async def increment_time_of_bid(bid_id: str):
         if not bid_end_time_updated:
             return ErrorResponse(data=bid_id, client_msg="Something Went Wrong While Incrementing Bid Time", dev_msg=error)
 
-        return SuccessResponse(data=bid_id, client_msg="Bid End Time Updated Successfully!", dev_msg="Bid end time was updated successfully!")
-
-    except Exception as err:
-        return ServerError(err=err, errMsg=str(err))
+        await lifecycle.request(bid_id=bid_id, fire_at=extended_bid_end_time, transition="close")
 
-
-@open_router.get("/change")
-async def change():
-
-    session = Session()
-    
-    try:
-        all = session.query(LoadAssigned).filter(LoadAssigned.history != None).all()
-        print("ALL : ", all)
-        
-        for each in all :
-            event_list = []
-            assignment_history = ast.literal_eval(each.history)
-            for event in assignment_history:
-                (resource, created_at, unassignment_reason) = event
-                event = list(event)
-                print("RESOURCE :", resource)
-                print("CREATED AT :", created_at)
-                print("EVENT LIST :", list(event))
-                if resource == 0:
-                    event.insert(0, "Unassigned")
-                else:
-                    event.insert(0, "Assigned With")
-                event_list.append(tuple(event))
-            each.history = str(event_list)
-            print("EACH HISTORY ::", each.history)
-        session.commit()
-        session.close()
+        return SuccessResponse(data=bid_id, client_msg="Bid End Time Updated Successfully!", dev_msg="Bid end time was updated successfully!")
 
     except Exception as err:
         return ServerError(err=err, errMsg=str(err))
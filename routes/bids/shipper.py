@@ -16,13 +16,13 @@ from schemas.bidding import (CancelBidReq, FilterBidsRequest,
                              TransporterUnassignRequest, AssignmentHistoryReq)
 from services.mail import Email
 from utils.bids.bidding import Bid
+from utils.bids.lifecycle import lifecycle
 from utils.bids.shipper import Shipper
 from utils.bids.transporters import Transporter
 from utils.redis import Redis
 from utils.response import (ErrorResponse, ServerError,
                             SuccessNoContentResponse, SuccessResponse)
 from utils.utilities import log
-from utils.notification_service_manager import notification_service_manager, NotificationServiceManagerReq
 
 shipper_bidding_router: APIRouter = APIRouter(
     prefix="/shipper/bid", tags=["Shipper routes for bidding"])
@@ -51,11 +51,11 @@ async def initiate_and_close_bid(request: Request):
             shipper_id = userdata["shipper_id"]
             log("SHIPPER ID ", shipper_id)
             
-        initiation_response = bid.initiate(shipper_id= shipper_id)
+        initiation_response = await bid.initiate(shipper_id= shipper_id)
 
         log("BID INITIATION RESPONSE ", initiation_response)
 
-        expulsion_response = bid.close(shipper_id= shipper_id)
+        expulsion_response = await bid.close(shipper_id= shipper_id)
 
         log("BID CLOSING RESPONSE ", expulsion_response)
         
@@ -113,7 +113,6 @@ async def get_bids_according_to_filter_criteria(request: Request, status: str, f
 async def publish_new_bid(request: Request, bid_id: str, bg_tasks: BackgroundTasks):
 
     user_id = request.state.current_user["id"]
-    authtoken = request.headers.get("authorization", "")
 
     try:
         ist_timezone = pytz.timezone("Asia/Kolkata")
@@ -134,33 +133,19 @@ async def publish_new_bid(request: Request, bid_id: str, bg_tasks: BackgroundTas
         if current_time > bid_details.bid_time:
             return ErrorResponse(data=[], client_msg=f"Bid Time was {bid_details.bid_time.replace(second =0, microsecond =0)}. Bid could not be published Anymore.", dev_msg="Already Crossed Bid Time. Bid Couldnot be published.")
 
-        (update_successful, error) = await bid.update_status(bid_id=bid_id, status="not_started" if bid_details.bid_mode != "indent" else "confirmed", user_id=user_id)
+        (update_successful, error) = await bid.update_status(bid_id=bid_id, status="not_started" if bid_details.bid_mode != "indent" else "confirmed", user_id=user_id,
+                                                             notification={"audience": "bid_kams",
+                                                                           "text": f"Bid L-{bid_id[-5:].upper()} has been published! HURRY & BID NOW !!!",
+                                                                           "type": "Bid Publish",
+                                                                           "deep_link": "transporter_dashboard_upcoming",
+                                                                           "dedupe_key": f"bid-publish:{bid_id}"})
 
         if not update_successful:
             return ErrorResponse(data=bid_id, client_msg=os.getenv("BID_PUBLISH_ERROR"), dev_msg=error)
 
-        # (success, error)= await transporter.notify(bid_id=bid_id, authtoken=request.headers.get("authorization", ""))
-        # if not success:
-        #     return ErrorResponse(data=[], dev_msg=error)
-        
-        (bid_related_kam, error) = await bid.transporter_kams(bid_id=bid_details.bl_id, bid_mode=bid_details.bid_mode, shipper_id=bid_details.bl_shipper_id, segment_id=bid_details.bl_segment_id ,indent_transporter_id=bid_details.indent_transporter_id)
-        
-        if error:
-            return ErrorResponse(data=[], dev_msg=error)
-        
-        log("::: BID RELATED KAM ::: ", bid_related_kam)
-        
-        (notification_response_success, error) = await notification_service_manager(authtoken=authtoken, req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": bid_related_kam,
-                                                                                                                                                "text":f"Bid L-{bid_id[-5:].upper()} has been published! HURRY & BID NOW !!!",
-                                                                                                                                                "type":"Bid Publish",
-                                                                                                                                                "deep_link":"transporter_dashboard_upcoming"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                    )
-        
-        if error:
-            log("::: NOTIFICATION ERROR DURING BID PUBLISH ::: ",error)
+        if bid_details.bid_mode != "indent":
+            # scheduled right away, a bid starting before the next refill would otherwise go live late
+            await lifecycle.request(bid_id=bid_id, fire_at=bid_details.bid_time, transition="initiate")
 
         return SuccessResponse(data=bid_id, client_msg=f"Bid  L-{bid_id[-5:].upper()} is now published!", dev_msg="Bid status was updated successfully!")
 
@@ -173,16 +158,12 @@ async def get_lowest_price_of_current_bid(request: Request, bid_id: str):
 
     try:
 
-        (lowest_price, error) = await redis.get_first(bid_id)
+        (lowest_price, error) = await bid.lowest_price(bid_id)
 
         if error:
+            return ErrorResponse(data=[], client_msg="Something went wrong while fetching the lowest price for this bid", dev_msg=error)
 
-            (lowest_price, error) = await bid.lowest_price(bid_id)
-
-            if error:
-                return ErrorResponse(data=[], client_msg="Something went wrong while fetching the lowest price for this bid", dev_msg=error)
-
-        return SuccessResponse(data=lowest_price, dev_msg="Lowest price found for current bid", client_msg=f"Fetched lowest price for Bid  L-{bid_id[-5:].upper()}!")
+        return SuccessResponse(data=lowest_price if lowest_price != float("inf") else None, dev_msg="Lowest price found for current bid", client_msg=f"Fetched lowest price for Bid  L-{bid_id[-5:].upper()}!")
 
     except Exception as err:
         return ServerError(err=err, errMsg=str(err))
@@ -236,32 +217,17 @@ async def cancel_bid(request: Request, bid_id: str, r: CancelBidReq):
             return ErrorResponse(data=[], client_msg="This bid is not valid and cannot be cancelled!", dev_msg=f"Bid  L-{bid_id[-5:].upper()} is {bid_details.load_status}, cannot be cancelled!")
 
         log("BID STATUS IS VALID")
-        (update_successful, error) = await bid.update_status(bid_id=bid_id, status="cancelled", user_id=user_id, reason=r.reason)
+        (update_successful, error) = await bid.update_status(bid_id=bid_id, status="cancelled", user_id=user_id, reason=r.reason,
+                                                             notification={"audience": "bid_kams",
+                                                                           "text": f"Bid L-{bid_id[-5:].upper()} has been Cancelled. SORRY for the INCONVENIENCE",
+                                                                           "type": "Bid Cancellation",
+                                                                           "deep_link": "transporter_dashboard_upcoming",
+                                                                           "dedupe_key": f"bid-cancel:{bid_id}"})
 
         if not update_successful:
             return ErrorResponse(data=[], client_msg=os.getenv("BID_CANCEL_ERROR"), dev_msg=error)
         log("BID STATUS IS NOW CANCELLED")
-        
-        (bid_related_kam, error) = await bid.transporter_kams(bid_id=bid_id, bid_mode=bid_details.bid_mode, shipper_id=bid_details.bl_shipper_id, segment_id=bid_details.bl_segment_id ,indent_transporter_id=bid_details.indent_transporter_id)
-        
-        if error:
-            return ErrorResponse(data=[], dev_msg=error)
-        
-        log("::: BID RELATED KAM ::: ", bid_related_kam)
-        
-        (notification_response_success, error) = await notification_service_manager(authtoken=request.headers.get("authorization", ""), req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": bid_related_kam,
-                                                                                                                                                "text":f"Bid L-{bid_id[-5:].upper()} has been Cancelled. SORRY for the INCONVENIENCE",
-                                                                                                                                                "type":"Bid Cancellation",
-                                                                                                                                                "deep_link":"transporter_dashboard_upcoming"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                    )
-        
-        if error:
-            log("::: NOTIFICATION ERROR DURING BID PUBLISH ::: ",error)
 
-        
         return SuccessNoContentResponse(dev_msg="Bid cancelled successfully", client_msg="Your Bid is Successfully Cancelled")
 
     except Exception as err:
@@ -308,7 +274,7 @@ async def assign_to_transporter(request: Request, bid_id: str, transporters: Lis
         if len(transporters) > 1:
             load_split = True
 
-        (assigned_loads, error) = await bid.assign(bid_id=bid_id, transporters=transporters, split=load_split, status=load_status, user_id=user_id, authtoken=request.headers.get("authorization", ""))
+        (assigned_loads, error) = await bid.assign(bid_id=bid_id, transporters=transporters, split=load_split, status=load_status, user_id=user_id)
 
         if error:
             return ErrorResponse(data=[], client_msg="Something Went Wrong While Assigning Transporters", dev_msg=error)
@@ -347,8 +313,6 @@ async def live_bid_details(request: Request, bid_id: str):
 
     # user_id =  request.state.current_user["id"]
 
-    res_array = []
-
     try:
 
         (valid_bid_id, error) = await bid.is_valid(bid_id=bid_id)
@@ -356,32 +320,18 @@ async def live_bid_details(request: Request, bid_id: str):
         if not valid_bid_id:
             return ErrorResponse(data=[], client_msg=os.getenv("INVALID_BID_ERROR"), dev_msg=error)
 
-        (bid_details, error) = await redis.bid_details(sorted_set=bid_id)
+        (_, error) = await redis.warm(bid_id=bid_id)
+
+        if not error:
+            (bid_details, error) = await redis.bid_details(sorted_set=bid_id)
+        else:
+            # bids that are not live have no live state
+            log("FETCHING LIVE BID DETAILS FROM DB", error)
+            (bid_details, error) = await bid.leaderboard(bid_id=bid_id)
 
         if error:
             return ErrorResponse(data=[], client_msg=os.getenv("GENERIC_ERROR"), dev_msg=error)
 
-        if not bid_details:
-
-            log("FETCHING LIVE BID FROM DATABASE")
-
-            (bid_details, error) = await bid.live_details(bid_id)
-
-            if error:
-                return ErrorResponse(data=[], client_msg=os.getenv("GENERIC_ERROR"), dev_msg=error)
-
-            for bid_detail in bid_details:
-
-                transporter_rate_details = bid_detail._mapping
-                log("TRANSPORTER DETAILS : ", transporter_rate_details)
-
-                res_array.append(transporter_rate_details)
-
-                await redis.update(sorted_set=bid_id, transporter_name=transporter_rate_details["transporter_name"], transporter_id=str(transporter_rate_details["transporter_id"]),
-                                   comment=transporter_rate_details["comment"], rate=transporter_rate_details["rate"], attempts=transporter_rate_details["attempts"])
-
-            return SuccessResponse(data=res_array, client_msg="Live Bid Details fetched Successfully!", dev_msg="Live Bid Details fetched Successfully")
-
         return SuccessResponse(data=bid_details, client_msg="Live Bid Details fetched Successfully!", dev_msg="Live Bid Details fetched Successfully")
 
     except Exception as err:
@@ -428,28 +378,6 @@ async def bid_match_for_transporters(request: Request, bid_id: str, transporters
 
         # ## Send email as a background task
         # bg_tasks.add_task(fm.send_message,message)
-        
-        transporter_ids = [transporter.transporter_id for transporter in transporters]
-        
-        (bid_related_kam, error) = await bid.transporter_kams(transporter_ids=transporter_ids)
-        
-        if error:
-            return ErrorResponse(data=[], dev_msg=error)
-        
-        log("::: BID RELATED KAM ::: ", bid_related_kam)
-        
-        (notification_response_success, error) = await notification_service_manager(authtoken=request.headers.get("authorization", ""), req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": bid_related_kam,
-                                                                                                                                                "text":f"Bid L-{bid_id[-5:].upper()} has asked for a Price Match" if user_type != "acu" else f"The Price for Bid L-{bid_id[-5:].upper()} has been Negotiated" ,
-                                                                                                                                                "type":"Bid match and Negotiation",
-                                                                                                                                                "deep_link":"transporter_dashboard_pending"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                    )
-        
-        if error:
-            log("::: NOTIFICATION ERROR DURING BID PUBLISH ::: ",error)
-
 
         return SuccessResponse(data=assignment_details, client_msg="Successfully Requested Bid Match" if user_type != "acu" else "Successfully Bid Matched", dev_msg="Bid Match Request Successful")
 
@@ -460,7 +388,7 @@ async def bid_match_for_transporters(request: Request, bid_id: str, transporters
 @shipper_bidding_router.post("/unassign/{bid_id}")
 async def unassign_transporter_for_bid(request: Request, bid_id: str, tr: TransporterUnassignRequest):
 
-    # user_id =  request.state.current_user["id"]
+    user_id =  request.state.current_user["id"]
 
     try:
 
@@ -469,7 +397,7 @@ async def unassign_transporter_for_bid(request: Request, bid_id: str, tr: Transp
         if not valid_bid_id:
             return ErrorResponse(data=[], client_msg=os.getenv("INVALID_BID_ERROR"), dev_msg=error)
 
-        (unassigned_transporter, error) = await transporter.unassign(bid_id=bid_id, transporter_request=tr, authtoken=request.headers.get("authorization", ""))
+        (unassigned_transporter, error) = await transporter.unassign(bid_id=bid_id, transporter_request=tr, user_id=user_id)
 
         if error:
             return ErrorResponse(data=[], client_msg=os.getenv("INVALID_BID_ERROR"), dev_msg=error)
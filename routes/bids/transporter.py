@@ -1,4 +1,4 @@
-import json
+import orjson
 import os
 import pytz
 from datetime import datetime
@@ -8,6 +8,7 @@ from config.socket import manager
 from data.bidding import valid_bid_status, valid_transporter_status
 from schemas.bidding import TransporterBidReq, TransporterLostBidsReq, TransporterBidMatchApproval
 from utils.bids.bidding import Bid
+from utils.bids.rates import Rate
 from utils.bids.shipper import Shipper
 from utils.bids.transporters import Transporter
 from utils.redis import Redis
@@ -19,6 +20,7 @@ transporter_bidding_router: APIRouter = APIRouter(
 
 transporter = Transporter()
 bid = Bid()
+rate = Rate()
 shipper = Shipper()
 redis = Redis()
 
@@ -56,160 +58,49 @@ async def fetch_bids_for_transporter_by_status(request: Request, participated: b
         updated_bids = None
         log("STATUS ", status)
         if status != "assigned":
-            updated_private_bids = []
-            updated_public_bids = []
-
-            if status == "not_started":
-                (bids_participated, error) = await transporter.participated_bids(transporter_id=transporter_id)
-
-                filtered_private_bids = [
-                    private_record for private_record in bids["private"]
-                    if not any(participated_bid["bid_id"] == private_record["bid_id"] and participated_bid["load_status"] == "not_started" for participated_bid in bids_participated)
-                ]
-
-                filtered_public_bids = [
-                    public_record for public_record in bids["public"]
-                    if not any(participated_bid["bid_id"] == public_record["bid_id"] and participated_bid["load_status"] == "not_started" for participated_bid in bids_participated)
-                ]
-
-                bids["private"] = filtered_private_bids
-                bids["public"] = filtered_public_bids
-
-                
-                (participated_shipper_of_bids, error) = await transporter.participated_bids_shipper(transporter_id= transporter_id)
-                if error :
-                    return ErrorResponse(data=[], dev_msg=error)
+            (participation, error) = await transporter.participated_bids(transporter_id=transporter_id)
+            if error:
+                return ErrorResponse(data=[], dev_msg=error, client_msg=os.getenv("GENERIC_ERROR"))
 
-                private_bids_with_participated_shipper = [{**private_bid, "participated_for_shipper": 1} if private_bid["shipper_id"] in participated_shipper_of_bids 
-                                                            else {**private_bid, "participated_for_shipper": 0} for private_bid in bids["private"]]
+            participated_bids = participation["bids"]
 
-                public_bids_with_participated_shipper = [{**public_bid, "participated_for_shipper": 1} if public_bid["shipper_id"] in participated_shipper_of_bids 
-                                                            else {**public_bid, "participated_for_shipper": 0} for public_bid in bids["public"]]
+            def participated_in(record: dict, statuses: list) -> bool:
+                return participated_bids.get(str(record["bid_id"])) in statuses
 
-                bids["private"] = private_bids_with_participated_shipper
-                bids["public"] = public_bids_with_participated_shipper
+            def with_participated_shipper(records: list) -> list:
+                return [{**record, "participated_for_shipper": 1 if record["shipper_id"] in participation["shippers"] else 0} for record in records]
 
+            if status == "not_started":
+                bids["private"] = with_participated_shipper([private_record for private_record in bids["private"] if not participated_in(private_record, ["not_started"])])
+                bids["public"] = with_participated_shipper([public_record for public_record in bids["public"] if not participated_in(public_record, ["not_started"])])
 
             elif status == "active":
-                (bids_participated, error) = await transporter.participated_bids(transporter_id=transporter_id)
-
-                filtered_private_bids = [
-                    private_record for private_record in bids["private"]
-                    if any(participated_bid["bid_id"] == private_record["bid_id"] and participated_bid["load_status"] == "not_started" for participated_bid in bids_participated)
-                ]
-
-                filtered_public_bids = [
-                    public_record for public_record in bids["public"]
-                    if any(participated_bid["bid_id"] == public_record["bid_id"] and participated_bid["load_status"] == "not_started" for participated_bid in bids_participated)
-                ]
-
-                bids["private"] = filtered_private_bids
-                bids["public"] = filtered_public_bids
+                bids["private"] = [private_record for private_record in bids["private"] if participated_in(private_record, ["not_started"])]
+                bids["public"] = [public_record for public_record in bids["public"] if participated_in(public_record, ["not_started"])]
                 log("BIDS PUBLIC :", bids["public"])
-                
-                # (participated_shipper_of_bids, error) = await transporter.participated_bids_shipper(transporter_id= transporter_id)
-                # if error :
-                #     return ErrorResponse(data=[], dev_msg=error)
-
-                # private_bids_with_participated_shipper = [{**private_bid, "participated_for_shipper": 1} if private_bid["shipper_id"] in participated_shipper_of_bids 
-                #                                             else {**private_bid, "participated_for_shipper": 0} for private_bid in bids["private"]]
-
-                # public_bids_with_participated_shipper = [{**public_bid, "participated_for_shipper": 1} if public_bid["shipper_id"] in participated_shipper_of_bids 
-                #                                             else {**public_bid, "participated_for_shipper": 0} for public_bid in bids["public"]]
-
-                # bids["private"] = private_bids_with_participated_shipper
-                # bids["public"] = public_bids_with_participated_shipper
-
 
             elif status == "live":
-                (bids_participated, error) = await transporter.participated_bids(transporter_id=transporter_id)
-
                 if participated:
-
-                    filtered_private_bids = [
-                        private_record for private_record in bids["private"]
-                        if any(participated_bid["bid_id"] == private_record["bid_id"] and participated_bid["load_status"] == "live" for participated_bid in bids_participated)
-                    ]
-
-                    filtered_public_bids = [
-                        public_record for public_record in bids["public"]
-                        if any(participated_bid["bid_id"] == public_record["bid_id"] and participated_bid["load_status"] == "live" for participated_bid in bids_participated)
-                    ]
-
-                    bids["private"] = filtered_private_bids
-                    bids["public"] = filtered_public_bids
+                    bids["private"] = [private_record for private_record in bids["private"] if participated_in(private_record, ["live"])]
+                    bids["public"] = [public_record for public_record in bids["public"] if participated_in(public_record, ["live"])]
 
                 else:
-
-                    filtered_private_bids = [
-                        private_record for private_record in bids["private"]
-                        if not any(participated_bid["bid_id"] == private_record["bid_id"] and participated_bid["load_status"] == "live" for participated_bid in bids_participated)
-                    ]
-
-                    filtered_public_bids = [
-                        public_record for public_record in bids["public"]
-                        if not any(participated_bid["bid_id"] == public_record["bid_id"] and participated_bid["load_status"] == "live" for participated_bid in bids_participated)
-                    ]
-
-                    bids["private"] = filtered_private_bids
-                    bids["public"] = filtered_public_bids
-                    
-                    (participated_shipper_of_private_bids, error) = await transporter.participated_bids_shipper(transporter_id= transporter_id)
-                    if error :
-                        return ErrorResponse(data=[], dev_msg=error)
-                    
-                    (participated_shipper_of_public_bids, error) = await transporter.participated_bids_shipper(transporter_id= transporter_id)
-                    if error :
-                        return ErrorResponse(data=[], dev_msg=error)
-
-                    private_bids_with_participated_shipper = [{**private_bid, "participated_for_shipper": 1} if private_bid["shipper_id"] in participated_shipper_of_private_bids 
-                                                                else {**private_bid, "participated_for_shipper": 0} for private_bid in bids["private"]]
-
-                    public_bids_with_participated_shipper = [{**public_bid, "participated_for_shipper": 1} if public_bid["shipper_id"] in participated_shipper_of_public_bids 
-                                                                else {**public_bid, "participated_for_shipper": 0} for public_bid in bids["public"]]
-
-                    bids["private"] = private_bids_with_participated_shipper
-                    bids["public"] = public_bids_with_participated_shipper
-                    
+                    bids["private"] = with_participated_shipper([private_record for private_record in bids["private"] if not participated_in(private_record, ["live"])])
+                    bids["public"] = with_participated_shipper([public_record for public_record in bids["public"] if not participated_in(public_record, ["live"])])
                     log("BIDS PUBLIC :", bids["public"])
 
-
             elif status == "pending":
-                (bids_participated, error) = await transporter.participated_bids(transporter_id=transporter_id)
+                bids["private"] = [private_record for private_record in bids["private"] if participated_in(private_record, ["pending", "partially_confirmed"])]
+                bids["public"] = [public_record for public_record in bids["public"] if participated_in(public_record, ["pending", "partially_confirmed"])]
 
-                filtered_private_bids = [
-                    private_record for private_record in bids["private"]
-                    if any(participated_bid["bid_id"] == private_record["bid_id"] and participated_bid["load_status"] in ["pending", "partially_confirmed"] for participated_bid in bids_participated)
-                ]
 
-                filtered_public_bids = [
-                    public_record for public_record in bids["public"]
-                    if any(participated_bid["bid_id"] == public_record["bid_id"] and participated_bid["load_status"] in ["pending", "partially_confirmed"] for participated_bid in bids_participated)
-                ]
-
-                bids["private"] = filtered_private_bids
-                bids["public"] = filtered_public_bids
-
-
-            for private_bid in bids["private"]:
-
-                lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=private_bid["bid_id"])
-                if lowest_price_response["data"] == []:
-                    return lowest_price_response
-
-                lowest_price_data = lowest_price_response["data"]
-                updated_private_bids.append(
-                    {**private_bid, **lowest_price_data})
-                
-
-            for public_bid in bids["public"]:
-
-                lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=public_bid["bid_id"])
-                if lowest_price_response["data"] == []:
-                    return lowest_price_response
+            (updated_private_bids, error) = await with_price_summary(bids=bids["private"], transporter_id=transporter_id)
+            if error:
+                return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
-                lowest_price_data = lowest_price_response["data"]
-                updated_public_bids.append({**public_bid, **lowest_price_data})
+            (updated_public_bids, error) = await with_price_summary(bids=bids["public"], transporter_id=transporter_id)
+            if error:
+                return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
             private_bids_with_assigned_load_details = []
             public_bids_with_assigned_load_details = []
@@ -242,15 +133,9 @@ async def fetch_bids_for_transporter_by_status(request: Request, participated: b
 
         else:
 
-            updated_bids_with_lowest_price = []
-            for each_bid in bids:
-
-                lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=each_bid["bid_id"])
-                if lowest_price_response["data"] == []:
-                    return lowest_price_response
-
-                lowest_price_data = lowest_price_response["data"]
-                updated_bids_with_lowest_price.append({**each_bid, **lowest_price_data})
+            (updated_bids_with_lowest_price, error) = await with_price_summary(bids=bids, transporter_id=transporter_id)
+            if error:
+                return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
             updated_bids = []
 
@@ -287,15 +172,9 @@ async def fetch_selected_bids(request: Request):
         if not bids:
             return SuccessResponse(data=[], client_msg="You have not been selected in any bids yet", dev_msg="Not selected in any bids")
 
-        updated_bids_with_lowest_price = []
-        for each_bid in bids:
-
-            lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=each_bid["bid_id"])
-            if lowest_price_response["data"] == []:
-                return lowest_price_response
-
-            lowest_price_data = lowest_price_response["data"]
-            updated_bids_with_lowest_price.append({**each_bid, **lowest_price_data})
+        (updated_bids_with_lowest_price, error) = await with_price_summary(bids=bids, transporter_id=transporter_id)
+        if error:
+            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
         
         updated_bids = []
@@ -334,20 +213,17 @@ async def fetch_completed_bids(request: Request):
         if not bids:
             return SuccessResponse(data=[], client_msg="You dont have any completed bids yet", dev_msg="Not completed any bids")
 
+        (bids_with_lowest_price, error) = await with_price_summary(bids=bids, transporter_id=transporter_id)
+        if error:
+            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
+
         private_bids = []
         public_bids = []
-        for each_bid in bids:
-
-            lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=each_bid["bid_id"])
-            if lowest_price_response["data"] == []:
-                return lowest_price_response
-
-            lowest_price_data = lowest_price_response["data"]
-            
+        for each_bid in bids_with_lowest_price:
             if each_bid["bid_mode"] == "private_pool":
-                private_bids.append({**each_bid, **lowest_price_data})
+                private_bids.append(each_bid)
             else:
-                public_bids.append({**each_bid, **lowest_price_data})
+                public_bids.append(each_bid)
 
         
         private_bids_with_assigned_load_details = []
@@ -403,97 +279,51 @@ async def provide_new_rate_for_bid(request: Request, bid_id: str, bid_req: Trans
 
         log("BID REQUEST DETAILS", bid_req)
 
-        (valid_bid_id, error) = await bid.is_valid(bid_id)
-
-        log("BID IS VALID", bid_id)
-
-        if not valid_bid_id:
-            return ErrorResponse(data=bid_id, client_msg=os.getenv("NOT_FOUND_ERROR"), dev_msg=error)
-
-        (error, bid_details) = await bid.details(bid_id)
-
-        if not bid_details:
-            return ErrorResponse(data=[], client_msg=os.getenv("BID_RATE_ERROR"), dev_msg=error)
-        log("BID DETAILS LOAD STATUS", bid_details.load_status)
-
-        ist_timezone = pytz.timezone("Asia/Kolkata")
-        current_time = datetime.now(ist_timezone)
-        current_time = current_time.replace(
-            tzinfo=None, second=0, microsecond=0)
-
-        log("THE CURRENT TIME DURING RATE :::: ", current_time)
-        if bid_details.load_status not in valid_bid_status:
-            if current_time < bid_details.bid_time and current_time < bid_details.bid_end_time:
-                return ErrorResponse(data=[], client_msg=f"This Load is not Accepting Bids yet, the start time is {bid_details.bid_time}", dev_msg="Tried bidding, but bid is not live yet")
-
-            elif current_time > bid_details.bid_time and current_time >= bid_details.bid_end_time:
-                return ErrorResponse(data=[], client_msg=f"This Load is not Accepting Bids anymore, the end time was {bid_details.bid_end_time}", dev_msg="Tried bidding, but bid is not live anymore")
-            
-        if bid_details.load_status in valid_bid_status:
-            if current_time >= bid_details.bid_end_time:
-                return ErrorResponse(data=[], client_msg=f"This Load is not Accepting Bids anymore, the end time was {bid_details.bid_end_time}", dev_msg="Tried bidding, but bid is not live anymore")
+        (submission, error) = await rate.submit(bid_id=bid_id, transporter_id=transporter_id, rate=bid_req.rate,
+                                                comment=bid_req.comment, is_tc_accepted=bid_req.is_tc_accepted, user_id=user_id)
 
-        log("BID DETAILS FOUND", bid_id)
-
-        if bid_details.bid_mode == "private_pool":
-            log("REQUEST TRANSPORTER ID:", transporter_id)
-            log("BID SHIPPER ID", bid_details.bl_shipper_id)
-            (allowed_transporter_to_bid, error) = await transporter.allowed_to_bid(shipper_id=bid_details.bl_shipper_id, transporter_id=transporter_id)
-
-            if not allowed_transporter_to_bid:
-                return ErrorResponse(data=[], client_msg="Transporter Not Allowed to participate in the private Bid", dev_msg="bid is private, transporter not allowed")
-
-        log("TRANSPORTER ALLOWED TO BID", bid_id)
-
-        (transporter_attempts, error) = await transporter.attempts(
-            bid_id=bid_id, transporter_id=transporter_id)
+        log("RATE SUBMISSION", submission)
 
         if error:
-            return ErrorResponse(data=[], client_msg=os.getenv("BID_RATE_ERROR"), dev_msg=error)
-
-        if transporter_attempts >= bid_details.no_of_tries:
-            return ErrorResponse(data=[], client_msg="You have exceeded the number of tries for this bid!", dev_msg=f"Number of tries for Bid  L-{bid_id[-5:].upper()} exceeded!")
+            return ErrorResponse(data=[], client_msg=submission.get("client_msg", os.getenv("BID_RATE_ERROR")), dev_msg=error)
 
-        log("BID TRIES OK", bid_id)
+        new_bid_transaction, transporter_name, transporter_attempts = submission[
+            "bid"], submission["transporter_name"], submission["attempts"]
 
-        (rate, error) = await transporter.is_valid_bid_rate(bid_id=bid_id, show_rate_to_transporter=bid_details.show_current_lowest_rate_transporter,
-                                                            rate=bid_req.rate, transporter_id=transporter_id, decrement=bid_details.bid_price_decrement,
-                                                            is_decrement_in_percentage=bid_details.is_decrement_in_percentage , status=bid_details.load_status)
+        (bid_event, error) = await redis.update(sorted_set=bid_id, transporter_id=transporter_id, comment=new_bid_transaction.comment, transporter_name=transporter_name,
+                                                rate=bid_req.rate, attempts=transporter_attempts, created_at=new_bid_transaction.created_at, bid_end_time=submission["bid_end_time"])
 
-        log("RATE OBJECT", rate)
+        log("BID EVENT", bid_event)
 
         if error:
-            return ErrorResponse(data={}, dev_msg=error, client_msg=error)
+            # the rate is committed but the live state may not reflect it, so it is rebuilt from the database
+            # and connected clients are sent the rebuilt leaderboard to resync from
+            log("ERROR WHILE UPDATING LIVE BID STATE", error)
+            await redis.delete(bid_ids=[bid_id])
 
-        if not rate["valid"]:
-            return ErrorResponse(data=[], client_msg=f"You entered an incorrect bid rate! Decrement is {bid_details.bid_price_decrement}", dev_msg="Incorrect bid price entered")
+            (snapshot, error) = await redis.snapshot(bid_id=bid_id)
 
-        log("VALID RATE", bid_id)
+            if error:
+                log("ERROR WHILE REBUILDING LIVE BID STATE", error)
+                return SuccessResponse(data=[], dev_msg=f"Bid submitted successfully, live bid details could not be fetched: {error}", client_msg=f"Bid for Bid  L-{bid_id[-5:].upper()} submitted!")
 
-        (new_bid_transaction, error) = await bid.new(
-            bid_id, transporter_id, bid_req.rate, bid_req.comment, bid_req.is_tc_accepted, user_id=user_id)
+            await manager.broadcast(bid_id=bid_id, message=orjson.dumps(snapshot).decode())
 
-        log("NEW BID INSERTED", new_bid_transaction)
+            log("SOCKET SNAPSHOT SENT", snapshot)
 
-        if error:
-            return ErrorResponse(data=[], dev_msg=error, client_msg=os.getenv("BID_RATE_ERROR"))
+            return SuccessResponse(data=snapshot["leaderboard"], dev_msg="Bid submitted successfully", client_msg=f"Bid for Bid  L-{bid_id[-5:].upper()} submitted!")
 
-        (transporter_name, error) = await transporter.name(
-            transporter_id=transporter_id)
+        if bid_event:
+            await manager.broadcast(bid_id=bid_id, message=bid_event)
 
-        log("TRANSPORTER NAME", transporter_name)
+            log("SOCKET EVENT SENT", bid_event)
 
-        if error:
-            return ErrorResponse(data=[], client_msg=os.getenv("BID_RATE_ERROR"), dev_msg=error)
-
-        (sorted_bid_details, error) = await redis.update(sorted_set=bid_id,
-                                                         transporter_id=transporter_id, comment=new_bid_transaction.comment, transporter_name=transporter_name, rate=bid_req.rate, attempts=transporter_attempts + 1)
+        (sorted_bid_details, error) = await redis.bid_details(sorted_set=bid_id)
 
         log("BID DETAILS", sorted_bid_details)
 
-        await manager.broadcast(bid_id=bid_id, message=json.dumps(sorted_bid_details))
-
-        log("SOCKET EVENT SENT", sorted_bid_details)
+        if error:
+            return SuccessResponse(data=[], dev_msg=f"Bid submitted successfully, live bid details could not be fetched: {error}", client_msg=f"Bid for Bid  L-{bid_id[-5:].upper()} submitted!")
 
         return SuccessResponse(data=sorted_bid_details, dev_msg="Bid submitted successfully", client_msg=f"Bid for Bid  L-{bid_id[-5:].upper()} submitted!")
 
@@ -504,13 +334,12 @@ async def provide_new_rate_for_bid(request: Request, bid_id: str, bid_req: Trans
 async def bid_match_for_transporter(request: Request, bid_id: str, req: TransporterBidMatchApproval):
     transporter_id = request.state.current_user["transporter_id"]
     user_id = request.state.current_user["id"]
-    authtoken = request.headers.get("authorization", "")
 
     try:
         if not transporter_id:
             return ErrorResponse(data=[], dev_msg=os.getenv("TRANSPORTER_ID_NOT_FOUND_ERROR"), client_msg=os.getenv("GENERIC_ERROR"))
 
-        (bid_match_result, error) = await transporter.bid_match_approval(transporter_id= transporter_id, bid_id= bid_id, req=req, user_id = user_id, authtoken = authtoken)
+        (bid_match_result, error) = await transporter.bid_match_approval(transporter_id= transporter_id, bid_id= bid_id, req=req, user_id = user_id)
 
         if error :
             if error == "Bid Match Approval Period is Over":
@@ -562,19 +391,13 @@ async def fetch_lost_bids_for_transporter_based_on_participation(request: Reques
         current_time = datetime.now(ist_timezone)
         current_time = current_time.replace(tzinfo=None, second=0, microsecond=0)
 
-        updated_bids = []
-        for bid in bids:
-
-            lowest_price_response = await lowest_price_of_bid_and_transporter(request=request, bid_id=bid["bid_id"], show_bid_lowest_price=True)
-            if lowest_price_response["data"] == []:
-                return lowest_price_response
-
-            lowest_price_data = lowest_price_response["data"]
-            bid_data_with_lowest_price = {**bid, **lowest_price_data}
+        (updated_bids, error) = await with_price_summary(bids=bids, transporter_id=transporter_id, show_bid_lowest_price=True)
+        if error:
+            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
+        for bid_data_with_lowest_price in updated_bids:
             if current_time.day - bid_data_with_lowest_price["bid_end_time"].day < 7:
                 bid_data_with_lowest_price["bid_lowest_price"] = None
-            updated_bids.append(bid_data_with_lowest_price)
             
 
         sorted_bids = sorted(updated_bids, key=lambda x: x['bid_time'], reverse=True)
@@ -595,49 +418,37 @@ async def lowest_price_of_bid_and_transporter(request: Request, bid_id: str, sho
         if not transporter_id:
             return ErrorResponse(data=[], dev_msg=os.getenv("TRANSPORTER_ID_NOT_FOUND_ERROR"), client_msg=os.getenv("GENERIC_ERROR"))
 
-        (transporter_lowest_price, error) = await transporter.lowest_price(
-            bid_id=bid_id, transporter_id=transporter_id)
-
-        if error:
-            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
-
-        log("FOUND TRANSPORTER LOWEST PRICE", transporter_lowest_price)
-
-        (success, bid_details) = await bid.details(bid_id=bid_id)
-        if not success:
-            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong while fetching bid details for transporter, please try again in sometime!")
+        (live_state, error) = await redis.transporter_state(bid_id=bid_id, transporter_id=transporter_id)
 
-        (bid_lowest_price, error) = (None, None)
-
-        if not show_bid_lowest_price:
-            if bid_details.show_current_lowest_rate_transporter:
-                (bid_lowest_price, error) = await bid.lowest_price(bid_id=bid_id)
+        if not error and live_state["show_current_lowest_rate_transporter"] is not None:
+            bid_lowest_price = live_state["bid_lowest_price"] if show_bid_lowest_price or live_state["show_current_lowest_rate_transporter"] else None
+            transporter_lowest_price = live_state["rate"] or 0.0
+            transporter_position = live_state["position"]
+            no_of_tries = live_state["no_of_tries"]
         else:
-            (bid_lowest_price, error) = await bid.lowest_price(bid_id=bid_id)
-
-        if error:
-            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong while fetching bid details for transporter, please try again in sometime!")
+            # the live state could not be read or predates the cached settings, one query answers the same
+            log("FETCHING LOWEST PRICE OF BID AND TRANSPORTER FROM DB", error)
+            (summary, error) = await transporter.price_summary(bid_ids=[bid_id], transporter_id=transporter_id, show_bid_lowest_price=show_bid_lowest_price)
 
-        log("FOUND BID LOWEST PRICE", bid_lowest_price)
-
-        # transporter_position, error = redis.position(
-        #     sorted_set=bid_id, key=transporter_id)
+            if error:
+                return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching lowest price of transporter, please try again in sometime!")
 
-        # if error:
-        #     return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching bid details for transporter, please try again in sometime!")
+            if bid_id not in summary:
+                return ErrorResponse(data=[], dev_msg="Requested bid details was not found", client_msg="Something went wrong while fetching bid details for transporter, please try again in sometime!")
 
-        # if not transporter_position:
-        (transporter_position, error) = await transporter.position(transporter_id=transporter_id, bid_id=bid_id)
+            summary = summary[bid_id]
+            bid_lowest_price = summary["bid_lowest_price"]
+            transporter_lowest_price = summary["transporter_lowest_price"] or 0.0
+            transporter_position = summary["position"] - 1 if summary["position"] is not None else None
+            no_of_tries = summary["no_of_tries"]
 
-        if error:
-            return ErrorResponse(data=[], dev_msg=error, client_msg="Something went wrong file fetching bid details for transporter, please try again in sometime!")
-        log("TRANSPORTER POSITION ", transporter_position)
+        log("FOUND BID AND TRANSPORTER LOWEST PRICE", {"bid": bid_lowest_price, "transporter": transporter_lowest_price, "position": transporter_position})
 
         return SuccessResponse(data={
             "bid_lowest_price": bid_lowest_price if bid_lowest_price != float("inf") else None,
             "transporter_lowest_price": transporter_lowest_price if transporter_lowest_price != 0.0 else None,
             "position": transporter_position+1 if transporter_position != None else None,
-            "no_of_tries": bid_details.no_of_tries
+            "no_of_tries": no_of_tries
             # "transporter_rates": transporter_historical_rates
         }, dev_msg="Found all rates successfully", client_msg="Fetched lowest price of bid and transporter successfully")
 
@@ -693,3 +504,12 @@ async def terms_and_conditions_approval_before_bidding(request: Request, bid_id:
         
     except Exception as err:
         return ServerError(err=err, errMsg=str(err))
+
+
+async def with_price_summary(bids: list, transporter_id: str, show_bid_lowest_price: bool = False) -> (list, str):
+
+    (summary, error) = await transporter.price_summary(bid_ids=[each_bid["bid_id"] for each_bid in bids], transporter_id=transporter_id, show_bid_lowest_price=show_bid_lowest_price)
+    if error:
+        return ([], error)
+
+    return ([{**each_bid, **summary.get(str(each_bid["bid_id"]), {})} for each_bid in bids], "")
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, FastAPI
 
 from middleware.auth import AuthMiddleware
+from routes.admin import admin_router
 from routes.bids.shipper import shipper_bidding_router
 from routes.bids.transporter import transporter_bidding_router
 from routes.bids.open import open_router
@@ -15,6 +16,7 @@ def setup_routes(app: FastAPI):
     router.include_router(transporter_bidding_router)
     router.include_router(dashboard_router)
     router.include_router(open_router)
+    router.include_router(admin_router)
 
     app.add_middleware(AuthMiddleware)
 
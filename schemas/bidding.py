@@ -49,6 +49,16 @@ class TransporterUnassignRequest(BaseModel):
 class TransporterLostBidsReq(BaseModel):
     particpated : bool
 
+class EligibilityInvalidationReq(BaseModel):
+    transporter_ids: list[UUID] = []
+    user_ids: list[UUID] = []
+
+class HistoryBackfillReq(BaseModel):
+    batch_size: int = Field(default=500, gt=0, le=5000)
+    dry_run: bool = True
+    max_batches: Union[int, None] = Field(default=None, gt=0)
+    restart: bool = False
+
 class CancelBidReq(BaseModel):
     reason : str
     
@@ -2,17 +2,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-import json
+import orjson
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from config.http import http
+from config.redis import pool as redis_pool
 from config.socket import manager
 from routes.routes import setup_routes
-from utils.background_jobs import schedule_jobs
+from utils.background_jobs import schedule_jobs, stop_jobs
+from utils.redis import Redis
+from utils.utilities import log
 
 
-app: FastAPI = FastAPI()
+app: FastAPI = FastAPI(default_response_class=ORJSONResponse)
+redis = Redis()
 
 setup_routes(app)
 
@@ -28,17 +34,71 @@ app.add_middleware(
 async def root():
     return{'RESPONSE':'Transport Management System BIDDING ROOT!!!'}
 
-schedule_jobs()
+@app.on_event("startup")
+async def startup():
+    # every instance takes part in the leader election, only the leader runs the jobs
+    http.start()
+    schedule_jobs()
+    manager.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_jobs()
+    await manager.stop()
+    await http.stop()
+    await redis_pool.disconnect()
+
+@app.get("/ws/metrics")
+async def websocket_metrics():
+    return manager.metrics()
+
 
 @app.websocket("/ws/{bid_id}")
 async def websocket_endpoint(websocket: WebSocket, bid_id: str):
     await manager.connect(websocket, bid_id)
     try:
+        # clients get the whole leaderboard once, and sequence numbered delta events after that
+        await send_snapshot(websocket, bid_id)
+
         while True:
             data = await websocket.receive_text()
-            await manager.broadcast(bid_id, f"Client says: {data}")
+
+            resync_from = resync_request(data)
+            if resync_from is None:
+                await manager.broadcast(bid_id, f"Client says: {data}")
+                continue
+
+            (events, error) = await redis.events_since(bid_id=bid_id, seq=resync_from)
+
+            if events is None:
+                await send_snapshot(websocket, bid_id)
+                continue
+
+            for event in events:
+                await manager.send(websocket, bid_id, event)
 
     except WebSocketDisconnect:
         manager.disconnect(websocket, bid_id)
         message = {"message": "Offline"}
-        await manager.broadcast(bid_id, json.dumps(message))
+        await manager.broadcast(bid_id, orjson.dumps(message).decode())
+
+
+async def send_snapshot(websocket: WebSocket, bid_id: str):
+    (snapshot, error) = await redis.snapshot(bid_id=bid_id)
+    if error:
+        log("ERROR WHILE FETCHING LIVE BID SNAPSHOT", error)
+        return
+    await manager.send(websocket, bid_id, orjson.dumps(snapshot).decode())
+
+
+def resync_request(data: str) -> int | None:
+    # a client that missed events sends {"type": "resync", "seq": <last seq it applied>}
+    try:
+        message = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return None
+
+    if not isinstance(message, dict) or message.get("type") != "resync" or not isinstance(message.get("seq"), int):
+        return None
+    return message["seq"]
@@ -1,17 +1,74 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+
 from utils.bids.bidding import Bid
-from config.scheduler import Scheduler
+from utils.bids.dispatcher import dispatcher
+from utils.bids.lifecycle import lifecycle
+from utils.utilities import log
+from config.scheduler import Leader, Scheduler
 
 bid = Bid()
 sched = Scheduler()
+leader = Leader()
+jobs: asyncio.Task | None = None
 
 
-def schedule_jobs():
+async def move_bids_from_pending_to_cancelled():
+    await bid.move_from_pending_to_cancelled()
+
+
+async def lead():
     scheduler = sched.new_scheduler()
-    scheduler.add_job(func=bid.initiate, trigger="interval",
-                      id="initiate-bid", minutes=1)
-    scheduler.add_job(func=bid.close, trigger="interval",
-                      id="close-bid", minutes=1)
-    scheduler.add_job(func=bid.move_from_pending_to_cancelled, trigger="interval",
-                      id="move-bid-from-pending-to-cancelled", minutes=30)
-    sched.start(scheduler=scheduler)
+    # started paused so the persisted jobs can be looked up before anything runs
+    sched.start(scheduler=scheduler, paused=True)
+
+    # jobs are stored by reference, so the persistent job store can load them back after a restart.
+    # They are only added when missing, re-adding would push their next run back on every election.
+    if scheduler.get_job("move-bid-from-pending-to-cancelled") is None:
+        scheduler.add_job(func="utils.background_jobs:move_bids_from_pending_to_cancelled", trigger="interval",
+                          id="move-bid-from-pending-to-cancelled", minutes=30)
+    scheduler.resume()
+
+    # bids going live and closing are driven by their own timers rather than a polling job
+    lifecycle.start()
+    dispatcher.start()
+
+    try:
+        while True:
+            await asyncio.sleep(leader.renew_interval)
+            if not await leader.renew():
+                log("SCHEDULER LEADERSHIP LOST", leader.id)
+                return
+    finally:
+        scheduler.shutdown(wait=False)
+        await lifecycle.stop()
+        await dispatcher.stop()
+
+
+async def run_jobs():
+    while True:
+        try:
+            if await leader.acquire():
+                log("SCHEDULER LEADERSHIP ACQUIRED", leader.id)
+                await lead()
+
+        except asyncio.CancelledError:
+            await leader.release()
+            raise
+        except Exception as e:
+            log("ERROR IN SCHEDULER LEADER ELECTION", str(e))
+
+        await asyncio.sleep(leader.renew_interval)
+
+
+def schedule_jobs():
+    global jobs
+    jobs = asyncio.create_task(run_jobs())
+
+
+async def stop_jobs():
+    if jobs:
+        jobs.cancel()
+        try:
+            await jobs
+        except asyncio.CancelledError:
+            pass
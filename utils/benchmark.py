@@ -0,0 +1,101 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import asyncio
+import orjson
+import statistics
+import sys
+from string import Template
+
+from sqlalchemy import text
+
+from config.db_config import AsyncSession
+from data.bidding import status_wise_fetch_query
+from utils.utilities import log
+
+
+class Benchmark:
+
+    # Runs a query under EXPLAIN ANALYZE and reports the time Postgres spent planning and executing
+    # it, along with the plan, so changes to the feed queries can be compared on real data.
+    # EXPLAIN ANALYZE executes the query, only use it with read only queries.
+    # python -m utils.benchmark <load status> [shipper id] [runs]
+
+    async def explain(self, query: str, params: dict) -> (dict, str):
+
+        session = AsyncSession()
+
+        try:
+            plan = (await session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"), params=params)).scalar()
+
+            if isinstance(plan, (str, bytes)):
+                plan = orjson.loads(plan)
+
+            plan = plan[0]
+
+            return ({
+                "planning_time": plan["Planning Time"],
+                "execution_time": plan["Execution Time"],
+                "rows": plan["Plan"]["Actual Rows"],
+                "plan": plan["Plan"]
+            }, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ({}, str(e))
+
+        finally:
+            await session.close()
+
+    async def run(self, query: str, params: dict, runs: int = 5) -> (dict, str):
+
+        explained = []
+
+        for _ in range(runs):
+            (result, error) = await self.explain(query=query, params=params)
+            if error:
+                return ({}, error)
+            explained.append(result)
+
+        execution_times = [result["execution_time"] for result in explained]
+
+        return ({
+            "runs": runs,
+            "rows": explained[-1]["rows"],
+            "planning_time": statistics.median(result["planning_time"] for result in explained),
+            "median_execution_time": statistics.median(execution_times),
+            "max_execution_time": max(execution_times),
+            "plan": explained[-1]["plan"]
+        }, "")
+
+    async def status_feed(self, status: str, shipper_id: str | None = None, runs: int = 5) -> (dict, str):
+
+        params = {"load_status": status}
+        shipper_id_filter = ""
+
+        if shipper_id:
+            params["shipper_id"] = shipper_id
+            shipper_id_filter = ' AND t_bidding_load.bl_shipper_id = :shipper_id'
+
+        query = Template(status_wise_fetch_query).safe_substitute(shipper_id_filter=shipper_id_filter)
+
+        return await self.run(query=query, params=params, runs=runs)
+
+
+async def main(status: str, shipper_id: str | None = None, runs: int = 5):
+
+    (result, error) = await Benchmark().status_feed(status=status, shipper_id=shipper_id, runs=runs)
+
+    if error:
+        log("BENCHMARK FAILED", error)
+        return
+
+    # the report is the CLI's output, not a log line
+    sys.stdout.write(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode() + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(status=sys.argv[1],
+                     shipper_id=sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] else None,
+                     runs=int(sys.argv[3]) if len(sys.argv) > 3 else 5))
@@ -0,0 +1,215 @@
+import asyncio
+import os
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import select
+
+from config.db_config import AsyncSession
+from config.redis import r as redis
+from models.models import AssignmentEvent, LoadAssigned
+from utils.bids.history import AssignmentHistory
+from utils.utilities import log
+
+assignment_log = AssignmentHistory()
+
+
+class HistoryBackfill:
+
+    # Moves the events held in LoadAssigned.history strings into t_assignment_event while the service
+    # is running. Rows are walked in primary key order in small batches, each batch is converted and
+    # committed in its own transaction (clearing the history string, so the events are never read
+    # twice), and the last la_id is checkpointed in Redis so an interrupted run resumes where it
+    # stopped. Rows being assigned at the same time are waited for rather than skipped. Rows whose
+    # history cannot be read are set aside by id and retried before the run reports completion, along
+    # with how many are still left. A dry run converts and counts without writing anything.
+
+    def __init__(self):
+        self.key = "backfill:assignment_history"
+        self.batch_pause = float(os.getenv("BACKFILL_BATCH_PAUSE", 0.1))
+        self.task: asyncio.Task | None = None
+
+    def checkpoint_key(self, dry_run: bool) -> str:
+        return f"{self.key}:{'dry_run:' if dry_run else ''}checkpoint"
+
+    def progress_key(self, dry_run: bool) -> str:
+        return f"{self.key}:{'dry_run:' if dry_run else ''}progress"
+
+    def failed_key(self, dry_run: bool) -> str:
+        return f"{self.key}:{'dry_run:' if dry_run else ''}failed"
+
+    def lock_key(self) -> str:
+        return f"{self.key}:lock"
+
+    def parse(self, event_time: any) -> datetime:
+        event_time = event_time if isinstance(event_time, datetime) else datetime.fromisoformat(str(event_time))
+        return event_time.replace(tzinfo=None)
+
+    async def progress(self, dry_run: bool = False) -> (dict, str):
+        try:
+            return (await redis.hgetall(self.progress_key(dry_run)), "")
+        except Exception as e:
+            return ({}, str(e))
+
+    async def start(self, batch_size: int, dry_run: bool, max_batches: int | None = None, restart: bool = False) -> (bool, str):
+
+        if self.task and not self.task.done():
+            return (False, "Backfill is already running on this instance")
+
+        # one run at a time across instances, kept alive by the run itself
+        if not await redis.set(self.lock_key(), os.getpid(), nx=True, ex=60):
+            return (False, "Backfill is already running on another instance")
+
+        if restart:
+            await redis.delete(self.checkpoint_key(dry_run), self.progress_key(dry_run), self.failed_key(dry_run))
+
+        self.task = asyncio.create_task(self.run(batch_size=batch_size, dry_run=dry_run, max_batches=max_batches))
+        return (True, "")
+
+    async def run(self, batch_size: int, dry_run: bool, max_batches: int | None = None):
+
+        checkpoint_key, progress_key, failed_key = self.checkpoint_key(dry_run), self.progress_key(dry_run), self.failed_key(dry_run)
+
+        try:
+            checkpoint = await redis.get(checkpoint_key)
+            await redis.hset(progress_key, mapping={"status": "running", "dry_run": int(dry_run), "started_at": str(datetime.now())})
+
+            batches = 0
+            while max_batches is None or batches < max_batches:
+
+                await redis.expire(self.lock_key(), 60)
+
+                (batch, error) = await self.batch(after=checkpoint, batch_size=batch_size, dry_run=dry_run)
+
+                if error:
+                    log("ERROR IN ASSIGNMENT HISTORY BACKFILL", error)
+                    await redis.hset(progress_key, mapping={"status": "failed", "error": error, "updated_at": str(datetime.now())})
+                    return
+
+                if not batch["rows"]:
+                    (remaining, error) = await self.retry_failed(dry_run=dry_run)
+
+                    if error:
+                        log("ERROR IN ASSIGNMENT HISTORY BACKFILL", error)
+                        await redis.hset(progress_key, mapping={"status": "failed", "error": error, "updated_at": str(datetime.now())})
+                        return
+
+                    await redis.hset(progress_key, mapping={"status": "completed" if not remaining else "completed_with_failures",
+                                                            "rows_remaining": remaining, "updated_at": str(datetime.now())})
+                    log("ASSIGNMENT HISTORY BACKFILL COMPLETED", await redis.hgetall(progress_key))
+                    return
+
+                checkpoint = batch["checkpoint"]
+                batches += 1
+
+                pipeline = redis.pipeline(transaction=False)
+                if batch["failed_ids"]:
+                    pipeline.sadd(failed_key, *batch["failed_ids"])
+                pipeline.set(checkpoint_key, checkpoint)
+                pipeline.hincrby(progress_key, "batches", 1)
+                pipeline.hincrby(progress_key, "rows_scanned", batch["rows"])
+                pipeline.hincrby(progress_key, "rows_migrated", batch["migrated"])
+                pipeline.hincrby(progress_key, "events_written", batch["events"])
+                pipeline.hincrby(progress_key, "rows_failed", batch["failed"])
+                pipeline.hset(progress_key, mapping={"checkpoint": checkpoint, "updated_at": str(datetime.now())})
+                await pipeline.execute()
+
+                await asyncio.sleep(self.batch_pause)
+
+            await redis.hset(progress_key, mapping={"status": "paused", "updated_at": str(datetime.now())})
+
+        except asyncio.CancelledError:
+            await redis.hset(progress_key, mapping={"status": "paused", "updated_at": str(datetime.now())})
+            raise
+        except Exception as e:
+            log("ERROR IN ASSIGNMENT HISTORY BACKFILL", str(e))
+            await redis.hset(progress_key, mapping={"status": "failed", "error": str(e), "updated_at": str(datetime.now())})
+        finally:
+            await redis.delete(self.lock_key())
+
+    async def retry_failed(self, dry_run: bool) -> (int, str):
+
+        # rows set aside during the run, retried once the walk is done
+        failed_key = self.failed_key(dry_run)
+
+        la_ids = list(await redis.smembers(failed_key))
+
+        for start in range(0, len(la_ids), 500):
+            (batch, error) = await self.batch(la_ids=la_ids[start:start + 500], dry_run=dry_run)
+            if error:
+                return (0, error)
+
+            recovered = set(la_ids[start:start + 500]) - set(batch["failed_ids"])
+            if recovered:
+                await redis.srem(failed_key, *recovered)
+                await redis.hincrby(self.progress_key(dry_run), "rows_migrated", batch["migrated"])
+                await redis.hincrby(self.progress_key(dry_run), "events_written", batch["events"])
+
+        return (await redis.scard(failed_key), "")
+
+    async def batch(self, dry_run: bool, after: str | None = None, batch_size: int | None = None, la_ids: list | None = None) -> (dict, str):
+
+        session = AsyncSession()
+
+        try:
+            query = (select(LoadAssigned)
+                     .where(LoadAssigned.history != None)
+                     .order_by(LoadAssigned.la_id))
+
+            if la_ids is not None:
+                query = query.where(LoadAssigned.la_id.in_([UUID(la_id) for la_id in la_ids]))
+            else:
+                query = query.limit(batch_size)
+
+            if after:
+                query = query.where(LoadAssigned.la_id > UUID(after))
+
+            if not dry_run:
+                # waits for rows being assigned right now, skipping them would leave them behind the checkpoint
+                query = query.with_for_update()
+
+            rows = (await session.execute(query)).scalars().all()
+
+            batch = {"rows": len(rows), "migrated": 0, "events": 0, "failed": 0, "failed_ids": [], "checkpoint": str(rows[-1].la_id) if rows else after}
+
+            for row in rows:
+                try:
+                    events = [(event, value, self.parse(event_time), reason) for (event, value, event_time, reason) in assignment_log.legacy(row.history)]
+                except Exception as e:
+                    log("UNREADABLE ASSIGNMENT HISTORY", {"la_id": row.la_id, "error": str(e)})
+                    batch["failed"] += 1
+                    batch["failed_ids"].append(str(row.la_id))
+                    continue
+
+                for (event, value, event_time, reason) in events:
+                    session.add(AssignmentEvent(
+                        ae_bidding_load_id=row.la_bidding_load_id,
+                        ae_transporter_id=row.la_transporter_id,
+                        event=event,
+                        value=value,
+                        reason=reason,
+                        event_time=event_time,
+                        created_at=event_time,
+                        created_by=row.updated_by or row.created_by
+                    ))
+
+                row.history = None
+                batch["migrated"] += 1
+                batch["events"] += len(events)
+
+            if dry_run:
+                await session.rollback()
+            else:
+                await session.commit()
+
+            return (batch, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ({}, str(e))
+
+        finally:
+            await session.close()
+
+
+history_backfill = HistoryBackfill()
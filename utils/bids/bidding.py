@@ -1,16 +1,17 @@
-import math
 import os
-import ast
+import orjson
 import pytz
 from datetime import datetime, timedelta
 from string import Template
+from uuid import UUID
 
-from sqlalchemy import func, text, and_, select, or_, exists, not_ 
+from sqlalchemy import func, text, and_, select, update, or_, exists, not_ 
+from sqlalchemy.dialects import postgresql
 
-from config.db_config import Session
-from config.redis import r as redis
+from config.db_config import AsyncSession
 from config.scheduler import Scheduler
-from data.bidding import (filter_wise_fetch_query, live_bid_details,
+from config.socket import manager
+from data.bidding import (filter_wise_fetch_query, live_bid_details, live_bid_state,
                           status_wise_fetch_query, transporter_analysis, assignment_events)
 from models.models import (BiddingLoad, BidSettings, BidTransaction,
                            LoadAssigned, MapLoadSrcDestPair, ShipperModel,
@@ -18,63 +19,67 @@ from models.models import (BiddingLoad, BidSettings, BidTransaction,
                            TrackingFleet, MapUser, BlacklistTransporter, MapShipperTransporter, User
                            )
 from schemas.bidding import FilterBidsRequest
+from utils.bids.eligibility import Eligibility
+from utils.bids.history import AssignmentHistory
+from utils.bids.outbox import Outbox
 from utils.redis import Redis
 from utils.response import ErrorResponse
-from utils.utilities import (add_filter, convert_date_to_string, log,
+from utils.utilities import (add_filter, log,
                              structurize, structurize_assignment_data,
                              structurize_bidding_stats,
                              structurize_confirmed_cancelled_trip_trend_stats,
                              structurize_transporter_bids)
-from utils.notification_service_manager import notification_service_manager, NotificationServiceManagerReq
 
 sched = Scheduler()
 redis = Redis()
+eligibility = Eligibility()
+assignment_log = AssignmentHistory()
+outbox = Outbox()
 
 
 class Bid:
 
-    def initiate(self, shipper_id: str | None = None):
+    async def initiate(self, shipper_id: str | None = None, bid_ids: list | None = None) -> (list, str):
 
-        session = Session()
+        session = AsyncSession()
         ist_timezone = pytz.timezone("Asia/Kolkata")
-        current_time = convert_date_to_string(datetime.now(ist_timezone))
+        current_time = datetime.now(ist_timezone).replace(tzinfo=None)
 
         try:
 
-            bids = session.query(BiddingLoad).filter(
-                BiddingLoad.is_active == True, BiddingLoad.load_status == "not_started")
-            
+            bids = (update(BiddingLoad)
+                    .where(BiddingLoad.is_active == True, BiddingLoad.load_status == "not_started", BiddingLoad.bid_time <= current_time)
+                    .values(load_status="live", updated_at=func.now())
+                    .returning(BiddingLoad.bl_id)
+                    .execution_options(synchronize_session=False)
+                    )
+
             if shipper_id:
-                bids = bids.filter(BiddingLoad.bl_shipper_id == shipper_id)
-                
-            bids = bids.all()
-            
-            log("THE BIDS TO INITIATE:", bids)
-            if not bids:
-                return
+                bids = bids.where(BiddingLoad.bl_shipper_id == shipper_id)
 
-            for bid in bids:
-                log("THE BID TIME", convert_date_to_string(bid.bid_time))
-                log("THE CURRENT TIME", current_time)
-                if convert_date_to_string(bid.bid_time) == current_time:
-                    setattr(bid, "load_status", "live")
-                    setattr(bid, "updated_at", "NOW()")
+            if bid_ids:
+                bids = bids.where(BiddingLoad.bl_id.in_(bid_ids))
 
-            session.commit()
+            initiated_bid_ids = [str(bid_id) for bid_id in (await session.execute(bids)).scalars().all()]
 
-            log("BIDS ARE IN PROGRESS", bids)
-            return
+            await session.commit()
+
+            log("BIDS ARE IN PROGRESS", initiated_bid_ids)
+
+            await self.broadcast_status(bid_ids=initiated_bid_ids, status="live")
+
+            return (initiated_bid_ids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             log("ERROR DURING INITIATE BID", str(e))
-            return
+            return ([], str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def get_status_wise(self, status: str, shipper_id: str | None = None) -> (any, str):
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -82,82 +87,79 @@ class Bid:
                 "load_status": status
             }
 
-            query = status_wise_fetch_query
+            shipper_id_filter = ""
 
             if shipper_id is not None:
                 filter_criteria["shipper_id"] = shipper_id
-                query += ' AND t_bidding_load.bl_shipper_id = :shipper_id'
+                shipper_id_filter = ' AND t_bidding_load.bl_shipper_id = :shipper_id'
 
-            bid_array = session.execute(text(query), params=filter_criteria)
+            query = Template(status_wise_fetch_query).safe_substitute(shipper_id_filter=shipper_id_filter)
 
-            rows = bid_array.fetchall()
+            bid_array = await session.execute(text(query), params=filter_criteria)
 
-            log("BIDS", rows)
+            rows = bid_array.fetchall()
 
-            b_arr = []
-            for row in rows:
-                log("ROW", row.bl_id)
-                b_arr.append(row._mapping)
+            log("BIDS", len(rows))
 
-            return (structurize(b_arr), "")
+            return (structurize(row._mapping for row in rows), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ({}, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def get_filter_wise(self, status: str, filter_criteria: FilterBidsRequest) -> (any, str):
-        session = Session()
+        session = AsyncSession()
 
         try:
 
             filter_values = {
-                'shipper_id_filter': ' AND t_bidding_load.bl_shipper_id = \'$shipper_id\'',
-                'regioncluster_id_filter': ' AND t_bidding_load.bl_region_cluster_id = \'$region_cluster_id\'',
-                'branch_id_filter': ' AND t_bidding_load.bl_branch_id = \'$branch_id\'',
-                'from_date_filter': ' AND t_bidding_load.bid_time > \'$from_date\'',
-                'to_date_filter': ' AND t_bidding_load.bid_time <= \'$to_date\''
+                'shipper_id_filter': ' AND t_bidding_load.bl_shipper_id = :shipper_id',
+                'regioncluster_id_filter': ' AND t_bidding_load.bl_region_cluster_id = :region_cluster_id',
+                'branch_id_filter': ' AND t_bidding_load.bl_branch_id = :branch_id',
+                'from_date_filter': ' AND t_bidding_load.bid_time > :from_date',
+                'to_date_filter': ' AND t_bidding_load.bid_time <= :to_date'
             }
 
-            filter_values["shipper_id_filter"] = Template(filter_values['shipper_id_filter']).safe_substitute(
-                shipper_id=filter_criteria.shipper_id) if filter_criteria.shipper_id else ""
-            filter_values["regioncluster_id_filter"] = Template(filter_values["regioncluster_id_filter"]).safe_substitute(
-                region_cluster_id=filter_criteria.rc_id) if filter_criteria.rc_id else ""
-            filter_values["branch_id_filter"] = Template(filter_values["branch_id_filter"]).safe_substitute(
-                branch_id=filter_criteria.branch_id) if filter_criteria.branch_id else ""
-            filter_values["from_date_filter"] = Template(filter_values["from_date_filter"]).safe_substitute(
-                from_date=filter_criteria.from_date) if filter_criteria.from_date else ""
-            filter_values["to_date_filter"] = Template(filter_values["to_date_filter"]).safe_substitute(
-                to_date=filter_criteria.to_date) if filter_criteria.to_date else ""
+            params = {
+                "load_status": status,
+                "shipper_id": filter_criteria.shipper_id,
+                "region_cluster_id": filter_criteria.rc_id,
+                "branch_id": filter_criteria.branch_id,
+                "from_date": filter_criteria.from_date.replace(tzinfo=None) if filter_criteria.from_date else None,
+                "to_date": filter_criteria.to_date.replace(tzinfo=None) if filter_criteria.to_date else None
+            }
+
+            # only the filters that were asked for are added to the query, with their values bound
+            for (filter, param) in [("shipper_id_filter", "shipper_id"), ("regioncluster_id_filter", "region_cluster_id"), ("branch_id_filter", "branch_id"),
+                                    ("from_date_filter", "from_date"), ("to_date_filter", "to_date")]:
+                if params[param] is None:
+                    filter_values[filter] = ""
+                    del params[param]
 
             filter_wise_query = Template(
                 filter_wise_fetch_query).safe_substitute(filter_values)
 
-            bid_array = session.execute(text(filter_wise_query), params={
-                                        "load_status": status})
+            bid_array = await session.execute(text(filter_wise_query), params=params)
 
             rows = bid_array.fetchall()
 
-            log("BIDS", rows)
-            b_arr = []
-            for row in rows:
-                log("ROW", row.bl_id)
-                b_arr.append(row._mapping)
+            log("BIDS", len(rows))
 
-            return (structurize(b_arr), "")
+            return (structurize(row._mapping for row in rows), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ({}, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def is_valid(self, bid_id: str) -> (bool, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             if not bid_id:
@@ -165,8 +167,8 @@ class Bid:
 
             log("BID ID WAS PROVIDED", bid_id)
 
-            bid = session.query(BiddingLoad).filter(
-                BiddingLoad.bl_id == bid_id, BiddingLoad.is_active == True).first()
+            bid = (await session.execute(select(BiddingLoad).where(
+                BiddingLoad.bl_id == bid_id, BiddingLoad.is_active == True))).scalars().first()
 
             if not bid:
                 log("BID ID NOT FOUND IN BIDDING LOADS")
@@ -177,30 +179,30 @@ class Bid:
             return (True, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             log(str(e))
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
-    async def update_status(self, bid_id: str, status: str, user_id: str, reason: str | None = None) -> (bool, str):
+    async def update_status(self, bid_id: str, status: str, user_id: str, reason: str | None = None, notification: dict | None = None) -> (bool, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
             log("bid_id", bid_id)
             log("status", status)
 
-            bid_to_be_updated = session.query(BiddingLoad).filter(
-                BiddingLoad.bl_id == bid_id).first()
+            bid_to_be_updated = (await session.execute(select(BiddingLoad).where(
+                BiddingLoad.bl_id == bid_id))).scalars().first()
 
             if not bid_to_be_updated:
                 return (False, "Bid requested could not be found")
 
             setattr(bid_to_be_updated, "load_status", status)
-            setattr(bid_to_be_updated, "updated_at", "NOW()")
+            setattr(bid_to_be_updated, "updated_at", func.now())
             setattr(bid_to_be_updated, "updated_by", user_id)
 
             if reason:
@@ -220,25 +222,28 @@ class Bid:
 
                 session.add(assigning_load)
 
-            session.commit()
+            if notification:
+                await outbox.add(session=session, bid_id=bid_id, user_id=user_id, **notification)
+
+            await session.commit()
 
             return (True, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def details(self, bid_id: str) -> (bool, any):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            bid_details = session.query(BiddingLoad).filter(
-                BiddingLoad.bl_id == bid_id).first()
+            bid_details = (await session.execute(select(BiddingLoad).where(
+                BiddingLoad.bl_id == bid_id))).scalars().first()
             log("BID DETIALS >>", bid_details)
             if not bid_details:
                 return (False, "Bid Details Not Found")
@@ -246,146 +251,24 @@ class Bid:
             return (True, bid_details)
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
-
-    async def new(self, bid_id: str, transporter_id: str, rate: float, comment: str, is_tc_accepted: bool, user_id: str) -> (any, str):
-
-        session = Session()
-
-        try:
-
-            attempt_number = 1
-            last_comment = comment
-            attempted = session.query(BidTransaction).filter(
-                BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0).count()
-
-            if attempted:
-                attempt_number = attempted + 1
-
-            if not comment:
-                last_commented_bid = session.query(BidTransaction).filter(
-                    BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.comment != None, BidTransaction.comment != "", BidTransaction.rate > 0
-                ).order_by(BidTransaction.created_at.desc()).first()
-                
-                if last_commented_bid:
-                    last_comment = last_commented_bid.comment
-            
-
-            bid = BidTransaction(
-                bid_id=bid_id,
-                transporter_id=transporter_id,
-                rate=rate,
-                comment=last_comment,
-                attempt_number=attempt_number,
-                is_tc_accepted=is_tc_accepted,
-                created_by=user_id
-            )
-
-            session.add(bid)
-            session.commit()
-            session.refresh(bid)
-
-            return (bid, "")
-
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
-        finally:
-            session.close()
-
-    async def decrement_on_lowest_price(self, bid_id: str, rate: float, decrement: float, is_decrement_in_percentage: bool) -> (any, str):
-
-        session = Session()
-        log("DECREMENTING ON CURRENT LOWEST PRICE")
-        try:
-            (lowest_price, error) = await self.lowest_price(bid_id=bid_id)
-
-            log("LOWEST PRICE BEFORE CONVERT", lowest_price)
-
-            if error:
-                return ErrorResponse(data=[], dev_msg=str(error), client_msg=os.getenv("BID_SUBMIT_ERROR"))
-
-            if lowest_price == float("inf"):
-                log("LOWEST PRICE INFINITY")
-                return ({
-                    "valid": True,
-                }, "")
-
-            lowest_price = int(lowest_price)
-            decrement = int(decrement)
-            rate = int(rate)
-
-            log("LOWEST PRICE", lowest_price)
-            log("DECREMENT", decrement)
-            log("RATE", rate)
-
-            if (rate + (math.ceil(decrement*lowest_price*0.01) if is_decrement_in_percentage else decrement) <= lowest_price):
-
-                log("NEW RATE", rate + (math.ceil(decrement * lowest_price * 0.01) if is_decrement_in_percentage else decrement))
-
-                log("BID RATE OK", rate)
-                return ({
-                    "valid": True,
-                }, "")
-            log("BID RATE NOT OK", rate)
-            rupees_sign ="₹" if not is_decrement_in_percentage else ""
-            percentage_sign = "%" if is_decrement_in_percentage else ""
-            return ({
-                "valid": False
-            }, f"Incorrect Bid price, has to be lower, the decrement is {rupees_sign} {decrement} {percentage_sign}")
-
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
-
-        finally:
-            session.close()
-
-    async def decrement_on_transporter_lowest_price(self, bid_id: str, transporter_id: str, rate: float, decrement: float, is_decrement_in_percentage: bool) -> (any, str):
-
-        session = Session()
-
-        try:
-            bid = session.query(BidTransaction).filter(
-                BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0).order_by(BidTransaction.rate).first()
+            await session.close()
 
-            if not bid:
-                return ({"valid": True}, "")
-
-            log("TRANSPORTER BID RATE OK", bid)
-
-            decrement = int(decrement)
-            rate = int(rate)
-
-            if (int(bid.rate) >= rate + (math.ceil(decrement*int(bid.rate)*0.01) if is_decrement_in_percentage else decrement)):
-                return ({
-                    "valid": True,
-                }, "")
-            log("TRANSPORTER BID RATE NOT VALID", bid)
-            rupees_sign ="₹" if not is_decrement_in_percentage else ""
-            percentage_sign = "%" if is_decrement_in_percentage else ""
-            return ({
-                "valid": False
-            }, f"Incorrect Bid price, has to be lower,decrement is {rupees_sign} {decrement} {percentage_sign}")
-
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
+    async def lowest_price(self, bid_id: str) -> (float, str):
 
-        finally:
-            session.close()
+        (lowest_price, error) = await redis.lowest_price(bid_id=bid_id)
+        if not error:
+            return (lowest_price, "")
 
-    async def lowest_price(self, bid_id: str) -> (float, str):
-        log("FETCHING LOWEST PRICE FROM DB")
-        session = Session()
+        log("FETCHING LOWEST PRICE FROM DB", error)
+        session = AsyncSession()
 
         try:
-            bid = session.query(BidTransaction).filter(
-                BidTransaction.bid_id == bid_id, BidTransaction.rate > 0).order_by(BidTransaction.rate.asc()).first()
+            bid = (await session.execute(select(BidTransaction).where(
+                BidTransaction.bid_id == bid_id, BidTransaction.rate > 0).order_by(BidTransaction.rate.asc()))).scalars().first()
 
             if not bid:
                 return (float("inf"), "")
@@ -394,66 +277,55 @@ class Bid:
             return (bid.rate, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (0, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def details_for_assignment(self, bid_id: str, transporter_id: str | None=None) -> (bool, any):
 
-        session = Session()
+        session = AsyncSession()
 
         log("FETCHING DETAILS FOR ASSIGNMENT")
 
         try:
 
-            bid_detail_arr = []
-
             details = (
-                session.query(BidTransaction,
-                              TransporterModel.name,
-                              LoadAssigned
-                              )
+                select(BidTransaction.transporter_id,
+                       TransporterModel.name.label("transporter_name"),
+                       BidTransaction.rate,
+                       BidTransaction.comment,
+                       LoadAssigned.no_of_fleets_assigned,
+                       LoadAssigned.pmr_price,
+                       LoadAssigned.is_assigned,
+                       LoadAssigned.is_pmr_approved,
+                       LoadAssigned.is_negotiated_by_aculead
+                       )
                 .join(TransporterModel, TransporterModel.trnsp_id == BidTransaction.transporter_id)
-                .outerjoin(LoadAssigned, LoadAssigned.la_bidding_load_id == BidTransaction.bid_id)
-                .filter(BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
+                .outerjoin(LoadAssigned, and_(LoadAssigned.la_bidding_load_id == BidTransaction.bid_id, LoadAssigned.la_transporter_id == BidTransaction.transporter_id))
+                .where(BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
+                .order_by(BidTransaction.rate, BidTransaction.created_at)
             )
 
             if transporter_id:
-                details = details.filter(BidTransaction.transporter_id == transporter_id)
+                details = details.where(BidTransaction.transporter_id == transporter_id)
                 
-            details = details.all()
-
-            log("BID DETAILS FOR ASSIGNMENT", details)
+            details = (await session.execute(details)).all()
 
-            for bid in details:
-                bid_details, transporter_name, load_assigned = bid
+            log("BID DETAILS FOR ASSIGNMENT", len(details))
 
-                obj = {
-                    "bid_details": bid_details,
-                    "transporter_name": transporter_name,
-                    "load_assigned": load_assigned
-                }
-                bid_detail_arr.append(obj)
-
-            log("Bid Details", bid_detail_arr)
-            res = structurize_assignment_data(bid_detail_arr)
-
-            if len(res) == 0:
-                return (True, [])
-
-            return (True, res[0])
+            return (True, structurize_assignment_data(details))
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
         finally:
-            session.close()
+            await session.close()
 
-    async def assign(self, bid_id: str, transporters: list, split: bool, status: str, user_id: str, authtoken: any) -> (list, str):
+    async def assign(self, bid_id: str, transporters: list, split: bool, status: str, user_id: str) -> (list, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -467,8 +339,8 @@ class Bid:
                 transporter_ids.append(
                     getattr(transporter, "la_transporter_id"))
 
-            transporter_details = session.query(LoadAssigned).filter(
-                LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.la_transporter_id.in_(transporter_ids)).all()
+            transporter_details = (await session.execute(select(LoadAssigned).where(
+                LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.la_transporter_id.in_(transporter_ids)))).scalars().all()
 
             for transporter_detail in transporter_details:
                 fetched_transporter_ids.append(
@@ -498,13 +370,13 @@ class Bid:
                             transporter, "price_difference_percent"),
                         no_of_fleets_assigned=getattr(
                             transporter, "no_of_fleets_assigned"),
-                        history=str(
-                            [(assignment_events["assign"], getattr(transporter, "no_of_fleets_assigned"), str(current_time), None)]),
                         is_assigned=True,
                         is_active=True,
                         created_by=user_id
                     )
                     assigned_transporters.append(assign_detail)
+                    assignment_log.record(session=session, bid_id=bid_id, transporter_id=getattr(transporter, "la_transporter_id"), event=assignment_events["assign"],
+                                          value=getattr(transporter, "no_of_fleets_assigned"), reason=None, event_time=current_time, user_id=user_id)
 
             for transporter_detail in transporter_details:
                 log("TRANSPORTERS TO BE UPDATED", transporters_to_be_updated)
@@ -528,165 +400,162 @@ class Bid:
                             setattr(transporter_detail, "is_assigned", True)
                             setattr(transporter_detail, "is_active", True)
                             setattr(transporter_detail,
-                                    "updated_at", str(current_time))
+                                    "updated_at", current_time)
                             setattr(transporter_detail, "updated_by", user_id)
-                            if not transporter_detail.history:
-                                setattr(transporter_detail, "history", str(
-                                    [(assignment_events["assign"],getattr(transporter, "no_of_fleets_assigned"), str(current_time), None)]))
-                            else:
-                                history_fetched = ast.literal_eval(
-                                    getattr(transporter_detail, "history"))
-                                task = (assignment_events["assign"],transporter.no_of_fleets_assigned,
-                                        str(current_time), None)
-                                history_fetched.append(task)
-                                setattr(transporter_detail, "history",
-                                        str(history_fetched))
-
-            bid_details = session.query(BiddingLoad).filter(
-                BiddingLoad.bl_id == bid_id).first()
+                            assignment_log.record(session=session, bid_id=bid_id, transporter_id=transporter_detail.la_transporter_id, event=assignment_events["assign"],
+                                                  value=transporter.no_of_fleets_assigned, reason=None, event_time=current_time, user_id=user_id)
+
+            bid_details = (await session.execute(select(BiddingLoad).where(
+                BiddingLoad.bl_id == bid_id))).scalars().first()
 
             if not bid_details:
                 return [], "Error While Fetching Bid Details"
 
             setattr(bid_details, "split", split)
             setattr(bid_details, "load_status", status)
-            setattr(bid_details, "updated_at", "NOW()")
+            setattr(bid_details, "updated_at", func.now())
 
             session.add_all(assigned_transporters)
-            session.commit()
 
-            assigned_transporters_ids = []
+            deep_link = "transporter_dashboard_pending" if status != "confirmed" else "transporter_dashboard_selected"
+
             if assigned_transporters or transporters_already_assigned:
+                await outbox.add(session=session, audience="transporter_kams", bid_id=bid_id, user_id=user_id,
+                                 transporter_ids=[assignment.la_transporter_id for assignment in assigned_transporters] + transporters_already_assigned,
+                                 text=f"Bid L-{bid_id[-5:].upper()} has been assigned to you! CONGRATS ...  NOW GO READY YOUR HORSES UP !!!",
+                                 type="Bid Assignment", deep_link=deep_link)
 
-                assigned_transporters_ids = [assignment.la_transporter_id for assignment in assigned_transporters]
-                assigned_transporters_ids = assigned_transporters_ids + transporters_already_assigned
-                (kam_ids, error) = await self.transporter_kams(transporter_ids=assigned_transporters_ids)
-                if error:
-                    return ([],error)
-                
-                (notification_response_success, notification_error) = await notification_service_manager(authtoken=authtoken, req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": kam_ids,
-                                                                                                                                                "text":f"Bid L-{bid_id[-5:].upper()} has been assigned to you! CONGRATS ...  NOW GO READY YOUR HORSES UP !!!",
-                                                                                                                                                "type":"Bid Assignment",
-                                                                                                                                                "deep_link":"transporter_dashboard_pending" if status != "confirmed" else "transporter_dashboard_selected"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                            )
-                log("ASSIGNMENT CREATION NOTIFICATION SERVICE ", notification_response_success)
-                if notification_error:
-                    log("::: NOTIFICATION ERROR DURING NEW BID ASSIGNMENT  ::: ",notification_error)
-                    
-                (kam_ids_for_updated_assignments, error) = await self.transporter_kams(transporter_ids=transporters_with_updated_assignment)
-                if error:
-                    return ([],error)
-                
-                (notification_response_success, notification_error) = await notification_service_manager(authtoken=authtoken, req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": kam_ids_for_updated_assignments,
-                                                                                                                                                "text":f"Assignment Details for Bid L-{bid_id[-5:].upper()} has been changed! GO CHECK IT OUT AND REMAIN UPDATED FOR THE TRIP !!!",
-                                                                                                                                                "type":"Bid Assignment",
-                                                                                                                                                "deep_link":"transporter_dashboard_pending" if status != "confirmed" else "transporter_dashboard_selected"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                            )
-                log("ASSIGNMENT UPDATION NOTIFICATION SERVICE ", notification_response_success)
-                if notification_error:
-                    log("::: NOTIFICATION ERROR DURING UPDATING BID ASSIGNMENT ::: ",notification_error)
-                
+                if transporters_with_updated_assignment:
+                    await outbox.add(session=session, audience="transporter_kams", bid_id=bid_id, user_id=user_id,
+                                     transporter_ids=transporters_with_updated_assignment,
+                                     text=f"Assignment Details for Bid L-{bid_id[-5:].upper()} has been changed! GO CHECK IT OUT AND REMAIN UPDATED FOR THE TRIP !!!",
+                                     type="Bid Assignment", deep_link=deep_link)
+
+            await session.commit()
+
+            if assigned_transporters or transporters_already_assigned:
                 return (assigned_transporters, "")
-            else:
-                return ([], "")
+
+            return ([], "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
 
         finally:
-            session.close()
+            await session.close()
 
-    def close(self, shipper_id: str | None=None):
+    async def close(self, shipper_id: str | None=None, bid_ids: list | None = None) -> (list, str):
 
-        session = Session()
+        session = AsyncSession()
         ist_timezone = pytz.timezone("Asia/Kolkata")
-        current_time = convert_date_to_string(datetime.now(ist_timezone))
+        current_time = datetime.now(ist_timezone).replace(tzinfo=None)
 
         try:
 
-            bids = session.query(BiddingLoad).filter(
-                BiddingLoad.is_active == True, BiddingLoad.load_status == "live")
-            
+            bids = (update(BiddingLoad)
+                    .where(BiddingLoad.is_active == True, BiddingLoad.load_status == "live", BiddingLoad.bid_end_time <= current_time)
+                    .values(load_status="pending", updated_at=func.now())
+                    .returning(BiddingLoad.bl_id)
+                    .execution_options(synchronize_session=False)
+                    )
+
             if shipper_id:
-                bids = bids.filter(BiddingLoad.bl_shipper_id == shipper_id)
-                
-            bids = bids.all()
-            
-            log("THE BIDS TO CLOSE:", bids)
+                bids = bids.where(BiddingLoad.bl_shipper_id == shipper_id)
+
+            if bid_ids:
+                bids = bids.where(BiddingLoad.bl_id.in_(bid_ids))
+
+            closed_bid_ids = [str(bid_id) for bid_id in (await session.execute(bids)).scalars().all()]
 
-            if not bids:
-                log("ERROR OCCURED DURING FETCH BIDS STATUSWISE TO CLOSE", bids)
-                return
+            await session.commit()
 
-            for bid in bids:
-                if convert_date_to_string(bid.bid_end_time) == current_time:
-                    setattr(bid, "load_status", "pending")
-                    setattr(bid, "updated_at", "NOW()")
-                    # redis.delete(sorted_set=bid)
+            log("BIDS CLOSED", closed_bid_ids)
 
-            session.commit()
+            await self.broadcast_status(bid_ids=closed_bid_ids, status="pending")
 
-            return
+            (_, error) = await redis.delete(bid_ids=closed_bid_ids)
+            if error:
+                log("ERROR DURING LIVE BID STATE CLEANUP", error)
+
+            return (closed_bid_ids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             log("ERROR DURING CLOSE BID", str(e))
-            return
+            return ([], str(e))
 
         finally:
-            session.close()
+            await session.close()
 
-    def move_from_pending_to_cancelled(self):
+    async def broadcast_status(self, bid_ids: list, status: str):
 
-        session = Session()
-        ist_timezone = pytz.timezone("Asia/Kolkata")
-        current_time = datetime.now(ist_timezone).replace(tzinfo=None)
+        for bid_id in bid_ids:
+            await manager.broadcast(bid_id=bid_id, message=orjson.dumps({"type": "status", "bid_id": bid_id, "load_status": status}).decode())
+
+    async def upcoming_transitions(self, until: datetime) -> (list, str):
+
+        session = AsyncSession()
 
         try:
 
-            bids = session.query(BiddingLoad).filter(
-                BiddingLoad.is_active == True, BiddingLoad.load_status == "pending")
+            to_initiate = (await session.execute(select(BiddingLoad.bl_id, BiddingLoad.bid_time).where(
+                BiddingLoad.is_active == True, BiddingLoad.load_status == "not_started", BiddingLoad.bid_time <= until))).all()
+
+            to_close = (await session.execute(select(BiddingLoad.bl_id, BiddingLoad.bid_end_time).where(
+                BiddingLoad.is_active == True, BiddingLoad.load_status == "live", BiddingLoad.bid_end_time <= until))).all()
+
+            transitions = [(str(bid_id), bid_time, "initiate") for (bid_id, bid_time) in to_initiate]
+            transitions += [(str(bid_id), bid_end_time, "close") for (bid_id, bid_end_time) in to_close]
 
-            bids = bids.all()
+            return (transitions, "")
 
-            log("THE BIDS TO MOVE FROM PENDING TO CANCELLED:", bids)
+        except Exception as e:
+            await session.rollback()
+            return ([], str(e))
+
+        finally:
+            await session.close()
+
+    async def move_from_pending_to_cancelled(self) -> (list, str):
+
+        session = AsyncSession()
+        ist_timezone = pytz.timezone("Asia/Kolkata")
+        current_time = datetime.now(ist_timezone).replace(tzinfo=None)
+
+        try:
+
+            bids = (update(BiddingLoad)
+                    .where(BiddingLoad.is_active == True, BiddingLoad.load_status == "pending", BiddingLoad.bid_end_time < current_time - timedelta(hours=72))
+                    .values(load_status="cancelled", updated_at=func.now())
+                    .returning(BiddingLoad.bl_id)
+                    .execution_options(synchronize_session=False)
+                    )
 
-            if not bids:
-                log("ERROR OCCURED DURING FETCH PENDING BIDS STATUSWISE TO MOVE TO CANCELLED", bids)
-                return
+            cancelled_bid_ids = [str(bid_id) for bid_id in (await session.execute(bids)).scalars().all()]
 
-            for bid in bids:
-                if (current_time - bid.bid_end_time).total_seconds() > 259200 : ##72 hours to seconds
-                    setattr(bid, "load_status", "cancelled")
-                    setattr(bid, "updated_at", "NOW()")
+            await session.commit()
 
-            session.commit()
+            log("BIDS MOVED FROM PENDING TO CANCELLED", cancelled_bid_ids)
 
-            return
+            return (cancelled_bid_ids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             log("ERROR DURING MOVING BID FROM PENDING TO CANCELLED ", str(e))
-            return
+            return ([], str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def setting_details(self, shipper_id: str) -> (bool, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            setting_details = session.query(BidSettings).filter(
-                BidSettings.bdsttng_shipper_id == shipper_id).first()
+            setting_details = (await session.execute(select(BidSettings).where(
+                BidSettings.bdsttng_shipper_id == shipper_id))).scalars().first()
 
             if not setting_details:
                 return (False, "Setting Details not Found")
@@ -694,19 +563,19 @@ class Bid:
             return (True, setting_details)
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def update_bid_end_time(self, bid_id: str, bid_end_time: datetime, extended_time: int) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            bid_details = session.query(BiddingLoad).filter(
-                BiddingLoad.bl_id == bid_id).first()
+            bid_details = (await session.execute(select(BiddingLoad).where(
+                BiddingLoad.bl_id == bid_id))).scalars().first()
 
             if not bid_details:
                 return False, "Error While Fetching Bid Details"
@@ -714,25 +583,25 @@ class Bid:
             setattr(bid_details, "bid_end_time", bid_end_time)
             setattr(bid_details, "bid_extended_time", extended_time)
 
-            session.commit()
+            await session.commit()
 
             return (True, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def live_details(self, bid_id: str) -> (bool, any):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            bid_details = session.execute(text(live_bid_details), params={
-                "bid_id": bid_id})
+            bid_details = (await session.execute(text(live_bid_details), params={
+                "bid_id": bid_id})).all()
 
             if not bid_details:
                 return ({}, "Error While Fetching Bid Details")
@@ -740,285 +609,163 @@ class Bid:
             return (bid_details, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
-    async def public(self, blocked_shippers: list, transporter_id: str, status: str | None = None) -> (any, str):
+    async def leaderboard(self, bid_id: str) -> (list, str):
+        # the live leaderboard of a bid that has no live state any more, in the same shape Redis serves it
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            statuses = ['pending', 'partially_confirmed'] if status == 'pending' else [status]
-
-            bids_query = (session
-                          .query(BiddingLoad,
-                                 ShipperModel.shpr_id,
-                                 ShipperModel.name,
-                                 ShipperModel.contact_no,
-                                 func.array_agg(MapLoadSrcDestPair.src_city), func.array_agg(MapLoadSrcDestPair.src_street_address), func.array_agg(MapLoadSrcDestPair.src_state), func.array_agg(MapLoadSrcDestPair.dest_street_address), func.array_agg(MapLoadSrcDestPair.dest_state),
-                                 func.array_agg(MapLoadSrcDestPair.dest_city),
-                                 func.array_agg(select(func.count())
-                                                            .where(
-                                                                TrackingFleet.tf_transporter_id == transporter_id,
-                                                                TrackingFleet.tf_bidding_load_id == BiddingLoad.bl_id,
-                                                                TrackingFleet.is_active == True  
-                                                            )
-                                                            .correlate(BiddingLoad)
-                                                            .subquery()
-                                                        ).label('tf_vehicle_count')
-                                 )
-                          .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
-                          .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                          .filter(BiddingLoad.is_active == True,  BiddingLoad.bid_mode == "open_market")
-                          )
-
-            if status:
-                bids_query = bids_query.filter(
-                    BiddingLoad.load_status.in_(statuses))
-
-            bids = bids_query.group_by(BiddingLoad, *BiddingLoad.__table__.c,
-                                       ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id ).all()
-            log("BIDS IN PUBLIC", bids)
-            if not bids:
-                return ([], "")
-
-            filtered_bids = []
-            for bid in bids:
-                (bid_load, shipper_id, _, _, _, _, _, _, _, _, _) = bid
-                if shipper_id not in blocked_shippers:
-                    filtered_bids.append(bid)
-                    log("BID LOAD ID::", bid_load.bl_id)
+            transporter_bids = (await session.execute(text(live_bid_state), params={
+                "bid_id": bid_id})).all()
 
-            return (structurize_transporter_bids(bids=filtered_bids), "")
+            return ([{
+                "transporter_id": str(transporter_bid.transporter_id),
+                "transporter_name": transporter_bid.transporter_name,
+                "comment": transporter_bid.comment or "",
+                "attempts": transporter_bid.attempts,
+                "rate": int(transporter_bid.rate)
+            } for transporter_bid in sorted(transporter_bids, key=lambda transporter_bid: (transporter_bid.rate, transporter_bid.created_at))], "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
-        finally:
-            session.close()
-
-    async def private(self, shippers: any, transporter_id: str, user_id: str, status: str | None = None) -> (any, str):
-
-        session = Session()
-
-        try:
-
-            statuses = ['pending', 'partially_confirmed'] if status == 'pending' else [status]
-
-            bids_query = (session
-                          .query(BiddingLoad,
-                                 ShipperModel.shpr_id,
-                                 ShipperModel.name,
-                                 ShipperModel.contact_no,
-                                 func.array_agg(MapLoadSrcDestPair.src_city), func.array_agg(MapLoadSrcDestPair.src_street_address), func.array_agg(MapLoadSrcDestPair.src_state), func.array_agg(MapLoadSrcDestPair.dest_street_address), func.array_agg(MapLoadSrcDestPair.dest_state),
-                                 func.array_agg(MapLoadSrcDestPair.dest_city),
-                                 func.array_agg(select(func.count())
-                                                            .where(
-                                                                TrackingFleet.tf_transporter_id == transporter_id,
-                                                                TrackingFleet.tf_bidding_load_id == BiddingLoad.bl_id,
-                                                                TrackingFleet.is_active == True  
-                                                                  )
-                                                            .correlate(BiddingLoad)
-                                                            .subquery()
-                                                ).label('tf_vehicle_count')
-                                 )
-                          .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
-                          .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                          .filter(BiddingLoad.is_active == True, 
-                                  BiddingLoad.bl_shipper_id.in_(shippers), 
-                                  BiddingLoad.bid_mode == "private_pool", 
-                                  BiddingLoad.bl_segment_id == None,
-                                  or_(BiddingLoad.bl_branch_id == None,
-                                      exists()
-                                      .where(
-                                            MapUser.mpus_shipper_id == BiddingLoad.bl_shipper_id,
-                                            MapUser.mpus_branch_id == BiddingLoad.bl_branch_id,
-                                            MapUser.mpus_user_id == user_id,
-                                            MapUser.is_active == True
-                                            )
-                                      )
-                                  )
-                          )
-
-            if status:
-                bids_query = bids_query.filter(
-                    BiddingLoad.load_status.in_(statuses))
 
-            bids = bids_query.group_by(BiddingLoad, *BiddingLoad.__table__.c,
-                                       ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id ).all()
+        finally:
+            await session.close()
 
-            if not bids:
-                return (bids, "")
-            return (structurize_transporter_bids(bids=bids), "")
+    async def visible(self, transporter_id: str, user_id: str, status: str | None = None) -> (any, str):
+        # every bid the transporter can see, resolved in one query over its cached eligibility:
+        #   open market bids, unless the transporter is partially blocked and blacklisted by the shipper
+        #   private bids of shippers the transporter is mapped to (and not blacklisted by)
+        #   private bids of segments the transporter is allowed in
+        # private bids of a branch are only visible to users mapped to that branch
 
-        except Exception as e:
-            session.rollback()
-            return ([], str(e))
-        finally:
-            session.close()
+        (transporter_eligibility, error) = await eligibility.transporter(transporter_id=transporter_id)
+        if error:
+            return ({}, error)
 
-    async def segment(self, shippers: any, transporter_id: str, user_id: str, status: str | None = None) -> (any, str):
+        (branch_ids, error) = await eligibility.branches(user_id=user_id)
+        if error:
+            return ({}, error)
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
             statuses = ['pending', 'partially_confirmed'] if status == 'pending' else [status]
 
-            (transporter_allowed_segments, error) = await self.segments(shippers= shippers, transporter_id= transporter_id)
-            
-            log("ERROR ::", error)
-            if error:
-                return([], error)
-            
-            bids_query = (session
-                          .query(BiddingLoad,
+            shipper_ids = [UUID(shipper_id) for shipper_id in transporter_eligibility["shipper_ids"]]
+            blocked_shipper_ids = [UUID(shipper_id) for shipper_id in transporter_eligibility["blocked_shipper_ids"]]
+            segment_ids = [UUID(segment_id) for segment_id in transporter_eligibility["segment_ids"]]
+            branch_ids = [UUID(branch_id) for branch_id in branch_ids]
+
+            bids_query = (select(BiddingLoad,
                                  ShipperModel.shpr_id,
                                  ShipperModel.name,
                                  ShipperModel.contact_no,
                                  func.array_agg(MapLoadSrcDestPair.src_city), func.array_agg(MapLoadSrcDestPair.src_street_address), func.array_agg(MapLoadSrcDestPair.src_state), func.array_agg(MapLoadSrcDestPair.dest_street_address), func.array_agg(MapLoadSrcDestPair.dest_state),
                                  func.array_agg(MapLoadSrcDestPair.dest_city),
-                                 func.array_agg(select(func.count())
-                                                            .where(
-                                                                TrackingFleet.tf_transporter_id == transporter_id,
-                                                                TrackingFleet.tf_bidding_load_id == BiddingLoad.bl_id,
-                                                                TrackingFleet.is_active == True  
-                                                                  )
-                                                            .correlate(BiddingLoad)
-                                                            .subquery()
-                                                ).label('tf_vehicle_count')
+                                 postgresql.array([select(func.count())
+                                                   .where(
+                                                       TrackingFleet.tf_transporter_id == transporter_id,
+                                                       TrackingFleet.tf_bidding_load_id == BiddingLoad.bl_id,
+                                                       TrackingFleet.is_active == True
+                                                   )
+                                                   .correlate(BiddingLoad)
+                                                   .scalar_subquery()
+                                                   ]).label('tf_vehicle_count')
                                  )
                           .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
                           .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                          .filter(BiddingLoad.is_active == True, 
-                                  BiddingLoad.bl_segment_id.in_(transporter_allowed_segments), 
-                                  BiddingLoad.bid_mode == "private_pool",
-                                  or_(BiddingLoad.bl_branch_id == None,
-                                      exists()
-                                      .where(
-                                            MapUser.mpus_shipper_id == BiddingLoad.bl_shipper_id,
-                                            MapUser.mpus_branch_id == BiddingLoad.bl_branch_id,
-                                            MapUser.mpus_user_id == user_id,
-                                            MapUser.is_active == True
-                                            )
-                                      )
-                                  )
+                          .where(BiddingLoad.is_active == True,
+                                 or_(
+                                     and_(BiddingLoad.bid_mode == "open_market",
+                                          BiddingLoad.bl_shipper_id.not_in(blocked_shipper_ids)),
+                                     and_(BiddingLoad.bid_mode == "private_pool",
+                                          or_(BiddingLoad.bl_branch_id == None, BiddingLoad.bl_branch_id.in_(branch_ids)),
+                                          or_(and_(BiddingLoad.bl_segment_id == None, BiddingLoad.bl_shipper_id.in_(shipper_ids)),
+                                              BiddingLoad.bl_segment_id.in_(segment_ids)))
+                                 ))
                           )
 
             if status:
-                bids_query = bids_query.filter(
+                bids_query = bids_query.where(
                     BiddingLoad.load_status.in_(statuses))
 
-            bids = bids_query.group_by(BiddingLoad, *BiddingLoad.__table__.c,
-                                       ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id ).all()
-
-            if not bids:
-                return (bids, "")
-            return (structurize_transporter_bids(bids=bids), "")
-
-        except Exception as e:
-            session.rollback()
-            return ([], str(e))
-        finally:
-            session.close()
-
-    async def segments(self, shippers: any, transporter_id: str) -> (any, str):
-
-        session = Session()
-
-        try:
-
-            shipper_segments = (
-                            session.query(Segment)
-                            .filter(Segment.is_active == True, Segment.seg_shipper_id.in_(shippers))
-                            .all()
-                            )
-
-            shipper_segment_ids = []
-            for shipper_segment in shipper_segments:
-                shipper_segment_ids.append(shipper_segment.seg_id)
-
-            log("SHIPPER SEGMENTS ::", shipper_segment_ids)
-
-            transporter_allowed_segments = (
-                            session.query(MapTransporterSegment)
-                            .filter(MapTransporterSegment.is_active == True, MapTransporterSegment.mts_segment_id.in_(shipper_segment_ids), MapTransporterSegment.mts_transporter_id == transporter_id)
-                            .all()
-                            )
-
-            transporter_allowed_segment_ids = []
+            # both are primary keys, every other selected column depends on them
+            bids = (await session.execute(bids_query.group_by(BiddingLoad.bl_id, ShipperModel.shpr_id))).all()
 
-            for transporter_allowed_segment in transporter_allowed_segments:
-                transporter_allowed_segment_ids.append(transporter_allowed_segment.mts_segment_id)
+            log("VISIBLE BIDS", len(bids))
 
-            log("TRANSPORTED ALLOWED SEGMENTS :", transporter_allowed_segment_ids)
+            visible_bids = {"public": [], "private": []}
+            for bid in structurize_transporter_bids(bids=bids):
+                visible_bids["public" if bid["bid_mode"] == "open_market" else "private"].append(bid)
 
-            if not transporter_allowed_segment_ids:
-                return ([],"")
+            return (visible_bids, "")
 
-            return (transporter_allowed_segment_ids, "")
-            
         except Exception as e:
-            session.rollback()
-            return ([], str(e))
+            await session.rollback()
+            return ({}, str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def bidding_details(self, bid_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            bids = (session
-                    .query(BidTransaction)
-                    .filter(BidTransaction.bid_id == bid_id, BidTransaction.is_active == True, BidTransaction.rate > 0)
-                    .all()
-                    )
+            bids = (await session.execute(
+                    select(BidTransaction)
+                    .where(BidTransaction.bid_id == bid_id, BidTransaction.is_active == True, BidTransaction.rate > 0)
+                    )).scalars().all()
 
             return (bids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def stats(self, filter: FilterBidsRequest):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            query = session.query(BiddingLoad).filter(
+            query = select(BiddingLoad).where(
                 BiddingLoad.is_active == True)
 
             query = add_filter(query=query, filter=filter)
 
-            bids = query.all()
+            bids = (await session.execute(query)).scalars().all()
 
             return (structurize_bidding_stats(bids=bids), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def cancellation_reasons(self, filter: FilterBidsRequest):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            query = session.query(BiddingLoad.bl_cancellation_reason, func.count(BiddingLoad.bl_cancellation_reason)).filter(
+            query = select(BiddingLoad.bl_cancellation_reason, func.count(BiddingLoad.bl_cancellation_reason)).where(
                 BiddingLoad.load_status == "cancelled", BiddingLoad.is_active == True).group_by(BiddingLoad.bl_cancellation_reason)
 
             query = add_filter(query=query, filter=filter)
 
-            cancellations = query.all()
+            cancellations = (await session.execute(query)).all()
 
             log("CANCELLATION", cancellations)
             if not cancellations:
@@ -1033,14 +780,14 @@ class Bid:
             return (result, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def transporter_analysis(self, filter: FilterBidsRequest):
 
-        session = Session()
+        session = AsyncSession()
         results = []
 
         try:
@@ -1079,7 +826,7 @@ class Bid:
                 'to_date': filter.to_date,
             }
 
-            transporters = session.execute(query, params=params).all()
+            transporters = (await session.execute(query, params=params)).all()
 
             if not transporters:
                 return ([], "")
@@ -1100,40 +847,40 @@ class Bid:
             return (results, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def confirmed_cancelled_bid_trend_stats(self, filter: FilterBidsRequest, type: str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            query = session.query(BiddingLoad).filter(BiddingLoad.load_status.in_(
+            query = select(BiddingLoad).where(BiddingLoad.load_status.in_(
                 ['confirmed', 'cancelled']), BiddingLoad.is_active == True)
 
             query = add_filter(query=query, filter=filter)
 
-            bids = query.all()
+            bids = (await session.execute(query)).scalars().all()
 
             return (structurize_confirmed_cancelled_trip_trend_stats(bids=bids, filter=filter, type=type), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def assigned_load_details(self, bid_ids: any, transporter_id: str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
             load_assignment_details = []
 
-            assigned_load_details = session.query(LoadAssigned).filter(LoadAssigned.la_bidding_load_id.in_(bid_ids), LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active).all()
+            assigned_load_details = (await session.execute(select(LoadAssigned).where(LoadAssigned.la_bidding_load_id.in_(bid_ids), LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active))).scalars().all()
 
             for bid_id in bid_ids:
                 assigned_load_details_for_bid_id = next((assigned_load for assigned_load in assigned_load_details if assigned_load.la_bidding_load_id == bid_id), None)
@@ -1169,14 +916,14 @@ class Bid:
                 
             return (load_assignment_details, "")
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def transporter_kams(self, bid_id: str | None=None, bid_mode: str | None=None, shipper_id: str | None=None, segment_id: str | None=None, indent_transporter_id: str | None=None, transporter_ids: list | None=[]) -> (any,str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -1187,14 +934,12 @@ class Bid:
 
                 if bid_mode == "open_market":
 
-                    transporters = (session
-                                    .query(TransporterModel)
-                                    .filter(TransporterModel.is_active == True, 
+                    transporters = (await session.execute(select(TransporterModel)
+                                    .where(TransporterModel.is_active == True, 
                                             TransporterModel.status!='blocked',
                                             not_(
-                                                    (session
-                                                    .query(BlacklistTransporter)
-                                                    .filter(BlacklistTransporter.bt_shipper_id == shipper_id,
+                                                    (select(BlacklistTransporter)
+                                                    .where(BlacklistTransporter.bt_shipper_id == shipper_id,
                                                             BlacklistTransporter.bt_transporter_id == TransporterModel.trnsp_id,
                                                             BlacklistTransporter.is_active == True
                                                             )
@@ -1202,22 +947,19 @@ class Bid:
                                                     )
                                                 )
                                             )
-                                    .all()
-                                    )
+                                    )).scalars().all()
 
                     transporter_ids = [transporter.trnsp_id for transporter in transporters]
 
                 elif bid_mode == "private_pool":
 
                     if not segment_id:
-                        transporters =(session
-                                        .query(MapShipperTransporter)
-                                        .filter(MapShipperTransporter.mst_shipper_id == shipper_id,
+                        transporters =(await session.execute(select(MapShipperTransporter)
+                                        .where(MapShipperTransporter.mst_shipper_id == shipper_id,
                                                 MapShipperTransporter.is_active == True,
                                                 not_(
-                                                        (session
-                                                        .query(BlacklistTransporter)
-                                                        .filter(BlacklistTransporter.bt_shipper_id == shipper_id,
+                                                        (select(BlacklistTransporter)
+                                                        .where(BlacklistTransporter.bt_shipper_id == shipper_id,
                                                                 BlacklistTransporter.bt_transporter_id == MapShipperTransporter.mst_transporter_id,
                                                                 BlacklistTransporter.is_active == True
                                                                 )
@@ -1225,19 +967,16 @@ class Bid:
                                                         )
                                                     )
                                                 )
-                                        .all()
-                                        )
+                                        )).scalars().all()
                         transporter_ids = [transporter.mst_transporter_id for transporter in transporters]
 
                     if segment_id:
-                        transporters =(session
-                                        .query(MapTransporterSegment)
-                                        .filter(MapTransporterSegment.mts_segment_id == segment_id,
+                        transporters =(await session.execute(select(MapTransporterSegment)
+                                        .where(MapTransporterSegment.mts_segment_id == segment_id,
                                                 MapTransporterSegment.is_active == True,
                                                 not_(
-                                                        (session
-                                                        .query(BlacklistTransporter)
-                                                        .filter(BlacklistTransporter.bt_shipper_id == shipper_id,
+                                                        (select(BlacklistTransporter)
+                                                        .where(BlacklistTransporter.bt_shipper_id == shipper_id,
                                                                 BlacklistTransporter.bt_transporter_id == MapTransporterSegment.mts_transporter_id,
                                                                 BlacklistTransporter.is_active == True
                                                                 )
@@ -1245,45 +984,77 @@ class Bid:
                                                         )
                                                     )
                                                 )
-                                        .all()
-                                        )
+                                        )).scalars().all()
                         transporter_ids = [transporter.mts_transporter_id for transporter in transporters]
 
                 elif bid_mode == "indent":
 
-                    transporter_ids = transporter_ids.append(indent_transporter_id)
+                    transporter_ids = [indent_transporter_id]
 
-            kam_details = (session
-                            .query(User)
-                            .filter(User.user_transporter_id.in_(transporter_ids),
+            kam_details = (await session.execute(select(User)
+                            .where(User.user_transporter_id.in_(transporter_ids),
                                     User.user_type == 'trns',
                                     User.is_active == True
                                     )
-                            .all()
-                        )
+                        )).scalars().all()
             
             kam_ids = [str(user.user_id) for user in kam_details]
 
             return (kam_ids, "")
         except Exception as e:
-            session.rollback()
+            await session.rollback()
+            return ([], str(e))
+        finally:
+            await session.close()
+
+    async def open_market_kams(self, shipper_id: str, after: str | None = None, limit: int = 500) -> (list, str):
+
+        # a page of the KAMs of every transporter an open market bid of the shipper reaches, in user_id order
+        session = AsyncSession()
+
+        try:
+            query = (select(User.user_id)
+                     .join(TransporterModel, TransporterModel.trnsp_id == User.user_transporter_id)
+                     .where(User.user_type == 'trns',
+                            User.is_active == True,
+                            TransporterModel.is_active == True,
+                            TransporterModel.status != 'blocked',
+                            not_(
+                                    (select(BlacklistTransporter.bt_id)
+                                    .where(BlacklistTransporter.bt_shipper_id == shipper_id,
+                                            BlacklistTransporter.bt_transporter_id == TransporterModel.trnsp_id,
+                                            BlacklistTransporter.is_active == True
+                                            )
+                                    .exists()
+                                    )
+                                )
+                            )
+                     .order_by(User.user_id)
+                     .limit(limit))
+
+            if after:
+                query = query.where(User.user_id > UUID(after))
+
+            kam_ids = [str(user_id) for user_id in (await session.execute(query)).scalars().all()]
+
+            return (kam_ids, "")
+        except Exception as e:
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def shipper_users(self, bid_ids:list | None=[]) -> (any,str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             
-            bid_details = (session
-                            .query(BiddingLoad)
-                            .filter(BiddingLoad.bl_id.in_(bid_ids),
+            bid_details = (await session.execute(select(BiddingLoad)
+                            .where(BiddingLoad.bl_id.in_(bid_ids),
                                     BiddingLoad.is_active == True
                                     )
-                            .all()
-                        )
+                        )).scalars().all()
             
             for each in bid_details:
                 print("BID DETAILS :::: ", each, each.bl_shipper_id)
@@ -1292,19 +1063,17 @@ class Bid:
                 shipper_ids = [str(bid_detail.bl_shipper_id) for bid_detail in bid_details]
 
             print("SHIPPER IDS ::::: ", shipper_ids)
-            user_details = (session
-                            .query(User)
-                            .filter(User.user_shipper_id.in_(shipper_ids),
+            user_details = (await session.execute(select(User)
+                            .where(User.user_shipper_id.in_(shipper_ids),
                                     User.is_active == True
                                     )
-                            .all()
-                        )
+                        )).scalars().all()
             
             user_ids = [str(user.user_id) for user in user_details]
 
             return (user_ids, "")
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
\ No newline at end of file
+            await session.close()
\ No newline at end of file
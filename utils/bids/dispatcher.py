@@ -0,0 +1,298 @@
+import asyncio
+import os
+import pytz
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from config.db_config import AsyncSession
+from models.models import NotificationOutbox
+from utils.bids.bidding import Bid
+from utils.notification_service_manager import notification_service_manager, NotificationServiceManagerReq
+from utils.utilities import log
+
+bid = Bid()
+
+
+class Dispatcher:
+
+    # Drains t_notification_outbox on the scheduler leader. Due notifications are claimed a batch at a
+    # time in a short transaction (SKIP LOCKED, marked as sending), sent with no transaction open, and
+    # their outcome recorded in a second short transaction, so a slow notification service never holds
+    # a database connection. Identical notifications in a batch are merged into one request to the
+    # deduplicated union of their receivers. Failed deliveries are retried with exponential backoff and
+    # jitter until they run out of attempts, and a claim whose outcome was never recorded (the leader
+    # died mid-send) is taken over once it lapses.
+    # Open market bids reach every transporter, so their notifications are not resolved up front but
+    # fanned out: KAMs are paged in user_id order and each page is sent as its own request, a bounded
+    # number at a time. The fan-out checkpoints the last KAM of the leading run of delivered chunks, so
+    # a retry only resends from the first chunk that failed.
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+        self.poll_interval = float(os.getenv("OUTBOX_POLL_INTERVAL", 1))
+        self.max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+        self.backoff = float(os.getenv("OUTBOX_BACKOFF", 5))
+        self.max_backoff = float(os.getenv("OUTBOX_MAX_BACKOFF", 900))
+        self.claim_timeout = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", 300))
+        # the dispatcher's own credential, user tokens are never stored with the notifications
+        self.authtoken = os.getenv("NOTIFICATION_SERVICE_TOKEN")
+        self.chunk_size = int(os.getenv("OUTBOX_FANOUT_CHUNK_SIZE", 500))
+        self.concurrency = int(os.getenv("OUTBOX_FANOUT_CONCURRENCY", 4))
+
+    def now(self) -> datetime:
+        return datetime.now(pytz.timezone("Asia/Kolkata")).replace(tzinfo=None)
+
+    def start(self):
+        if not self.authtoken:
+            # notifications stay queued until the dispatcher is given its credential
+            log("NOTIFICATION DISPATCHER NOT STARTED", "NOTIFICATION_SERVICE_TOKEN is not set")
+            return
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    async def receivers(self, notification: NotificationOutbox, bid_details: any = None) -> (list, str):
+
+        if notification.audience == "bid_kams":
+            return await bid.transporter_kams(bid_id=bid_details.bl_id, bid_mode=bid_details.bid_mode, shipper_id=bid_details.bl_shipper_id,
+                                              segment_id=bid_details.bl_segment_id, indent_transporter_id=bid_details.indent_transporter_id)
+
+        if notification.audience == "transporter_kams":
+            return await bid.transporter_kams(transporter_ids=notification.transporter_ids or [])
+
+        if notification.audience == "shipper_users":
+            return await bid.shipper_users(bid_ids=[notification.no_bidding_load_id])
+
+        return ([], f"Unknown notification audience {notification.audience}")
+
+    async def send(self, receiver_ids: list, message: str, type: str | None, deep_link: str) -> str:
+
+        (response, error) = await notification_service_manager(authtoken=self.authtoken, req=NotificationServiceManagerReq(
+            receiver_ids=receiver_ids, text=message, type=type, deep_link=deep_link))
+
+        if not error and not response.is_success:
+            error = f"Notification service responded with {response.status_code}"
+
+        return error
+
+    async def fan_out(self, notification: NotificationOutbox, bid_details: any) -> str:
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = []
+
+        async def deliver(index: int, receiver_ids: list) -> str:
+            try:
+                chunk_started_at = loop.time()
+                error = await self.send(receiver_ids=receiver_ids, message=notification.message, type=notification.type,
+                                        deep_link=notification.deep_link)
+                log("NOTIFICATION CHUNK", {"id": notification.no_id, "chunk": index, "receivers": len(receiver_ids),
+                                           "delivered": not error, "ms": round((loop.time() - chunk_started_at) * 1000), "error": error})
+                return error
+            finally:
+                semaphore.release()
+
+        after = notification.fanout_cursor
+        error = ""
+
+        try:
+            while True:
+                # paging waits for a free slot, so only `concurrency` chunks are held in memory at once
+                await semaphore.acquire()
+
+                (receiver_ids, error) = await bid.open_market_kams(shipper_id=bid_details.bl_shipper_id, after=after, limit=self.chunk_size)
+
+                if error or not receiver_ids:
+                    semaphore.release()
+                    break
+
+                chunks.append((receiver_ids[-1], len(receiver_ids), asyncio.create_task(deliver(len(chunks), receiver_ids))))
+                after = receiver_ids[-1]
+
+                if len(receiver_ids) < self.chunk_size:
+                    break
+
+        finally:
+            errors = await asyncio.gather(*(task for (_, _, task) in chunks), return_exceptions=True)
+
+        errors = [str(chunk_error) if isinstance(chunk_error, Exception) else chunk_error for chunk_error in errors]
+
+        for ((last_receiver_id, _, _), chunk_error) in zip(chunks, errors):
+            if chunk_error:
+                break
+            notification.fanout_cursor = last_receiver_id
+
+        failed = [chunk_error for chunk_error in errors if chunk_error]
+
+        log("NOTIFICATION FAN-OUT", {"id": notification.no_id, "chunks": len(chunks), "failed_chunks": len(failed),
+                                     "receivers": sum(receivers for (_, receivers, _) in chunks),
+                                     "delivered": sum(receivers for ((_, receivers, _), chunk_error) in zip(chunks, errors) if not chunk_error),
+                                     "ms": round((loop.time() - started_at) * 1000)})
+
+        return error or (failed[0] if failed else "")
+
+    def sent(self, notification: NotificationOutbox, current_time: datetime):
+        notification.status = "sent"
+        notification.attempts += 1
+        notification.sent_at = current_time
+        notification.last_error = None
+
+    def retry(self, notification: NotificationOutbox, error: str, current_time: datetime):
+
+        notification.status = "pending"
+        notification.attempts += 1
+        notification.last_error = error
+
+        if notification.attempts >= self.max_attempts:
+            log("NOTIFICATION DELIVERY FAILED", {"id": notification.no_id, "attempts": notification.attempts, "error": error})
+            notification.status = "failed"
+            return
+
+        delay = min(self.backoff * 2 ** (notification.attempts - 1), self.max_backoff)
+        notification.next_attempt_at = current_time + timedelta(seconds=delay * random.uniform(0.5, 1))
+
+    async def claim(self, current_time: datetime) -> (list, str):
+
+        session = AsyncSession()
+
+        try:
+            notifications = (await session.execute(select(NotificationOutbox)
+                                                   .where(NotificationOutbox.status.in_(["pending", "sending"]), NotificationOutbox.next_attempt_at <= current_time)
+                                                   .order_by(NotificationOutbox.next_attempt_at)
+                                                   .limit(self.batch_size)
+                                                   .with_for_update(skip_locked=True)
+                                                   )).scalars().all()
+
+            for notification in notifications:
+                notification.status = "sending"
+                notification.next_attempt_at = current_time + timedelta(seconds=self.claim_timeout)
+
+            await session.commit()
+
+            return (notifications, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ([], str(e))
+
+        finally:
+            await session.close()
+
+    async def record(self, notifications: list) -> (bool, str):
+
+        session = AsyncSession()
+
+        try:
+            for notification in notifications:
+                await session.execute(update(NotificationOutbox)
+                                      .where(NotificationOutbox.no_id == notification.no_id, NotificationOutbox.status == "sending")
+                                      .values(status=notification.status,
+                                              attempts=notification.attempts,
+                                              next_attempt_at=notification.next_attempt_at,
+                                              sent_at=notification.sent_at,
+                                              last_error=notification.last_error,
+                                              fanout_cursor=notification.fanout_cursor,
+                                              updated_at=self.now()))
+
+            await session.commit()
+
+            return (True, "")
+
+        except Exception as e:
+            await session.rollback()
+            return (False, str(e))
+
+        finally:
+            await session.close()
+
+    async def dispatch(self) -> (int, str):
+
+        current_time = self.now()
+
+        (notifications, error) = await self.claim(current_time)
+        if error:
+            return (0, error)
+
+        batches = {}
+        fanned_out = 0
+        for notification in notifications:
+
+            bid_details = None
+            if notification.audience == "bid_kams":
+                (success, bid_details) = await bid.details(bid_id=notification.no_bidding_load_id)
+                if not success:
+                    self.retry(notification, bid_details, current_time)
+                    continue
+
+            if bid_details is not None and bid_details.bid_mode == "open_market":
+                error = await self.fan_out(notification, bid_details)
+                if error:
+                    self.retry(notification, error, current_time)
+                else:
+                    self.sent(notification, current_time)
+                fanned_out += 1
+                continue
+
+            (receiver_ids, error) = await self.receivers(notification, bid_details)
+            if error:
+                self.retry(notification, error, current_time)
+                continue
+
+            batch = batches.setdefault((notification.message, notification.type, notification.deep_link),
+                                       {"notifications": [], "receiver_ids": set()})
+            batch["notifications"].append(notification)
+            batch["receiver_ids"].update(receiver_ids)
+
+        for ((message, type, deep_link), batch) in batches.items():
+
+            error = ""
+            if batch["receiver_ids"]:
+                error = await self.send(receiver_ids=sorted(batch["receiver_ids"]), message=message, type=type, deep_link=deep_link)
+
+            for notification in batch["notifications"]:
+                if error:
+                    self.retry(notification, error, current_time)
+                else:
+                    self.sent(notification, current_time)
+
+        (_, error) = await self.record(notifications)
+        if error:
+            return (len(notifications), error)
+
+        if notifications:
+            log("NOTIFICATIONS DISPATCHED", {"notifications": len(notifications), "requests": len(batches), "fanned_out": fanned_out})
+
+        return (len(notifications), "")
+
+    async def run(self):
+
+        while True:
+            try:
+                (dispatched, error) = await self.dispatch()
+
+                if error:
+                    log("ERROR IN NOTIFICATION DISPATCHER", error)
+
+                # keep draining while there is a backlog
+                if error or dispatched < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("ERROR IN NOTIFICATION DISPATCHER", str(e))
+                await asyncio.sleep(self.poll_interval)
+
+
+dispatcher = Dispatcher()
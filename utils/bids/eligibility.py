@@ -0,0 +1,139 @@
+import orjson
+import os
+
+from sqlalchemy import select
+
+from config.db_config import AsyncSession
+from config.redis import r as redis
+from models.models import (BlacklistTransporter, MapShipperTransporter, MapTransporterSegment,
+                           MapUser, Segment, TransporterModel)
+from utils.utilities import log
+
+
+class Eligibility:
+
+    # Which shippers, segments and branches a transporter can bid for changes rarely, but is needed on
+    # every listing and rate submission. It is derived from the mapping tables once and cached in Redis
+    # for all workers, until it expires or is invalidated by whoever changes the mappings.
+    # transporter:{transporter_id}:eligibility holds the shippers the transporter is mapped to and not
+    # blocked by, every shipper it is mapped to (whose private pool bids it may rate, blocked or not),
+    # the shippers blocking it from their open market bids and its allowed segments.
+    # user:{user_id}:branches holds the branches a user is mapped to.
+
+    def __init__(self):
+        self.ttl = int(os.getenv("ELIGIBILITY_CACHE_TTL", 300))
+
+    def transporter_key(self, transporter_id: str) -> str:
+        return f"transporter:{transporter_id}:eligibility:v2"
+
+    def user_key(self, user_id: str) -> str:
+        return f"user:{user_id}:branches"
+
+    async def cached(self, key: str) -> any:
+        try:
+            cached = await redis.get(key)
+            return orjson.loads(cached) if cached else None
+        except Exception as e:
+            log("ELIGIBILITY CACHE UNAVAILABLE", str(e))
+            return None
+
+    async def cache(self, key: str, value: any):
+        try:
+            await redis.set(key, orjson.dumps(value), ex=self.ttl)
+        except Exception as e:
+            log("ELIGIBILITY CACHE UNAVAILABLE", str(e))
+
+    async def transporter(self, transporter_id: str) -> (dict, str):
+
+        key = self.transporter_key(transporter_id)
+
+        eligibility = await self.cached(key)
+        if eligibility is not None:
+            return (eligibility, "")
+
+        session = AsyncSession()
+
+        try:
+            transporter = (await session.execute(select(TransporterModel.status)
+                                                 .where(TransporterModel.trnsp_id == transporter_id, TransporterModel.is_active == True)
+                                                 )).first()
+
+            eligibility = {"shipper_ids": [], "mapped_shipper_ids": [], "blocked_shipper_ids": [], "segment_ids": []}
+
+            if transporter:
+
+                mapped_shipper_ids = (await session.execute(select(MapShipperTransporter.mst_shipper_id)
+                                                            .where(MapShipperTransporter.mst_transporter_id == transporter_id, MapShipperTransporter.is_active == True)
+                                                            )).scalars().all()
+
+                blocked_shipper_ids = set()
+                if transporter.status == "partially_blocked":
+                    blocked_shipper_ids = set((await session.execute(select(BlacklistTransporter.bt_shipper_id)
+                                                                     .where(BlacklistTransporter.bt_transporter_id == transporter_id, BlacklistTransporter.is_active == True)
+                                                                     )).scalars().all())
+
+                shipper_ids = {shipper_id for shipper_id in mapped_shipper_ids if shipper_id not in blocked_shipper_ids}
+
+                segments = (await session.execute(select(Segment.seg_id, Segment.seg_shipper_id)
+                                                  .join(MapTransporterSegment, MapTransporterSegment.mts_segment_id == Segment.seg_id)
+                                                  .where(MapTransporterSegment.mts_transporter_id == transporter_id, MapTransporterSegment.is_active == True, Segment.is_active == True)
+                                                  )).all()
+
+                eligibility = {
+                    "shipper_ids": [str(shipper_id) for shipper_id in shipper_ids],
+                    "mapped_shipper_ids": [str(shipper_id) for shipper_id in set(mapped_shipper_ids)],
+                    "blocked_shipper_ids": [str(shipper_id) for shipper_id in blocked_shipper_ids if shipper_id],
+                    "segment_ids": [str(segment.seg_id) for segment in segments if segment.seg_shipper_id in shipper_ids]
+                }
+
+            log("TRANSPORTER ELIGIBILITY", eligibility)
+
+            await self.cache(key, eligibility)
+
+            return (eligibility, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ({}, str(e))
+        finally:
+            await session.close()
+
+    async def branches(self, user_id: str) -> (list, str):
+
+        key = self.user_key(user_id)
+
+        branch_ids = await self.cached(key)
+        if branch_ids is not None:
+            return (branch_ids, "")
+
+        session = AsyncSession()
+
+        try:
+            branch_ids = (await session.execute(select(MapUser.mpus_branch_id)
+                                                .where(MapUser.mpus_user_id == user_id, MapUser.is_active == True, MapUser.mpus_branch_id != None)
+                                                )).scalars().all()
+
+            branch_ids = [str(branch_id) for branch_id in set(branch_ids)]
+
+            await self.cache(key, branch_ids)
+
+            return (branch_ids, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ([], str(e))
+        finally:
+            await session.close()
+
+    async def invalidate(self, transporter_ids: list | None = None, user_ids: list | None = None) -> (int, str):
+
+        keys = [self.transporter_key(transporter_id) for transporter_id in transporter_ids or []] + \
+            [self.user_key(user_id) for user_id in user_ids or []]
+
+        if not keys:
+            return (0, "")
+
+        try:
+            return (await redis.unlink(*keys), "")
+        except Exception as e:
+            return (0, str(e))
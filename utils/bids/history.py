@@ -0,0 +1,64 @@
+import ast
+from datetime import datetime
+
+from sqlalchemy import select
+
+from data.bidding import assignment_events
+from models.models import AssignmentEvent
+from utils.utilities import log
+
+
+class AssignmentHistory:
+
+    # Every assignment and price match event of a transporter in a bid is a row in t_assignment_event,
+    # appended in the same transaction as the change it records, and read back newest first with the
+    # (bid, transporter, time) index. Rows of t_load_assigned written before the table existed still
+    # carry their events in the history string, which is read alongside until it is backfilled.
+
+    def record(self, session: any, bid_id: str, transporter_id: str, event: str, value: float | None, reason: str | None, event_time: datetime, user_id: str):
+        session.add(AssignmentEvent(
+            ae_bidding_load_id=bid_id,
+            ae_transporter_id=transporter_id,
+            event=event,
+            value=value,
+            reason=reason,
+            event_time=event_time,
+            created_by=user_id
+        ))
+
+    def legacy(self, history: str | None) -> list:
+        # (event, value, time, reason) tuples, oldest first. The oldest rows have no event name,
+        # a value of zero vehicles meant the transporter was unassigned.
+        if not history:
+            return []
+
+        events = []
+        for event in ast.literal_eval(history):
+            if len(event) == 3:
+                (value, event_time, reason) = event
+                event = (assignment_events["unassign"] if value == 0 else assignment_events["assign"], value, event_time, reason)
+            events.append(tuple(event))
+
+        return events
+
+    async def events(self, session: any, bid_id: str, transporter_id: str, legacy_history: str | None = None, names: list | None = None) -> list:
+        # (event, value, time, reason) tuples, newest first
+
+        query = (select(AssignmentEvent.event, AssignmentEvent.value, AssignmentEvent.event_time, AssignmentEvent.reason)
+                 .where(AssignmentEvent.ae_bidding_load_id == bid_id, AssignmentEvent.ae_transporter_id == transporter_id, AssignmentEvent.is_active == True)
+                 .order_by(AssignmentEvent.event_time.desc(), AssignmentEvent.created_at.desc()))
+
+        if names:
+            query = query.where(AssignmentEvent.event.in_(names))
+
+        events = []
+        for (event, value, event_time, reason) in (await session.execute(query)).all():
+            if event in (assignment_events["assign"], assignment_events["unassign"]) and value is not None:
+                value = int(value)
+            events.append((event, value, str(event_time), reason))
+
+        legacy_events = [event for event in self.legacy(legacy_history)[::-1] if not names or event[0] in names]
+
+        log("ASSIGNMENT EVENTS", {"events": len(events), "legacy_events": len(legacy_events)})
+
+        return events + legacy_events
@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import orjson
+import os
+import pytz
+from datetime import datetime, timedelta
+
+from config.redis import r as redis
+from utils.bids.bidding import Bid
+from utils.utilities import log
+
+bid = Bid()
+
+
+class Lifecycle:
+
+    # Bids go live at bid_time and close at bid_end_time. Instead of polling every minute, the
+    # transitions coming up within the horizon are kept in a priority queue ordered by the time
+    # they are due, and the scheduler sleeps until the next one. The horizon is refilled with an
+    # indexed range query, which also picks up bids created elsewhere and transitions missed while
+    # the server was down. Transitions are guarded in SQL, so a stale entry (e.g. for a bid whose end
+    # time was extended) fires as a no-op.
+    # Only the scheduler leader runs it, so transitions requested on other instances are published
+    # over Redis and picked up by the leader's listener.
+
+    def __init__(self):
+        self.queue: list = []
+        self.scheduled: dict = {}
+        self.wake = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.listener: asyncio.Task | None = None
+        self.channel = "bid:lifecycle"
+        self.horizon = int(os.getenv("LIFECYCLE_HORIZON", 120))
+        self.refill_interval = int(os.getenv("LIFECYCLE_REFILL_INTERVAL", 60))
+
+    def now(self) -> datetime:
+        return datetime.now(pytz.timezone("Asia/Kolkata")).replace(tzinfo=None)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        self.listener = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        for task in (self.listener, self.task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.task = self.listener = None
+
+    async def request(self, bid_id: str, fire_at: datetime, transition: str):
+        # may be called on any instance, the leader schedules it
+        try:
+            await redis.publish(self.channel, orjson.dumps({"bid_id": bid_id, "fire_at": fire_at, "transition": transition}))
+        except Exception as e:
+            # the leader's next refill picks it up from the database anyway
+            log("ERROR WHILE PUBLISHING BID TRANSITION", str(e))
+
+    async def listen(self):
+        while True:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        transition = orjson.loads(message["data"])
+                        self.schedule(bid_id=transition["bid_id"], fire_at=datetime.fromisoformat(transition["fire_at"]), transition=transition["transition"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("BID LIFECYCLE LISTENER DISCONNECTED", str(e))
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    def schedule(self, bid_id: str, fire_at: datetime, transition: str):
+
+        if self.scheduled.get((bid_id, transition)) == fire_at:
+            return
+
+        log("SCHEDULING BID TRANSITION", {"bid_id": bid_id, "transition": transition, "at": fire_at})
+
+        self.scheduled[(bid_id, transition)] = fire_at
+        heapq.heappush(self.queue, (fire_at, bid_id, transition))
+        self.wake.set()
+
+    async def refill(self):
+
+        (transitions, error) = await bid.upcoming_transitions(until=self.now() + timedelta(seconds=self.horizon))
+
+        if error:
+            log("ERROR WHILE FETCHING UPCOMING BID TRANSITIONS", error)
+            return
+
+        for (bid_id, fire_at, transition) in transitions:
+            self.schedule(bid_id=bid_id, fire_at=fire_at, transition=transition)
+
+    async def fire(self):
+
+        due = {"initiate": [], "close": []}
+        current_time = self.now()
+
+        while self.queue and self.queue[0][0] <= current_time:
+            (fire_at, bid_id, transition) = heapq.heappop(self.queue)
+            if self.scheduled.get((bid_id, transition)) == fire_at:
+                del self.scheduled[(bid_id, transition)]
+            due[transition].append(bid_id)
+
+        if due["initiate"]:
+            log("INITIATING BIDS", due["initiate"])
+            await bid.initiate(bid_ids=due["initiate"])
+
+        if due["close"]:
+            log("CLOSING BIDS", due["close"])
+            await bid.close(bid_ids=due["close"])
+
+    async def run(self):
+
+        loop = asyncio.get_running_loop()
+        next_refill = loop.time()
+
+        while True:
+            try:
+                if loop.time() >= next_refill:
+                    await self.refill()
+                    next_refill = loop.time() + self.refill_interval
+
+                await self.fire()
+
+                timeout = next_refill - loop.time()
+                if self.queue:
+                    timeout = min(timeout, (self.queue[0][0] - self.now()).total_seconds())
+
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("ERROR IN BID LIFECYCLE SCHEDULER", str(e))
+                await asyncio.sleep(1)
+
+
+lifecycle = Lifecycle()
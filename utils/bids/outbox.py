@@ -0,0 +1,34 @@
+import pytz
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy.dialects import postgresql
+
+from models.models import NotificationOutbox
+
+
+class Outbox:
+
+    # Notifications are written to t_notification_outbox in the same transaction as the change they
+    # announce, so a rolled back change never notifies and a committed one always does, without the
+    # request waiting on the notification service. The scheduler leader's dispatcher sends them.
+    # A notification with a dedupe key is only ever queued once.
+
+    async def add(self, session: any, audience: str, text: str, deep_link: str, user_id: str, type: str | None = None,
+                  bid_id: str | None = None, transporter_ids: list | None = None, dedupe_key: str | None = None):
+
+        current_time = datetime.now(pytz.timezone("Asia/Kolkata")).replace(tzinfo=None)
+
+        await session.execute(postgresql.insert(NotificationOutbox)
+                              .values(no_bidding_load_id=bid_id,
+                                      audience=audience,
+                                      transporter_ids=[UUID(str(transporter_id)) for transporter_id in transporter_ids] if transporter_ids else None,
+                                      message=text,
+                                      type=type,
+                                      deep_link=deep_link,
+                                      dedupe_key=dedupe_key,
+                                      status="pending",
+                                      attempts=0,
+                                      next_attempt_at=current_time,
+                                      created_by=user_id)
+                              .on_conflict_do_nothing(index_elements=[NotificationOutbox.dedupe_key]))
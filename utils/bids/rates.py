@@ -0,0 +1,131 @@
+import math
+import os
+import pytz
+from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from config.db_config import AsyncSession
+from data.bidding import lock_bid_for_rate_submission, rate_submission_context, valid_bid_status
+from models.models import BidTransaction
+from utils.bids.eligibility import Eligibility
+from utils.utilities import log
+
+eligibility = Eligibility()
+
+
+class Rate:
+
+    async def submit(self, bid_id: str, transporter_id: str, rate: float, comment: str, is_tc_accepted: bool, user_id: str) -> (any, str):
+        # everything needed to validate the rate is read with one query, and the new
+        # transaction is inserted in the same database transaction.
+        # Submissions for the same bid are serialized on the bid's row lock, taken before the
+        # context is read so that the lowest rate and attempt count can't change underneath us.
+        # Whether the transporter is tagged with the shipper comes from the eligibility cache, and is
+        # read before the lock since it doesn't depend on the bid.
+        (transporter_eligibility, error) = await eligibility.transporter(transporter_id=transporter_id)
+        if error:
+            return ({}, error)
+
+        session = AsyncSession()
+
+        try:
+
+            locked_bid = (await session.execute(text(lock_bid_for_rate_submission), params={
+                "bid_id": bid_id
+            })).first()
+
+            if not locked_bid:
+                return ({"accepted": False, "client_msg": os.getenv("NOT_FOUND_ERROR")}, "Bid ID not found!")
+
+            context = (await session.execute(text(rate_submission_context), params={
+                "bid_id": bid_id,
+                "transporter_id": transporter_id
+            })).first()
+
+            if not context:
+                return ({"accepted": False, "client_msg": os.getenv("NOT_FOUND_ERROR")}, "Bid ID not found!")
+
+            log("RATE SUBMISSION CONTEXT", context)
+
+            is_tagged = str(context.bl_shipper_id) in transporter_eligibility["mapped_shipper_ids"]
+
+            (client_msg, error) = self.rejection(context=context, rate=rate, is_tagged=is_tagged)
+
+            if error:
+                return ({"accepted": False, "client_msg": client_msg}, error)
+
+            attempt_number = context.attempts + 1
+
+            bid = (await session.execute(insert(BidTransaction).values(
+                bid_id=bid_id,
+                transporter_id=transporter_id,
+                rate=rate,
+                comment=comment or context.last_comment,
+                attempt_number=attempt_number,
+                is_tc_accepted=is_tc_accepted,
+                created_by=user_id
+            ).returning(BidTransaction))).scalars().first()
+
+            await session.commit()
+
+            return ({
+                "accepted": True,
+                "bid": bid,
+                "attempts": attempt_number,
+                "transporter_name": context.transporter_name,
+                "bid_end_time": context.bid_end_time
+            }, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ({}, str(e))
+
+        finally:
+            await session.close()
+
+    def rejection(self, context: any, rate: float, is_tagged: bool) -> (str, str):
+
+        ist_timezone = pytz.timezone("Asia/Kolkata")
+        current_time = datetime.now(ist_timezone)
+        current_time = current_time.replace(
+            tzinfo=None, second=0, microsecond=0)
+
+        log("THE CURRENT TIME DURING RATE :::: ", current_time)
+
+        if context.load_status not in valid_bid_status:
+            if current_time < context.bid_time and current_time < context.bid_end_time:
+                return (f"This Load is not Accepting Bids yet, the start time is {context.bid_time}", "Tried bidding, but bid is not live yet")
+
+            elif current_time > context.bid_time and current_time >= context.bid_end_time:
+                return (f"This Load is not Accepting Bids anymore, the end time was {context.bid_end_time}", "Tried bidding, but bid is not live anymore")
+
+        if context.load_status in valid_bid_status and current_time >= context.bid_end_time:
+            return (f"This Load is not Accepting Bids anymore, the end time was {context.bid_end_time}", "Tried bidding, but bid is not live anymore")
+
+        if context.bid_mode == "private_pool" and not is_tagged:
+            return ("Transporter Not Allowed to participate in the private Bid", "bid is private, transporter not allowed")
+
+        if context.attempts >= context.no_of_tries:
+            return ("You have exceeded the number of tries for this bid!", f"Number of tries for Bid  L-{str(context.bl_id)[-5:].upper()} exceeded!")
+
+        if context.show_current_lowest_rate_transporter and context.load_status == "live":
+            reference_rate = context.lowest_rate
+        else:
+            reference_rate = context.transporter_lowest_rate
+
+        if reference_rate is not None and not self.is_decremented(rate=rate, reference_rate=reference_rate, decrement=context.bid_price_decrement, is_decrement_in_percentage=context.is_decrement_in_percentage):
+            rupees_sign = "₹" if not context.is_decrement_in_percentage else ""
+            percentage_sign = "%" if context.is_decrement_in_percentage else ""
+            error = f"Incorrect Bid price, has to be lower, the decrement is {rupees_sign} {int(context.bid_price_decrement)} {percentage_sign}"
+            return (error, error)
+
+        return ("", "")
+
+    def is_decremented(self, rate: float, reference_rate: float, decrement: float, is_decrement_in_percentage: bool) -> bool:
+
+        reference_rate = int(reference_rate)
+        decrement = int(decrement)
+        rate = int(rate)
+
+        return rate + (math.ceil(decrement*reference_rate*0.01) if is_decrement_in_percentage else decrement) <= reference_rate
@@ -1,9 +1,10 @@
+from sqlalchemy import select
 from sqlalchemy.sql.functions import func
 import datetime
 import os
 
 from utils.response import ErrorResponse
-from config.db_config import Session
+from config.db_config import AsyncSession
 from models.models import ShipperModel, User
 from utils.utilities import log, convert_date_to_string
 from config.scheduler import Scheduler
@@ -15,17 +16,15 @@ class Shipper:
 
     async def id(self, user_id: str) -> (str, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             if not user_id:
                 return (False, "The User ID provided is empty")
 
-            shipper = (session
-                       .query(User)
-                       .filter(User.user_id == user_id, User.is_active == True)
-                       .first()
-                       )
+            shipper = (await session.execute(select(User)
+                       .where(User.user_id == user_id, User.is_active == True)
+                       )).scalars().first()
 
             if not shipper:
                 return ("", "Shipper ID not found!")
@@ -33,22 +32,22 @@ class Shipper:
             return (shipper.user_shipper_id,"")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ("", str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def is_valid(self, shipper_id: str) -> (bool, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             if not shipper_id:
                 return (False, "The SHIPPER ID provided is empty")
 
-            bid = session.query(ShipperModel).filter(
-                ShipperModel.shpr_id == shipper_id, ShipperModel.is_active == True).first()
+            bid = (await session.execute(select(ShipperModel).where(
+                ShipperModel.shpr_id == shipper_id, ShipperModel.is_active == True))).scalars().first()
 
             if not bid:
                 return (False, "Shipper ID not found!")
@@ -56,8 +55,8 @@ class Shipper:
             return (True, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (False, str(e))
 
         finally:
-            session.close()
+            await session.close()
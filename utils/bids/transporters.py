@@ -1,41 +1,43 @@
 import os
-import httpx
-import json
-import requests
-import ast
 import pytz
 from datetime import datetime, timedelta
-from sqlalchemy import text, and_, or_, func, select
+from sqlalchemy import text, and_, or_, func, select, bindparam
 from uuid import UUID
 from typing import List
 
-from config.db_config import Session
+from config.db_config import AsyncSession
+from config.http import http
 from utils.response import ServerError, SuccessResponse
 from models.models import BidTransaction, TransporterModel, MapShipperTransporter, LoadAssigned, BiddingLoad, User, ShipperModel, MapLoadSrcDestPair, BlacklistTransporter, TrackingFleet, BidSettings
 from utils.bids.bidding import Bid
+from utils.bids.eligibility import Eligibility
+from utils.bids.history import AssignmentHistory
+from utils.bids.outbox import Outbox
+from utils.redis import Redis
 from utils.utilities import log, structurize_transporter_bids
-from utils.notification_service_manager import notification_service_manager, NotificationServiceManagerReq
-from data.bidding import lost_participated_transporter_bids, live_bid_details, assignment_events
+from data.bidding import lost_participated_transporter_bids, live_bid_details, assignment_events, transporter_price_summary
 
 
 bid = Bid()
+redis = Redis()
+eligibility = Eligibility()
+assignment_log = AssignmentHistory()
+outbox = Outbox()
 
 
 class Transporter:
 
     async def id(self, user_id: str) -> (str, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             if not user_id:
                 return (False, "The User ID provided is empty")
 
-            transporter = (session
-                           .query(User)
-                           .filter(User.user_id == user_id, User.is_active == True)
-                           .first()
-                           )
+            transporter = (await session.execute(select(User)
+                           .where(User.user_id == user_id, User.is_active == True)
+                           )).scalars().first()
 
             if not transporter:
                 return ("", "Transporter ID could not be found")
@@ -43,14 +45,14 @@ class Transporter:
             return (transporter.user_transporter_id, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ("", str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def notify(self, bid_id: str, authtoken: any) -> (bool, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             (bid_details, error) = await self.bid_details(bid_id=bid_id)
@@ -61,21 +63,21 @@ class Transporter:
             user_ids = []
 
             if bid_details.bid_mode == 'private_pool':
-                transporters = session.query(MapShipperTransporter).filter(
-                    MapShipperTransporter.mst_shipper_id == bid_details.bl_shipper_id, MapShipperTransporter.is_active == True).all()
+                transporters = (await session.execute(select(MapShipperTransporter).where(
+                    MapShipperTransporter.mst_shipper_id == bid_details.bl_shipper_id, MapShipperTransporter.is_active == True))).scalars().all()
                 for transporter in transporters:
                     transporter_ids.append(transporter.mst_transporter_id)
 
             elif bid_details.bid_mode == 'open_market':
-                transporters = session.query(TransporterModel).filter(
-                    TransporterModel.is_active == True).all()
+                transporters = (await session.execute(select(TransporterModel).where(
+                    TransporterModel.is_active == True))).scalars().all()
                 for transporter in transporters:
                     transporter_ids.append(transporter.trnsp_id)
 
-            user_details = session.query(User).filter(
-                User.user_transporter_id.in_(transporter_ids), User.is_active == True).all()
+            user_details = (await session.execute(select(User).where(
+                User.user_transporter_id.in_(transporter_ids), User.is_active == True))).scalars().all()
 
-            login_url = "http://13.235.56.142:8000/api/secure/notification/"
+            login_url = f"{os.getenv('BACKEND_HOST')}/api/secure/notification/"
             headers = {
                 'Authorization': authtoken
             }
@@ -92,9 +94,7 @@ class Transporter:
             log("PAYLOAD", payload)
             log("HEADER", headers)
 
-            with httpx.Client() as client:
-                response = client.post(
-                    url=login_url, headers=headers, data=json.dumps(payload))
+            response = await http.get().post(url=login_url, headers=headers, json=payload)
 
             log("NOTIFICATION CREATE Response", response.json())
             json_response = response.json()
@@ -104,50 +104,42 @@ class Transporter:
             return (True, "")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return ("", str(err))
         finally:
-            session.close()
+            await session.close()
 
     async def historical_rates(self, transporter_id: str, bid_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            historical_rates = (session
-                                .query(BidTransaction)
-                                .filter(BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
+            historical_rates = (await session.execute(select(BidTransaction)
+                                .where(BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
                                 .order_by(BidTransaction.created_at.desc())
-                                .all()
-                                )
+                                )).scalars().all()
 
-            price_match_rates = (session
-                                 .query(LoadAssigned)
-                                 .filter(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.la_bidding_load_id == bid_id)
-                                 .first()
-                                 )
+            price_match_rates = (await session.execute(select(LoadAssigned)
+                                 .where(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.la_bidding_load_id == bid_id)
+                                 )).scalars().first()
 
             historical_rates = [{**historical_rate.__dict__, "event":"Live Bid Rates"} for historical_rate in historical_rates]
             for historical_rate in historical_rates:
                 historical_rate["created_at"] = historical_rate["created_at"]+timedelta(hours=5.5)
             history = []
 
-            if price_match_rates:
-                if price_match_rates.history:
-                    assignment_history = ast.literal_eval(price_match_rates.history)[::-1]
-
-                    log("ASSIGNMENT HISTORY", assignment_history)
-                    log("TYPE", type(assignment_history))
-
-                    for (event, rate, created_at, reason) in assignment_history:
-                        if event not in (assignment_events["unassign"] ,assignment_events["assign"]):
-                            history.append({
-                                "event": event,
-                                "rate": rate,
-                                "created_at":created_at,
-                                "comment": reason
-                            })
+            price_match_events = [event for (key, event) in assignment_events.items() if key not in ("assign", "unassign")]
+            assignment_history = await assignment_log.events(session=session, bid_id=bid_id, transporter_id=transporter_id,
+                                                             legacy_history=price_match_rates.history if price_match_rates else None, names=price_match_events)
+
+            for (event, rate, created_at, reason) in assignment_history:
+                history.append({
+                    "event": event,
+                    "rate": rate,
+                    "created_at":created_at,
+                    "comment": reason
+                })
             
             if history:
                 historical_rates = history + historical_rates
@@ -170,58 +162,50 @@ class Transporter:
             }, "")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return ([], str(err))
 
         finally:
-            session.close()
-
-    async def is_valid_bid_rate(self, bid_id: str, show_rate_to_transporter: bool, rate: float, transporter_id: str, decrement: float, is_decrement_in_percentage: bool, status: str) -> (any, str):
-
-        session = Session()
-
-        try:
-
-            if show_rate_to_transporter and status == "live":
-                return await bid.decrement_on_lowest_price(bid_id=bid_id, rate=rate, decrement=decrement, is_decrement_in_percentage=is_decrement_in_percentage)
-            return await bid.decrement_on_transporter_lowest_price(bid_id=bid_id, transporter_id=transporter_id, rate=rate, decrement=decrement, is_decrement_in_percentage=is_decrement_in_percentage)
-
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
-        finally:
-            session.close()
+            await session.close()
 
     async def attempts(self, bid_id: str, transporter_id: str) -> (int, str):
 
-        session = Session()
+        (live_state, error) = await redis.transporter_state(bid_id=bid_id, transporter_id=transporter_id)
+        if not error:
+            return (live_state["attempts"], "")
+
+        log("FETCHING NUMBER OF TRIES FROM DB", error)
+        session = AsyncSession()
 
         try:
-            no_of_tries = session.query(BidTransaction).filter(
-                BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0).count()
+            no_of_tries = (await session.execute(select(func.count()).select_from(BidTransaction).where(
+                BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0))).scalar()
 
             log("NUMBER OF TRIES", no_of_tries)
 
             return (no_of_tries, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (0, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def lowest_price(self, bid_id: str, transporter_id: str) -> (float, str):
 
-        session = Session()
+        (live_state, error) = await redis.transporter_state(bid_id=bid_id, transporter_id=transporter_id)
+        if not error:
+            return (live_state["rate"] or 0.0, "")
+
+        log("FETCHING TRANSPORTER LOWEST PRICE FROM DB", error)
+        session = AsyncSession()
         try:
 
-            transporter_bid = (session
-                               .query(BidTransaction)
-                               .filter(BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
+            transporter_bid = (await session.execute(select(BidTransaction)
+                               .where(BidTransaction.transporter_id == transporter_id, BidTransaction.bid_id == bid_id, BidTransaction.rate > 0)
                                .order_by(BidTransaction.rate)
-                               .first()
-                               )
+                               )).scalars().first()
 
             if not transporter_bid:
                 return (0.0, "")
@@ -229,19 +213,53 @@ class Transporter:
             return (transporter_bid.rate, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return (0.0, str(e))
 
         finally:
-            session.close()
+            await session.close()
+
+    async def price_summary(self, bid_ids: list, transporter_id: str, show_bid_lowest_price: bool = False) -> (dict, str):
+        # lowest price of the bid, lowest price of the transporter and the transporter's position
+        # for a list of bids, computed in one query instead of a handful of queries per bid
+
+        if not bid_ids:
+            return ({}, "")
+
+        session = AsyncSession()
+
+        try:
+            rows = (await session.execute(text(transporter_price_summary).bindparams(bindparam("bid_ids", expanding=True)), params={
+                "bid_ids": [str(bid_id) for bid_id in bid_ids],
+                "transporter_id": str(transporter_id)
+            })).all()
+
+            summary = {}
+            for row in rows:
+                bid_lowest_price = row.bid_lowest_price if show_bid_lowest_price or row.show_current_lowest_rate_transporter else None
+                summary[str(row.bid_id)] = {
+                    "bid_lowest_price": bid_lowest_price,
+                    "transporter_lowest_price": row.transporter_lowest_price,
+                    "position": row.position,
+                    "no_of_tries": row.no_of_tries
+                }
+
+            return (summary, "")
+
+        except Exception as e:
+            await session.rollback()
+            return ({}, str(e))
+
+        finally:
+            await session.close()
 
     async def name(self, transporter_id: str) -> (str, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            transporter = session.query(TransporterModel).filter(
-                TransporterModel.trnsp_id == transporter_id).first()
+            transporter = (await session.execute(select(TransporterModel).where(
+                TransporterModel.trnsp_id == transporter_id))).scalars().first()
 
             if not transporter:
                 return ("", "Requested transporter details was not found")
@@ -249,32 +267,24 @@ class Transporter:
             return (transporter.name, "")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return ("", str(err))
         finally:
-            session.close()
+            await session.close()
 
     async def allowed_to_bid(self, shipper_id: str, transporter_id: str) -> (bool, str):
-        session = Session()
 
-        try:
-            log("INSIDE ALLOWED TO BID", "OK")
-            transporter_details = session.query(MapShipperTransporter).filter(
-                MapShipperTransporter.mst_shipper_id == shipper_id, MapShipperTransporter.mst_transporter_id == transporter_id, MapShipperTransporter.is_active == True).first()
-            log("TRANSPORTER DETAILS", transporter_details)
-            if not transporter_details:
-                return (False, "transporter not tagged with the specific shipper")
+        (transporter_eligibility, error) = await eligibility.transporter(transporter_id=transporter_id)
+        if error:
+            return (False, error)
 
-            return (True, "")
+        if str(shipper_id) not in transporter_eligibility["mapped_shipper_ids"]:
+            return (False, "transporter not tagged with the specific shipper")
 
-        except Exception as e:
-            session.rollback()
-            return (False, str(e))
-        finally:
-            session.close()
+        return (True, "")
 
     async def bid_match(self, bid_id: str, transporters: any, user_id: str, user_type: str) -> (any, str):
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -289,23 +299,21 @@ class Transporter:
 
             transporter_ids = [getattr(transporter, "transporter_id") for transporter in transporters]
 
-            transporter_details = session.query(LoadAssigned).filter(
-                LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.la_transporter_id.in_(transporter_ids)).all()
+            transporter_details = (await session.execute(select(LoadAssigned).where(
+                LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.la_transporter_id.in_(transporter_ids)))).scalars().all()
 
             log("Fetched Transporter Detail ", transporter_details)
 
-            bid_details = (session.query(BiddingLoad).filter(BiddingLoad.bl_id == bid_id).first())
+            bid_details = ((await session.execute(select(BiddingLoad).where(BiddingLoad.bl_id == bid_id))).scalars().first())
             if not bid_details:
                 return([],"Bid Details Not Found ")
             
-            bid_settings = (session
-                            .query(BidSettings)
-                            .filter(BidSettings.bdsttng_shipper_id == bid_details.bl_shipper_id, BidSettings.is_active, or_(BidSettings.bdsttng_branch_id == bid_details.bl_branch_id, BidSettings.bdsttng_branch_id.is_(None)))
+            bid_settings = (await session.execute(select(BidSettings)
+                            .where(BidSettings.bdsttng_shipper_id == bid_details.bl_shipper_id, BidSettings.is_active, or_(BidSettings.bdsttng_branch_id == bid_details.bl_branch_id, BidSettings.bdsttng_branch_id.is_(None)))
                             .order_by(BidSettings.bdsttng_branch_id).limit(1)
-                            .first()
-                            )
+                            )).scalars().first()
             
-            all_transporter_details = (session.query(LoadAssigned).filter(LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.is_active == True).order_by(LoadAssigned.pm_req_timestamp).all())
+            all_transporter_details = ((await session.execute(select(LoadAssigned).where(LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.is_active == True).order_by(LoadAssigned.pm_req_timestamp))).scalars().all())
 
             for transporter_detail in all_transporter_details:
 
@@ -321,7 +329,7 @@ class Transporter:
 
                 if not superuser:
                     if transporter_detail.is_pmr_approved == True:
-                        transporter_personals = (session.query(TransporterModel).filter(TransporterModel.trnsp_id == transporter_detail.la_transporter_id).first())
+                        transporter_personals = ((await session.execute(select(TransporterModel).where(TransporterModel.trnsp_id == transporter_detail.la_transporter_id))).scalars().first())
                         return (transporter_personals.name, "Price Match Already Accepted")
 
                 fetched_transporter_ids.append(
@@ -357,12 +365,14 @@ class Transporter:
                         pm_req_timestamp=current_time if not superuser else None,
                         is_pmr_approved = True if superuser else False,
                         is_negotiated_by_aculead = True if superuser else False,
-                        history = str([(assignment_events["superuser-negotiation"] if superuser else assignment_events["pm-request"] ,getattr(transporter, "rate"), str(current_time), getattr(transporter, "comment"))]),
                         is_active=True,
-                        created_at="NOW()",
+                        created_at=func.now(),
                         created_by=user_id
                     )
                     assigned_transporters.append(assign_detail)
+                    assignment_log.record(session=session, bid_id=bid_id, transporter_id=getattr(transporter, "transporter_id"),
+                                          event=assignment_events["superuser-negotiation"] if superuser else assignment_events["pm-request"],
+                                          value=getattr(transporter, "rate"), reason=getattr(transporter, "comment"), event_time=current_time, user_id=user_id)
 
             log("Assigned Transporters", assigned_transporters)
 
@@ -371,9 +381,9 @@ class Transporter:
                     for transporter in transporters:
                         if getattr(transporter_detail, "la_transporter_id") == getattr(transporter, "transporter_id"):
                             
-                            task = (assignment_events["superuser-negotiation"] if superuser else assignment_events["pm-request"],getattr(transporter, "rate"), str(current_time), getattr(transporter, "comment"))
-                            fetched_history = ast.literal_eval(getattr(transporter_detail, "history"))
-                            fetched_history.append(task)
+                            assignment_log.record(session=session, bid_id=bid_id, transporter_id=getattr(transporter, "transporter_id"),
+                                                  event=assignment_events["superuser-negotiation"] if superuser else assignment_events["pm-request"],
+                                                  value=getattr(transporter, "rate"), reason=getattr(transporter, "comment"), event_time=current_time, user_id=user_id)
 
                             setattr(transporter_detail, "la_transporter_id",
                                     getattr(transporter, "transporter_id"))
@@ -386,14 +396,18 @@ class Transporter:
                             setattr(transporter_detail, "pm_req_timestamp",current_time if not superuser else None)
                             setattr(transporter_detail, "is_pmr_approved", True if superuser else False)
                             setattr(transporter_detail, "is_negotiated_by_aculead", True if superuser else False)
-                            setattr(transporter_detail, "history", str(fetched_history))
-                            setattr(transporter_detail, "updated_at", "NOW()")
+                            setattr(transporter_detail, "updated_at", func.now())
                             setattr(transporter_detail, "updated_by", user_id)
 
             log("Data changed for Update ")
 
-            session.bulk_save_objects(assigned_transporters)
-            session.commit()
+            session.add_all(assigned_transporters)
+
+            await outbox.add(session=session, audience="transporter_kams", bid_id=bid_id, transporter_ids=transporter_ids, user_id=user_id,
+                             text=f"Bid L-{bid_id[-5:].upper()} has asked for a Price Match" if not superuser else f"The Price for Bid L-{bid_id[-5:].upper()} has been Negotiated",
+                             type="Bid match and Negotiation", deep_link="transporter_dashboard_pending")
+
+            await session.commit()
 
             if not assigned_transporters:
                 return ([], "")
@@ -401,27 +415,25 @@ class Transporter:
             return (assigned_transporters, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
-    async def unassign(self, bid_id: str, transporter_request: any, authtoken: any) -> (any, str):
+    async def unassign(self, bid_id: str, transporter_request: any, user_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
             transporter_id = transporter_request.transporter_id
             unassignment_reason = transporter_request.unassignment_reason
 
-            transporters = (session
-                            .query(LoadAssigned)
-                            .filter(LoadAssigned.la_bidding_load_id == bid_id,
+            transporters = (await session.execute(select(LoadAssigned)
+                            .where(LoadAssigned.la_bidding_load_id == bid_id,
                                     LoadAssigned.is_assigned == True,
                                     LoadAssigned.is_active == True)
-                            .all()
-                            )
+                            )).scalars().all()
 
             if not transporters:
                 return ({}, "Transporter details could not be found")
@@ -438,115 +450,71 @@ class Transporter:
                     transporter.is_assigned = False
                     transporter.no_of_fleets_assigned = 0
                     transporter.unassignment_reason = unassignment_reason
-                    if transporter.history:
-                        task = (assignment_events["unassign"],0, str(current_time), unassignment_reason)
-                        fetched_history = ast.literal_eval(transporter.history)
-                        fetched_history.append(task)
-                        transporter.history = str(fetched_history)
-                    else:
-                        transporter.history = str(
-                            [(assignment_events["unassign"],0, str(current_time), unassignment_reason)])
+                    assignment_log.record(session=session, bid_id=bid_id, transporter_id=transporter.la_transporter_id, event=assignment_events["unassign"],
+                                          value=0, reason=unassignment_reason, event_time=current_time, user_id=user_id)
 
                 elif no_transporter_assigned and transporter.la_transporter_id != UUID(transporter_id):
                     no_transporter_assigned = False
 
-            bid_details = (session
-                   .query(BiddingLoad)
-                   .filter(BiddingLoad.bl_id == bid_id)
-                   .first()
-                   )
+            bid_details = (await session.execute(select(BiddingLoad)
+                   .where(BiddingLoad.bl_id == bid_id)
+                   )).scalars().first()
 
             if not bid_details:
                 return ({}, "Bid details could not be found")
 
             if no_transporter_assigned:
                 bid_details.load_status = "pending"
-                bid_details.updated_at = "NOW()"
+                bid_details.updated_at = func.now()
             else:
                 bid_details.load_status = "partially_confirmed"
-                bid_details.updated_at = "NOW()"
+                bid_details.updated_at = func.now()
 
-            session.commit()
+            await outbox.add(session=session, audience="transporter_kams", bid_id=bid_id, transporter_ids=[transporter_id], user_id=user_id,
+                             text=f"Bid L-{bid_id[-5:].upper()} has been Unassigned from you! NO WORRIES BUDDY ... HOPE FOR THE BEST, EXPECT THE WORST, LIFE IS A PLAY & WE ARE UNREHEARSED !!!",
+                             type="Bid Unassignment", deep_link="transporter_dashboard_pending")
 
-            (kam_ids, error) = await bid.transporter_kams(transporter_ids=[transporter_id])
-            if error:
-                return ([],error)
-            
-            (notification_response_success, notification_error) = await notification_service_manager(authtoken=authtoken, req=NotificationServiceManagerReq(**{
-                                                                                                                                            "receiver_ids": kam_ids,
-                                                                                                                                            "text":f"Bid L-{bid_id[-5:].upper()} has been Unassigned from you! NO WORRIES BUDDY ... HOPE FOR THE BEST, EXPECT THE WORST, LIFE IS A PLAY & WE ARE UNREHEARSED !!!",
-                                                                                                                                            "type":"Bid Unassignment",
-                                                                                                                                            "deep_link":"transporter_dashboard_pending"
-                                                                                                                                        }
-                                                                                                                                        )
-                                                                                        )
-            log("ASSIGNMENT CREATION NOTIFICATION SERVICE ", notification_response_success)
-            if notification_error:
-                log("::: NOTIFICATION ERROR DURING NEW BID ASSIGNMENT  ::: ",notification_error)
-                
+            await session.commit()
 
             return (transporter, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ({}, str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def bids_by_status(self, transporter_id: str, user_id: str, status: str | None = None) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            shippers, error = await self.shippers(transporter_id=transporter_id)
+            (visible_bids, error) = await bid.visible(transporter_id=transporter_id, user_id=user_id, status=status)
             if error:
                 return [], error
 
-            log("FETCHED SHIPPERS ATTACHED TO TRANSPORTERS", shippers)
-
-            public_bids, error = await bid.public(blocked_shippers=shippers["blocked_shipper_ids"], transporter_id=transporter_id, status=status)
-
-            if error:
-                return [], error
+            log("FETCHED VISIBLE BIDS", {"public": len(visible_bids["public"]), "private": len(visible_bids["private"])})
 
-            log("FETCHED PUBLIC BIDS", public_bids)
-
-            unsegmented_private_bids = []
-            segmented_bids = []
-            if shippers["shipper_ids"]:
-                unsegmented_private_bids, error = await bid.private(shippers=shippers["shipper_ids"], transporter_id=transporter_id, user_id=user_id, status=status)
-                if error:
-                    return [], error
-                log("FETCHED PRIVATE BIDS", unsegmented_private_bids)
-                
-                segmented_bids, error = await bid.segment(shippers=shippers["shipper_ids"], transporter_id=transporter_id, user_id=user_id, status=status)
-                if error:
-                    return [],error
-                log("SEGMENTED PRIVATE BIDS", segmented_bids)
-                
-                
             return {
-                "all": unsegmented_private_bids + public_bids + segmented_bids,
-                "private": unsegmented_private_bids + segmented_bids,
-                "public": public_bids
+                "all": visible_bids["private"] + visible_bids["public"],
+                "private": visible_bids["private"],
+                "public": visible_bids["public"]
             }, ""
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return [], str(e)
         finally:
-            session.close()
+            await session.close()
 
     async def selected(self, transporter_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            bid_arr = (session
-                       .query(LoadAssigned)
-                       .filter(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
-                       .all()
-                       )
+            bid_arr = (await session.execute(select(LoadAssigned)
+                       .where(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
+                       )).scalars().all()
 
             if not bid_arr:
                 return ([], "")
@@ -554,8 +522,7 @@ class Transporter:
             bid_ids = [bid.la_bidding_load_id for bid in bid_arr]
 
             log("BID IDS ", bid_ids)
-            bids = (session
-                    .query(BiddingLoad,
+            bids = (await session.execute(select(BiddingLoad,
                            ShipperModel.shpr_id,
                            ShipperModel.name,
                            ShipperModel.contact_no,
@@ -573,10 +540,9 @@ class Transporter:
                             )
                     .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
                     .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                    .filter(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids))
-                    .group_by(BiddingLoad, *BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
-                    .all()
-                    )
+                    .where(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids))
+                    .group_by(*BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
+                    )).all()
 
             log("BIDS ", bids)
             if not bids:
@@ -597,21 +563,19 @@ class Transporter:
             return (structured_bids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return [], str(e)
         finally:
-            session.close()
+            await session.close()
 
     async def completed(self, transporter_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            bid_arr = (session
-                       .query(LoadAssigned)
-                       .filter(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
-                       .all()
-                       )
+            bid_arr = (await session.execute(select(LoadAssigned)
+                       .where(LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
+                       )).scalars().all()
 
             if not bid_arr:
                 return ([], "")
@@ -619,8 +583,7 @@ class Transporter:
             bid_ids = [bid.la_bidding_load_id for bid in bid_arr]
 
             log("BID IDS ", bid_ids)
-            bids = (session
-                    .query(BiddingLoad,
+            bids = (await session.execute(select(BiddingLoad,
                            ShipperModel.shpr_id,
                            ShipperModel.name,
                            ShipperModel.contact_no,
@@ -638,10 +601,9 @@ class Transporter:
                             )
                     .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
                     .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                    .filter(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids), BiddingLoad.load_status == "completed")
-                    .group_by(BiddingLoad, *BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
-                    .all()
-                    )
+                    .where(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids), BiddingLoad.load_status == "completed")
+                    .group_by(*BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
+                    )).all()
 
             log("BIDS ", bids)
             if not bids:
@@ -662,73 +624,52 @@ class Transporter:
             return (structured_bids, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return [], str(e)
         finally:
-            session.close()
+            await session.close()
 
-    async def participated_bids(self, transporter_id: str) -> (any, str):
+    async def participated_bids(self, transporter_id: str) -> (dict, str):
+        # bid_id -> load status of every bid the transporter has quoted a rate in, and the shippers
+        # whose terms the transporter has accepted, so callers can filter with lookups instead of scans
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            bid_arr = (session
-                       .query(BidTransaction)
-                       .distinct(BidTransaction.bid_id)
-                       .filter(BidTransaction.transporter_id == transporter_id, BidTransaction.rate > 0)
-                       .all()
-                       )
-
-            if not bid_arr:
-                return ([], "")
+            rows = (await session.execute(select(BidTransaction.bid_id,
+                                                 BiddingLoad.load_status,
+                                                 BiddingLoad.bl_shipper_id,
+                                                 func.bool_or(BidTransaction.rate > 0).label("has_rate"),
+                                                 func.bool_or(and_(BidTransaction.rate < 0, BidTransaction.is_tc_accepted == True, BidTransaction.is_active == True)).label("tc_accepted"))
+                                          .join(BiddingLoad, BiddingLoad.bl_id == BidTransaction.bid_id)
+                                          .where(BidTransaction.transporter_id == transporter_id, BiddingLoad.is_active == True)
+                                          .group_by(BidTransaction.bid_id, BiddingLoad.load_status, BiddingLoad.bl_shipper_id)
+                                          )).all()
 
-            log("PARTICIPATED AND NOT LOST", bid_arr)
+            participation = {"bids": {}, "shippers": set()}
 
-            bid_ids = [str(bid.bid_id) for bid in bid_arr]
-
-            log("BID IDs OF NOT LOST AND PARTICPATED", bid_ids)
-
-            bids = (session
-                    .query(BiddingLoad,
-                           ShipperModel.shpr_id,
-                           ShipperModel.name,
-                           ShipperModel.contact_no,
-                           func.array_agg(MapLoadSrcDestPair.src_city), func.array_agg(MapLoadSrcDestPair.src_street_address), func.array_agg(MapLoadSrcDestPair.src_state), func.array_agg(MapLoadSrcDestPair.dest_street_address), func.array_agg(MapLoadSrcDestPair.dest_state),
-                           func.array_agg(MapLoadSrcDestPair.dest_city),
-                           func.array_agg(select(func.count())
-                                                            .where(
-                                                                TrackingFleet.tf_transporter_id == transporter_id,
-                                                                TrackingFleet.tf_bidding_load_id == BiddingLoad.bl_id,
-                                                                TrackingFleet.is_active == True  
-                                                            )
-                                                            .correlate(BiddingLoad)
-                                                            .subquery()
-                                                        ).label('tf_vehicle_count')
-                           )
-                    .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
-                    .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                    .filter(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids))
-                    .group_by(BiddingLoad, *BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
-                    .all()
-                    )
+            for row in rows:
+                if row.has_rate:
+                    participation["bids"][str(row.bid_id)] = row.load_status
+                if row.tc_accepted:
+                    participation["shippers"].add(row.bl_shipper_id)
 
-            if not bids:
-                return ([], "")
+            log("PARTICIPATED BIDS", len(participation["bids"]))
 
-            return (structurize_transporter_bids(bids=bids), "")
+            return (participation, "")
 
         except Exception as e:
-            session.rollback()
-            return [], str(e)
+            await session.rollback()
+            return ({"bids": {}, "shippers": set()}, str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def participated_and_lost_bids(self, transporter_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
-            bid_arr = session.execute(text(lost_participated_transporter_bids), params={
+            bid_arr = await session.execute(text(lost_participated_transporter_bids), params={
                 "transporter_id": transporter_id
             })
             log("BID ARRAY ", bid_arr)
@@ -739,8 +680,7 @@ class Transporter:
 
             load_status_for_lost_participated = ["completed", "confirmed"]
 
-            bids = (session
-                    .query(BiddingLoad,
+            bids = (await session.execute(select(BiddingLoad,
                            ShipperModel.shpr_id,
                            ShipperModel.name,
                            ShipperModel.contact_no,
@@ -758,10 +698,9 @@ class Transporter:
                            )
                     .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
                     .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                    .filter(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids), BiddingLoad.load_status.in_(load_status_for_lost_participated))
-                    .group_by(BiddingLoad, *BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
-                    .all()
-                    )
+                    .where(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids), BiddingLoad.load_status.in_(load_status_for_lost_participated))
+                    .group_by(*BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
+                    )).all()
 
             if not bids:
                 return ([], "")
@@ -771,14 +710,14 @@ class Transporter:
             return (structurize_transporter_bids(bids=bids), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return [], str(e)
         finally:
-            session.close()
+            await session.close()
 
     async def not_participated_and_lost_bids(self, transporter_id: str, user_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             all_bids, error = await self.bids_by_status(transporter_id=transporter_id, user_id= user_id)
@@ -788,7 +727,7 @@ class Transporter:
 
             _all = all_bids["all"]
 
-            (participated_bids, error) = await self.participated_bids(transporter_id=transporter_id)
+            (participation, error) = await self.participated_bids(transporter_id=transporter_id)
 
             if error:
                 return ([], "Participated bids for transporter could not be fetched")
@@ -796,7 +735,7 @@ class Transporter:
             log("PARTICIPATED")
 
             not_participated_bids = [
-                bid for bid in _all if bid not in participated_bids]
+                bid for bid in _all if str(bid["bid_id"]) not in participation["bids"]]
 
             # and bid.load_status in particpated_and_lost_status
 
@@ -806,135 +745,22 @@ class Transporter:
             return not_participated_bids, ""
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return [], str(e)
         finally:
-            session.close()
-
-    async def shippers(self, transporter_id: str) -> (any, str):
-
-        session = Session()
-        shipper_ids = []
-
-        try:
-            shipper_and_blacklist_details = (
-                session.query(MapShipperTransporter,
-                              TransporterModel,
-                              BlacklistTransporter
-                              )
-                .join(TransporterModel, and_(MapShipperTransporter.mst_transporter_id == TransporterModel.trnsp_id, TransporterModel.is_active == True))
-                .outerjoin(BlacklistTransporter, and_(BlacklistTransporter.bt_shipper_id == MapShipperTransporter.mst_shipper_id, BlacklistTransporter.bt_transporter_id == transporter_id, BlacklistTransporter.is_active == True))
-                .filter(MapShipperTransporter.mst_transporter_id == transporter_id, MapShipperTransporter.is_active == True)
-                .all()
-            )
-            
-            transporter_status = ''
-            if not shipper_and_blacklist_details:
-                aculead_transporter_detail = (
-                                            session.query(TransporterModel)
-                                            .filter(TransporterModel.trnsp_id == transporter_id, TransporterModel.is_active == True)
-                                            .first()
-                                            )
-                
-                if aculead_transporter_detail:
-                    transporter_status = aculead_transporter_detail.status
-
-            shipper_ids = []
-            mapped_blocked_shipper_ids = []
-            unmapped_blocked_shipper_ids = []
-
-            
-            for shipper_and_blacklist_detail in shipper_and_blacklist_details:
-                (shipper, transporter_details,
-                 blacklist_details) = shipper_and_blacklist_detail
-
-                if transporter_details.status == 'partially_blocked':
-                    transporter_status = 'partially_blocked'
-                    if not blacklist_details:
-                        shipper_ids.append(shipper.mst_shipper_id)
-                    else:
-                        mapped_blocked_shipper_ids.append(shipper.mst_shipper_id)
-                        
-                else:
-                    shipper_ids.append(shipper.mst_shipper_id)
-                log("SHIPPER :", shipper)
-                log("TRANSPORTER DETAILS :", transporter_details.trnsp_id)
-                log("BLACKLIST :", blacklist_details)
-
-            log("SHIPPER IDs", shipper_ids)
-            log("BLOCKED SHIPPER IDS", mapped_blocked_shipper_ids)
-
-            if transporter_status == 'partially_blocked':
-                unmapped_blocked_shippers = (
-                                            session.query(BlacklistTransporter)
-                                            .filter(BlacklistTransporter.is_active == True, ~BlacklistTransporter.bt_shipper_id.in_(mapped_blocked_shipper_ids), BlacklistTransporter.bt_transporter_id == transporter_id)
-                                            .all()
-                                        )
-                log("UNMAPPED BLOCKED SHIPPERS ", unmapped_blocked_shippers)
-                for unmapped_blocked_shipper in unmapped_blocked_shippers:
-                    unmapped_blocked_shipper_ids.append(unmapped_blocked_shipper.bt_shipper_id)
-                log("UNMAPPED BLOCKED SHIPPER IDS ", unmapped_blocked_shipper_ids)
-
-            
-            all_shipper_ids = {
-                "shipper_ids": shipper_ids,
-                "blocked_shipper_ids": mapped_blocked_shipper_ids + unmapped_blocked_shipper_ids
-            }
-            log("ALL SHIPPER IDS ", all_shipper_ids)
-
-            return (all_shipper_ids, "")
-
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
-        finally:
-            session.close()
-
-    async def participated_bids_shipper(self, transporter_id: str) -> (any, str):
-
-        session = Session()
-        
-        try:
-            
-            bids_participated = (session
-                                .query(BidTransaction, BiddingLoad.bl_shipper_id)
-                                .filter(BidTransaction.transporter_id == transporter_id,
-                                        BidTransaction.is_tc_accepted == True,
-                                        BidTransaction.is_active == True,
-                                        BidTransaction.rate < 0,
-                                        BidTransaction.bid_id == BiddingLoad.bl_id,
-                                        BiddingLoad.is_active == True)
-                                .all()
-                                )
-            
-            shippers_participated_in = []
-            
-            if bids_participated:
-                shippers_participated_in = [shipper_id for _, shipper_id in bids_participated]
-                
-            return (list(set(shippers_participated_in)), "")
-            
-            
-        except Exception as e:
-            session.rollback()
-            return ({}, str(e))
-        finally:
-            session.close()
+            await session.close()
 
     async def bid_details(self, bid_id: str, transporter_id: str | None = None) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         log("FINDING BID DETAILS FOR A TRANSPORTER")
 
         try:
 
-            bid_details = (
-                session
-                .query(BiddingLoad)
-                .filter(BiddingLoad.bl_id == bid_id)
-                .first()
-            )
+            bid_details = (await session.execute(select(BiddingLoad)
+                .where(BiddingLoad.bl_id == bid_id)
+            )).scalars().first()
 
             log("BID DETAILS AFTER QUERY", bid_details)
 
@@ -944,14 +770,14 @@ class Transporter:
             return (bid_details, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ({}, str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def assigned_bids(self, transporter_id: str, user_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -973,12 +799,9 @@ class Transporter:
 
             log("BIDS WHICH ARE CONFIRMED OR PARTIALLY CONFIRMED ", filtered_bid_ids)
 
-            bids_which_transporter_has_been_assigned_to = (
-                session
-                .query(LoadAssigned)
-                .filter(LoadAssigned.la_bidding_load_id.in_(filtered_bid_ids), LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
-                .all()
-            )
+            bids_which_transporter_has_been_assigned_to = (await session.execute(select(LoadAssigned)
+                .where(LoadAssigned.la_bidding_load_id.in_(filtered_bid_ids), LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True, LoadAssigned.is_assigned == True)
+            )).scalars().all()
 
             if not bids_which_transporter_has_been_assigned_to:
                 return ([], "")
@@ -989,8 +812,7 @@ class Transporter:
             bid_ids = [str(bid.la_bidding_load_id)
                        for bid in bids_which_transporter_has_been_assigned_to]
 
-            bids = (session
-                    .query(BiddingLoad,
+            bids = (await session.execute(select(BiddingLoad,
                            ShipperModel.shpr_id,
                            ShipperModel.name,
                            ShipperModel.contact_no,
@@ -1008,10 +830,9 @@ class Transporter:
                            )
                     .outerjoin(ShipperModel, ShipperModel.shpr_id == BiddingLoad.bl_shipper_id)
                     .outerjoin(MapLoadSrcDestPair, and_(MapLoadSrcDestPair.mlsdp_bidding_load_id == BiddingLoad.bl_id, MapLoadSrcDestPair.is_active == True))
-                    .filter(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids))
-                    .group_by(BiddingLoad, *BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
-                    .all()
-                    )
+                    .where(BiddingLoad.is_active == True, BiddingLoad.bl_id.in_(bid_ids))
+                    .group_by(*BiddingLoad.__table__.c, ShipperModel.name, ShipperModel.contact_no, ShipperModel.shpr_id )
+                    )).all()
 
             if not bids:
                 return ([], "")
@@ -1021,16 +842,22 @@ class Transporter:
             return (structurize_transporter_bids(bids=bids), "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ([], str(e))
         finally:
-            session.close()
+            await session.close()
 
     async def position(self, transporter_id: str, bid_id: str) -> (any, str):
+
+        (live_state, error) = await redis.transporter_state(bid_id=bid_id, transporter_id=transporter_id)
+        if not error:
+            return (live_state["position"], "")
+
+        log("FETCHING TRANSPORTER POSITION FROM DB", error)
         try:
-            session = Session()
+            session = AsyncSession()
 
-            bid_details = session.execute(text(live_bid_details), params={
+            bid_details = await session.execute(text(live_bid_details), params={
                 "bid_id": bid_id})
 
             bid_summary = []
@@ -1070,59 +897,50 @@ class Transporter:
             return (None, "")
 
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             return ({}, str(e))
 
         finally:
-            session.close()
+            await session.close()
 
     async def assignment_history(self, transporter_id: str, bid_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
 
-            transporter_detail = (session.query(LoadAssigned).filter(LoadAssigned.la_bidding_load_id == bid_id,
-                                  LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True).first())
+            transporter_detail = ((await session.execute(select(LoadAssigned).where(LoadAssigned.la_bidding_load_id == bid_id,
+                                  LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True))).scalars().first())
 
             log("TRANSPORTER DETAILS", transporter_detail)
             if not transporter_detail:
                 return ([], "")
-            if not transporter_detail.history:
-                return ([], "")
-
-            log("ASSIGNMENT HISTORY", transporter_detail.history)
-            log("TYPE", type(transporter_detail.history))
-
-            assignment_history = ast.literal_eval(transporter_detail.history)[::-1]
 
-            log("ASSIGNMENT HISTORY", assignment_history)
-            log("TYPE", type(assignment_history))
+            assignment_history = await assignment_log.events(session=session, bid_id=bid_id, transporter_id=transporter_id,
+                                                             legacy_history=transporter_detail.history, names=[assignment_events["unassign"], assignment_events["assign"]])
 
             history = []
 
             for (event, resources, created_at, reason) in assignment_history:
-
-                if event in (assignment_events["unassign"] ,assignment_events["assign"]):
-                    history.append({
-                        "event": event,
-                        "resources": str(resources)+" vehicle(s)",
-                        "created_at": created_at,
-                        "reason": reason
-                    })
+                history.append({
+                    "event": event,
+                    "resources": str(resources)+" vehicle(s)",
+                    "created_at": created_at,
+                    "reason": reason
+                })
 
             return (history, "")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return ([], str(err))
 
         finally:
-            session.close()
+            await session.close()
 
-    async def bid_match_approval(self, transporter_id: str, bid_id: str, req: any, user_id: str, authtoken: any) -> (any, str):
+    async def bid_match_approval(self, transporter_id: str, bid_id: str, req: any, user_id: str) -> (any, str):
 
-        session = Session()
+        session = AsyncSession()
 
         try:
             event = []
@@ -1134,24 +952,22 @@ class Transporter:
             current_time = current_time.replace(
                 tzinfo=None, second=0, microsecond=0)
 
-            transporter_detail = (session.query(LoadAssigned).filter(LoadAssigned.la_bidding_load_id == bid_id,
-                                LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True).first())
+            transporter_detail = ((await session.execute(select(LoadAssigned).where(LoadAssigned.la_bidding_load_id == bid_id,
+                                LoadAssigned.la_transporter_id == transporter_id, LoadAssigned.is_active == True))).scalars().first())
 
             if not transporter_detail:
                 return ([], "Transporter's Assigned Load Detail not Found")
             
-            bid_details = (session.query(BiddingLoad).filter(BiddingLoad.bl_id == bid_id).first())
+            bid_details = ((await session.execute(select(BiddingLoad).where(BiddingLoad.bl_id == bid_id))).scalars().first())
             if not bid_details:
                 return([],"Bid Details Not Found ")
             
-            bid_settings = (session
-                            .query(BidSettings)
-                            .filter(BidSettings.bdsttng_shipper_id == bid_details.bl_shipper_id, BidSettings.is_active, or_(BidSettings.bdsttng_branch_id == bid_details.bl_branch_id, BidSettings.bdsttng_branch_id.is_(None)))
+            bid_settings = (await session.execute(select(BidSettings)
+                            .where(BidSettings.bdsttng_shipper_id == bid_details.bl_shipper_id, BidSettings.is_active, or_(BidSettings.bdsttng_branch_id == bid_details.bl_branch_id, BidSettings.bdsttng_branch_id.is_(None)))
                             .order_by(BidSettings.bdsttng_branch_id).limit(1)
-                            .first()
-                            )
+                            )).scalars().first()
             
-            all_transporter_details = (session.query(LoadAssigned).filter(LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.is_active == True).all())
+            all_transporter_details = ((await session.execute(select(LoadAssigned).where(LoadAssigned.la_bidding_load_id == bid_id, LoadAssigned.is_active == True))).scalars().all())
             
             for each_transporter_detail in all_transporter_details:
 
@@ -1177,10 +993,9 @@ class Transporter:
                 approval_status = "approved"
 
             else:
-                event_detail = ''
-                if transporter_detail.history:
-                    event_details = ast.literal_eval(transporter_detail.history)[::-1]
-                    event_detail = next ((event_detail for event_detail in event_details if event_detail[0] == assignment_events["pm-negotiated"]), None)
+                negotiations = await assignment_log.events(session=session, bid_id=bid_id, transporter_id=transporter_id,
+                                                           legacy_history=transporter_detail.history, names=[assignment_events["pm-negotiated"]])
+                event_detail = negotiations[0] if negotiations else None
 
                 if req.rate:
                     
@@ -1188,12 +1003,10 @@ class Transporter:
                     if event_detail:
                         lowest_rate_provided_by_transporter = event_detail[1]
                     else:
-                        detail_of_lowest_bid_provided_by_transporter = (session
-                                                                        .query(BidTransaction)
-                                                                        .filter(BidTransaction.bid_id == bid_id, BidTransaction.transporter_id == transporter_id, BidTransaction.is_active == True, BidTransaction.rate > 0)
+                        detail_of_lowest_bid_provided_by_transporter = (await session.execute(select(BidTransaction)
+                                                                        .where(BidTransaction.bid_id == bid_id, BidTransaction.transporter_id == transporter_id, BidTransaction.is_active == True, BidTransaction.rate > 0)
                                                                         .order_by(BidTransaction.rate.asc())
-                                                                        .first()
-                                                                        )
+                                                                        )).scalars().first()
                         
                         if detail_of_lowest_bid_provided_by_transporter:
                             lowest_rate_provided_by_transporter = detail_of_lowest_bid_provided_by_transporter.rate
@@ -1219,46 +1032,27 @@ class Transporter:
                 transporter_detail.updated_at = current_time
                 transporter_detail.updated_by = user_id
 
-            if transporter_detail.history:
-                fetched_history = ast.literal_eval(transporter_detail.history)
-                fetched_history.append(tuple(event))
-                transporter_detail.history = str(fetched_history)
-                
-            else:
-                transporter_detail.history = str([(tuple(event))])
+            (event_name, event_rate, _, event_reason) = event
+            assignment_log.record(session=session, bid_id=bid_id, transporter_id=transporter_id, event=event_name,
+                                  value=event_rate, reason=event_reason, event_time=current_time, user_id=user_id)
 
-            session.commit()
-                        
-            (shipper_user_ids,error)  = await bid.shipper_users(bid_ids=[bid_id])
-            if error:
-                return ([], error)
+            await outbox.add(session=session, audience="shipper_users", bid_id=bid_id, user_id=user_id,
+                             text=f"Transporter has responded to the PRICE MATCH REQUEST for L-{bid_id[-5:].upper()} ! GO AND CHECK IF ITS NEGOTIATED !!!",
+                             type="Transporter Bid Match Response", deep_link="manage_trip_partially_confirmed")
+
+            await session.commit()
 
-            log("::: SHIPPER RELATED USERS ::: ", shipper_user_ids)
-            
-            (notification_response_success, error) = await notification_service_manager(authtoken=authtoken, req=NotificationServiceManagerReq(**{
-                                                                                                                                                "receiver_ids": shipper_user_ids,
-                                                                                                                                                "text":f"Transporter has responded to the PRICE MATCH REQUEST for L-{bid_id[-5:].upper()} ! GO AND CHECK IF ITS NEGOTIATED !!!",
-                                                                                                                                                "type":"Transporter Bid Match Response",
-                                                                                                                                                "deep_link":"manage_trip_partially_confirmed"
-                                                                                                                                            }
-                                                                                                                                            )
-                                                                                    )
-            
-            print("::::: NOTIFICATION RESPONSE ::::",notification_response_success)
-            if error:
-                log("::: NOTIFICATION ERROR DURING BID PUBLISH ::: ",error)
-                
             return (approval_status,"")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return ([], str(err))
 
         finally:
-            session.close()
+            await session.close()
 
     async def tc_approval(self, transporter_id: str, bid_id: str, user_id: str) -> (any, str):
-        session = Session()
+        session = AsyncSession()
 
         try:
 
@@ -1272,12 +1066,12 @@ class Transporter:
                                         )
             
             session.add(approval_data)
-            session.commit()
+            await session.commit()
             return (True,"")
 
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             return (False, str(err))
 
         finally:
-            session.close()
+            await session.close()
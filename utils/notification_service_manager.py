@@ -1,8 +1,9 @@
 from fastapi import Request
-import os, httpx
+import os
 from typing import List
 from pydantic import BaseModel
 
+from config.http import http
 from utils.utilities import log
 
 
@@ -26,38 +27,35 @@ async def notification_service_manager(authtoken: str, req:NotificationServiceMa
     host=os.getenv("BACKEND_HOST")
     notification_url = f"{host}/api/secure/notification/"
 
-    async with httpx.AsyncClient() as client:
-        try:    
-            payload= {
-                "receiver_ids": req.receiver_ids,
-                "text": req.text,
-                "type": req.type,
-                "deep_link": req.deep_link,
-                "shipper_id": req.shipper_id,
-                "branch_id": req.branch_id,
-                "transporter_id": req.transporter_id,
-                "email": req.email,
-                "subject": req.subject,
-                "content": req.content,
-                "name": req.name,
-                "otp": req.otp,
-                "msisdn": req.msisdn
-            }
-            
-            headers = {
-                'Accept': 'application/json',
-                'Content-Type':'application/json',
-                'Authorization':authtoken
-            }
-            response = await client.post(notification_url, json=payload, headers=headers)
-
-            log(":::: NOTIFICATION URL HIT RESPONSE FROM NOTIFICATION SERVICE MANAGER ::::", response)
-            log(":::: NOTIFICATION URL HIT RESPONSE TEXT FROM NOTIFICATION SERVICE MANAGER ::::", response.json())
-            
-            return(response,"")
-
-        except Exception as e:
-            print(e)
-            return("",str(e))
-    
-    
\ No newline at end of file
+    try:
+        payload= {
+            "receiver_ids": req.receiver_ids,
+            "text": req.text,
+            "type": req.type,
+            "deep_link": req.deep_link,
+            "shipper_id": req.shipper_id,
+            "branch_id": req.branch_id,
+            "transporter_id": req.transporter_id,
+            "email": req.email,
+            "subject": req.subject,
+            "content": req.content,
+            "name": req.name,
+            "otp": req.otp,
+            "msisdn": req.msisdn
+        }
+
+        headers = {
+            'Accept': 'application/json',
+            'Content-Type':'application/json',
+            'Authorization':authtoken
+        }
+        response = await http.get().post(notification_url, json=payload, headers=headers)
+
+        log(":::: NOTIFICATION URL HIT RESPONSE FROM NOTIFICATION SERVICE MANAGER ::::", response)
+        log(":::: NOTIFICATION URL HIT RESPONSE TEXT FROM NOTIFICATION SERVICE MANAGER ::::", response.text)
+
+        return(response,"")
+
+    except Exception as e:
+        log("NOTIFICATION SERVICE MANAGER ERROR", str(e))
+        return("",str(e))
@@ -1,12 +1,128 @@
+import orjson
+import os
 import time
+import pytz
+from datetime import datetime
 
+from sqlalchemy import select, text
+
+from config.db_config import AsyncSession
 from config.redis import r as redis
+from data.bidding import live_bid_state
+from models.models import BiddingLoad
 from utils.utilities import log
 
+leaderboard_script = redis.register_script("""
+local leaderboard = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+local result = {redis.call('GET', KEYS[2]) or '0'}
+for i = 1, #leaderboard, 2 do
+    result[#result + 1] = leaderboard[i]
+    result[#result + 1] = leaderboard[i + 1]
+    result[#result + 1] = redis.call('HGETALL', ARGV[1] .. leaderboard[i])
+end
+return result
+""")
+
+# A transporter's own rate, attempts and rank, the lowest rate of the bid and the bid's settings for
+# transporters, in a single round trip.
+# KEYS: leaderboard, transporter hash, settings
+# ARGV: transporter key prefix, transporter id
+transporter_state_script = redis.register_script("""
+local lowest = redis.call('ZRANGE', KEYS[1], 0, 0)
+local lowest_rate = false
+if lowest[1] then
+    lowest_rate = redis.call('HGET', ARGV[1] .. lowest[1], 'rate')
+end
+return {redis.call('HMGET', KEYS[2], 'rate', 'attempts'), redis.call('ZRANK', KEYS[1], ARGV[2]), lowest_rate,
+        redis.call('HMGET', KEYS[3], 'no_of_tries', 'show_current_lowest_rate_transporter')}
+""")
+
+# Records an accepted rate and appends the resulting delta event to the bid's event log, atomically,
+# so that sequence numbers and ranks are consistent even when rates for a bid arrive concurrently.
+# The transporter hash follows the leaderboard rather than the order writes arrive in: its exact rate
+# and comment only change when the sorted set took a better rate, and attempts only grow.
+# KEYS: leaderboard, transporter hash, built marker, sequence, event log
+# ARGV: transporter id, score, expire at, event log size, bid id, transporter name, comment, attempts, rate
+accept_rate_script = redis.register_script("""
+local previous_rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+local improved = redis.call('ZADD', KEYS[1], 'LT', 'CH', ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], 'transporter_id', ARGV[1], 'transporter_name', ARGV[6])
+if improved == 1 then
+    redis.call('HSET', KEYS[2], 'rate', ARGV[9], 'comment', ARGV[7])
+end
+if tonumber(ARGV[8]) > tonumber(redis.call('HGET', KEYS[2], 'attempts') or '0') then
+    redis.call('HSET', KEYS[2], 'attempts', ARGV[8])
+end
+redis.call('SET', KEYS[3], 1)
+local rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+local seq = redis.call('INCR', KEYS[4])
+
+local event_type = 'attempt'
+if rank == 0 then
+    event_type = 'new_best'
+elseif rank ~= previous_rank then
+    event_type = 'rank_changed'
+end
+
+local transporter = {}
+local fields = redis.call('HGETALL', KEYS[2])
+for i = 1, #fields, 2 do
+    transporter[fields[i]] = fields[i + 1]
+end
+transporter['rate'] = tonumber(transporter['rate'])
+
+local event = cjson.encode({
+    seq = seq,
+    type = event_type,
+    bid_id = ARGV[5],
+    transporter = transporter,
+    position = rank + 1,
+    previous_position = previous_rank and previous_rank + 1 or cjson.null
+})
+redis.call('RPUSH', KEYS[5], event)
+redis.call('LTRIM', KEYS[5], -tonumber(ARGV[4]), -1)
+for i = 1, #KEYS do
+    redis.call('EXPIREAT', KEYS[i], ARGV[3])
+end
+return event
+""")
+
 
 class Redis:
 
-    async def update(self, sorted_set: str, transporter_id: str, transporter_name: str, comment: str, rate: float, attempts: int) -> (any, str):
+    # The live state of an auction is kept in a sorted set per bid, scored by rate with the time of the
+    # bid as a tie-breaker, and a hash per transporter in the bid holding their name, comment, best rate
+    # and number of attempts. It is written on every accepted rate and rebuilt from the database when cold.
+    # All keys of a bid live under bid:{bid_id}: and expire a while after the bid ends.
+
+    def leaderboard_key(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:lb"
+
+    def transporter_key(self, bid_id: str, transporter_id: str) -> str:
+        return f"bid:{bid_id}:t:{transporter_id}"
+
+    def built_key(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:built"
+
+    def sequence_key(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:seq"
+
+    def events_key(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:events"
+
+    def settings_key(self, bid_id: str) -> str:
+        return f"bid:{bid_id}:settings"
+
+    def expire_at(self, bid_end_time: datetime | None = None) -> int:
+        ist_timezone = pytz.timezone("Asia/Kolkata")
+        end_time = ist_timezone.localize(bid_end_time).timestamp() if bid_end_time else time.time()
+        return int(max(end_time, time.time())) + int(os.getenv("REDIS_BID_TTL_GRACE", 3600))
+
+    def score(self, rate: float, created_at: datetime | None = None) -> float:
+        timestamp = created_at.timestamp() if created_at else time.time()
+        return rate + int(timestamp) / (10**10)
+
+    async def update(self, sorted_set: str, transporter_id: str, transporter_name: str, comment: str, rate: float, attempts: int, created_at: datetime | None = None, bid_end_time: datetime | None = None) -> (any, str):
 
         log("TRANSPORTER ID", transporter_id)
         log("TRANSPORTER NAME", transporter_name)
@@ -14,28 +130,132 @@ class Redis:
         log("RATE", rate)
         log("NUMBER OF ATTEMPTS", attempts)
 
-        current_timestamp = int(time.time())
+        try:
+
+            (rebuilt, error) = await self.warm(bid_id=sorted_set)
+            if error:
+                return ("", error)
+
+            if rebuilt:
+                # the rebuild already holds the committed rate, so there is no earlier state to compute a delta
+                # against. Clients get a fresh snapshot instead, the rebuild has restarted the event log.
+                (snapshot, error) = await self.snapshot(bid_id=sorted_set)
+                if error:
+                    return ("", error)
+                return (orjson.dumps(snapshot).decode(), "")
+
+            event = await accept_rate_script(keys=[self.leaderboard_key(sorted_set), self.transporter_key(sorted_set, transporter_id), self.built_key(sorted_set),
+                                                   self.sequence_key(sorted_set), self.events_key(sorted_set)],
+                                             args=[transporter_id, self.score(rate=rate, created_at=created_at), self.expire_at(bid_end_time), int(os.getenv("REDIS_BID_EVENT_LOG_SIZE", 200)), sorted_set,
+                                                   transporter_name, comment or "", attempts, rate])
 
-        # key = f"{transporter_id}_{current_timestamp}"
+            log("BID EVENT RECORDED IN REDIS", event)
 
-        rate = rate + current_timestamp / (10**10)
-        log("RATE APPENDED WITH TIMESTAMP", rate)
-        redis.hmset(transporter_id, {
+            return (event, "")
+
+        except Exception as e:
+            return ("", str(e))
+
+    def record(self, pipeline: any, bid_id: str, transporter_id: str, transporter_name: str, comment: str, rate: float, attempts: int, expire_at: int, created_at: datetime | None = None, overwrite: bool = True):
+
+        transporter_key = self.transporter_key(bid_id, transporter_id)
+        transporter_data = {
             'transporter_id': transporter_id,
             'transporter_name': transporter_name,
-            'comment': comment,
-            'attempts': attempts
-        })
+            'comment': comment or "",
+            'attempts': attempts,
+            'rate': rate
+        }
+
+        if overwrite:
+            pipeline.hset(transporter_key, mapping=transporter_data)
+        else:
+            # a rebuild must not clobber a fresher rate written while it was reading the database
+            for field, value in transporter_data.items():
+                pipeline.hsetnx(transporter_key, field, value)
 
-        log("HASHING IN REDIS", "OK")
+        # LT keeps the best rate of a transporter even if writes arrive out of order
+        pipeline.zadd(self.leaderboard_key(bid_id), {
+                      transporter_id: self.score(rate=rate, created_at=created_at)}, lt=True)
+        pipeline.set(self.built_key(bid_id), 1)
 
-        redis.zadd(sorted_set, {transporter_id: rate})
+        for key in (transporter_key, self.leaderboard_key(bid_id), self.built_key(bid_id)):
+            pipeline.expireat(key, expire_at)
+        return pipeline
 
-        # redis.zadd(sorted_set, {transporter_id: (rate, current_timestamp)})
+    async def rebuild(self, bid_id: str) -> (int, str):
 
-        log("SORTED SET APPEND IN REDIS", "OK")
+        log("REBUILDING LIVE BID STATE FROM DATABASE", bid_id)
 
-        return await self.bid_details(sorted_set=sorted_set)
+        session = AsyncSession()
+
+        try:
+
+            bid_details = (await session.execute(select(BiddingLoad.load_status, BiddingLoad.bid_end_time, BiddingLoad.no_of_tries, BiddingLoad.show_current_lowest_rate_transporter)
+                                                 .where(BiddingLoad.bl_id == bid_id))).first()
+
+            if not bid_details or bid_details.load_status != "live":
+                # only a live bid has live state, reads of any other bid go to the database instead of
+                # recreating the keys its close removed
+                return (0, f"Bid {bid_id} is not live")
+
+            transporter_bids = (await session.execute(text(live_bid_state), params={
+                "bid_id": bid_id})).all()
+
+            expire_at = self.expire_at(bid_details.bid_end_time)
+
+            pipeline = redis.pipeline(transaction=False)
+            for transporter_bid in transporter_bids:
+                self.record(pipeline=pipeline, bid_id=bid_id, transporter_id=str(transporter_bid.transporter_id), transporter_name=transporter_bid.transporter_name,
+                            comment=transporter_bid.comment, rate=transporter_bid.rate, attempts=transporter_bid.attempts, created_at=transporter_bid.created_at, expire_at=expire_at, overwrite=False)
+            # kept with the live state so transporters polling the bid never read the bid row
+            pipeline.hset(self.settings_key(bid_id), mapping={
+                "no_of_tries": bid_details.no_of_tries if bid_details.no_of_tries is not None else "",
+                "show_current_lowest_rate_transporter": int(bool(bid_details.show_current_lowest_rate_transporter))})
+            pipeline.expireat(self.settings_key(bid_id), expire_at)
+            pipeline.set(self.built_key(bid_id), 1, exat=expire_at)
+            # events logged before the rebuild describe a state that is gone, clients behind it resync from a snapshot
+            pipeline.delete(self.events_key(bid_id))
+            pipeline.incr(self.sequence_key(bid_id))
+            pipeline.expireat(self.sequence_key(bid_id), expire_at)
+            await pipeline.execute()
+
+            return (len(transporter_bids), "")
+
+        except Exception as e:
+            await session.rollback()
+            return (0, str(e))
+
+        finally:
+            await session.close()
+
+    async def warm(self, bid_id: str) -> (bool, str):
+
+        # tells whether the state had to be rebuilt
+        if await redis.exists(self.built_key(bid_id)):
+            return (False, "")
+
+        (_, error) = await self.rebuild(bid_id=bid_id)
+        if error:
+            return (False, error)
+        return (True, "")
+
+    async def leaderboard(self, bid_id: str) -> (int, list):
+
+        # the sequence number, the leaderboard and every transporter hash come back in a single round trip
+        leaderboard = await leaderboard_script(keys=[self.leaderboard_key(bid_id), self.sequence_key(bid_id)], args=[self.transporter_key(bid_id, "")])
+
+        transporter_data_with_rates = []
+        for index in range(1, len(leaderboard), 3):
+            transporter_id, score, transporter_fields = leaderboard[index:index + 3]
+
+            transporter_data = dict(
+                zip(transporter_fields[::2], transporter_fields[1::2]))
+            transporter_data['rate'] = int(float(score))
+
+            transporter_data_with_rates.append(transporter_data)
+
+        return (int(leaderboard[0]), transporter_data_with_rates)
 
     async def bid_details(self, sorted_set: str) -> (any, str):
 
@@ -43,72 +263,151 @@ class Redis:
 
         try:
 
-            transporter_data_with_rates = []
+            (_, transporter_data_with_rates) = await self.leaderboard(bid_id=sorted_set)
+
+            log("LIVE BID RESULTS", transporter_data_with_rates)
+
+            return (transporter_data_with_rates, "")
+
+        except Exception as e:
+            return ([], str(e))
+
+    async def snapshot(self, bid_id: str) -> (any, str):
+
+        try:
+
+            (_, error) = await self.warm(bid_id=bid_id)
+            if error:
+                return ({}, error)
 
-            transporter_ids = self.get_all(sorted_set=sorted_set)
+            (seq, transporter_data_with_rates) = await self.leaderboard(bid_id=bid_id)
 
-            log("TRANSPORTER IDS", transporter_ids)
+            return ({
+                "type": "snapshot",
+                "seq": seq,
+                "bid_id": bid_id,
+                "leaderboard": transporter_data_with_rates
+            }, "")
 
-            for transporter_id in transporter_ids:
-                rate = int(redis.zscore(sorted_set, transporter_id))
-                log("TRANSPORTER DETAILS", {
-                    "TRANSPORTER_ID": transporter_id, "RATE": rate})
-                transporter_data = redis.hgetall(transporter_id)
+        except Exception as e:
+            return ({}, str(e))
 
-                log("TRANSPORTER DETAILS BEFORE RATE", transporter_data)
+    async def events_since(self, bid_id: str, seq: int) -> (any, str):
 
-                transporter_data['rate'] = rate
-                log("TRANSPORTER DETAILS AFTER RATE", transporter_data)
+        try:
 
-                transporter_data_with_rates.append(transporter_data)
+            pipeline = redis.pipeline(transaction=True)
+            pipeline.get(self.sequence_key(bid_id))
+            pipeline.lrange(self.events_key(bid_id), 0, -1)
+            (current_seq, events) = await pipeline.execute()
 
-            log("LIVE BID RESULTS", transporter_data_with_rates)
+            missed = int(current_seq or 0) - seq
 
-            return (transporter_data_with_rates, "")
+            if missed == 0:
+                return ([], "")
+
+            # the client is further behind than the event log goes back, or is ahead of a rebuilt log,
+            # either way it has to resync from a snapshot
+            if missed < 0 or missed > len(events):
+                return (None, "")
+
+            return (events[-missed:], "")
 
         except Exception as e:
             return ([], str(e))
 
-    async def get_first(self, sorted_set: str):
+    async def lowest_price(self, bid_id: str) -> (float, str):
+
         log("FETCHING LOWEST PRICE FROM REDIS")
-        transporter_id = redis.zrange(sorted_set, 0, 0)[0]
-        return (redis.zscore(sorted_set, transporter_id), "")
+
+        try:
+
+            (_, error) = await self.warm(bid_id=bid_id)
+            if error:
+                return (0, error)
+
+            lowest = await redis.zrange(self.leaderboard_key(bid_id), 0, 0)
+            if not lowest:
+                return (float("inf"), "")
+
+            rate = await redis.hget(self.transporter_key(bid_id, lowest[0]), 'rate')
+            return (float(rate), "")
+
+        except Exception as e:
+            return (0, str(e))
+
+    async def transporter_state(self, bid_id: str, transporter_id: str) -> (any, str):
+
+        try:
+
+            (_, error) = await self.warm(bid_id=bid_id)
+            if error:
+                return ({}, error)
+
+            ((rate, attempts), position, lowest_rate, (no_of_tries, show_current_lowest_rate_transporter)) = await transporter_state_script(
+                keys=[self.leaderboard_key(bid_id), self.transporter_key(bid_id, transporter_id), self.settings_key(bid_id)],
+                args=[self.transporter_key(bid_id, ""), transporter_id])
+
+            return ({
+                "rate": float(rate) if rate is not None else None,
+                "attempts": int(attempts) if attempts is not None else 0,
+                "position": position,
+                "bid_lowest_price": float(lowest_rate) if lowest_rate is not None else float("inf"),
+                "no_of_tries": int(no_of_tries) if no_of_tries else None,
+                "show_current_lowest_rate_transporter": show_current_lowest_rate_transporter == "1" if show_current_lowest_rate_transporter is not None else None
+            }, "")
+
+        except Exception as e:
+            return ({}, str(e))
+
+    async def get_first(self, sorted_set: str):
+        return await self.lowest_price(bid_id=sorted_set)
 
     async def get_last(self, sorted_set: str):
-        return redis.zrevrange(sorted_set, 0, 0)
+        return await redis.zrevrange(self.leaderboard_key(sorted_set), 0, 0)
 
     async def get_first_n(self, sorted_set: str, n: int):
-        return redis.zrange(sorted_set, 0, n)
+        return await redis.zrange(self.leaderboard_key(sorted_set), 0, n)
 
     async def get_last_n(self, sorted_set: str, n: int):
-        return redis.zrevrange(sorted_set, 0, n)
+        return await redis.zrevrange(self.leaderboard_key(sorted_set), 0, n)
 
-    def get_all(self, sorted_set: str):
+    async def get_all(self, sorted_set: str):
         log("ALL RECORDS IN SORTED SET")
-        return redis.zrange(sorted_set, 0, -1)
+        return await redis.zrange(self.leaderboard_key(sorted_set), 0, -1)
 
     async def exists(self, sorted_set: str, key: str) -> bool:
-        if not redis.zscore(sorted_set, key):
+        if not await redis.zscore(self.leaderboard_key(sorted_set), key):
             return False
         return True
 
-    def delete(self, sorted_set: str):
-        transporters = self.get_all(sorted_set=sorted_set)
+    async def delete(self, bid_ids: list) -> (int, str):
+
+        try:
+
+            if not bid_ids:
+                return (0, "")
+
+            pipeline = redis.pipeline(transaction=False)
+            for bid_id in bid_ids:
+                pipeline.zrange(self.leaderboard_key(bid_id), 0, -1)
+            leaderboards = await pipeline.execute()
+
+            keys = []
+            for bid_id, transporter_ids in zip(bid_ids, leaderboards):
+                keys += [self.leaderboard_key(bid_id), self.built_key(bid_id), self.sequence_key(bid_id), self.events_key(bid_id), self.settings_key(bid_id)]
+                keys += [self.transporter_key(bid_id, transporter_id) for transporter_id in transporter_ids]
 
-        log("TRANSPORTERS TO DELETE",transporters)
+            log("KEYS TO UNLINK", len(keys))
 
-        if not transporters:
-            return
-        
-        for transporter in transporters:
-            log("TRANSPORTER ID",transporter)
-            redis.delete(transporter)
-            redis.zrem(sorted_set,transporter)
-        
+            return (await redis.unlink(*keys), "")
+
+        except Exception as e:
+            return (0, str(e))
 
-    def position(self, sorted_set: str, key: str) -> (any, str):
+    async def position(self, sorted_set: str, key: str) -> (any, str):
 
         try:
-            return (redis.zrank(name=sorted_set, value=key, withscore=False), "")
+            return (await redis.zrank(name=self.leaderboard_key(sorted_set), value=key), "")
         except Exception as e:
             return ({}, str(e))
@@ -19,6 +19,8 @@ def convert_date_to_string(date: datetime):
 
 def structurize(input_array):
     result_dict = {}
+    transporters = {}
+    fleets = set()
 
     load_type_dict = {
         "private_pool": "Private Pool",
@@ -90,18 +92,10 @@ def structurize(input_array):
                 # result_dict[bl_id]["dest_cities"]= ', '.join(f"{key}({count})" if count > 1 else key for key, count in counter.items())
             
 
-        bid_item = {
-            "la_transporter_id": item["la_transporter_id"],
-            "trans_pos_in_bid": item["trans_pos_in_bid"],
-            "price": item["price"],
-            "price_difference_percent": item["price_difference_percent"],
-            "no_of_fleets_assigned": item["no_of_fleets_assigned"],
-            "assignment_status": item["is_assigned"],
-            "contact_name": item["name"],
-            # "contact_name": item["contact_name"],
-            "contact_no": item["contact_no"],
-            "fleets": []  # Initialize an empty list for fleets
-        }
+        # each row is one (bid, transporter, fleet), transporters and fleets already added are looked
+        # up by key instead of scanning the bid's lists, so this stays linear in the number of rows
+        transporter_key = (bl_id, item["la_transporter_id"])
+        existing_transporter = transporters.get(transporter_key)
 
         fleet_item = {
             "tf_id": item["tf_id"],
@@ -109,23 +103,33 @@ def structurize(input_array):
             "src_addrs": item["src_addrs"],
             "dest_addrs": item["dest_addrs"]
         }
+        fleet_key = (bl_id, item["la_transporter_id"], item["tf_id"], item["fleet_no"], item["src_addrs"], item["dest_addrs"])
 
-        # Check if a transporter with the same la_transporter_id already exists
-        existing_transporters = [
-            transporter for transporter in result_dict[bl_id]["transporters"]
-            if transporter["la_transporter_id"] == bid_item["la_transporter_id"]
-        ]
-
-        if existing_transporters:
+        if existing_transporter:
             # If transporter exists, append the fleet to its fleets list
-            existing_transporter = existing_transporters[0]
-            if fleet_item not in existing_transporter["fleets"] and item["trf_active"]:
+            if fleet_key not in fleets and item["trf_active"]:
+                fleets.add(fleet_key)
                 existing_transporter["fleets"].append(fleet_item)
         else:
+            bid_item = {
+                "la_transporter_id": item["la_transporter_id"],
+                "trans_pos_in_bid": item["trans_pos_in_bid"],
+                "price": item["price"],
+                "price_difference_percent": item["price_difference_percent"],
+                "no_of_fleets_assigned": item["no_of_fleets_assigned"],
+                "assignment_status": item["is_assigned"],
+                "contact_name": item["name"],
+                # "contact_name": item["contact_name"],
+                "contact_no": item["contact_no"],
+                "fleets": []  # Initialize an empty list for fleets
+            }
             # If transporter doesn't exist, add it along with the fleet
             if item["trf_active"]:
                 bid_item["fleets"].append(fleet_item)
             if item["tr_active"] and item["la_active"]:
+                transporters[transporter_key] = bid_item
+                if item["trf_active"]:
+                    fleets.add(fleet_key)
                 result_dict[bl_id]["transporters"].append(bid_item)
                 result_dict[bl_id]["total_no_of_fleets_assigned"]=result_dict[bl_id]["total_no_of_fleets_assigned"] + bid_item["no_of_fleets_assigned"]
                 result_dict[bl_id]["pending_vehicle_count"]=result_dict[bl_id]["total_no_of_fleets"] - result_dict[bl_id]["total_no_of_fleets_assigned"]
@@ -133,74 +137,41 @@ def structurize(input_array):
 
 
 def structurize_assignment_data(data):
-    # Initialize a dictionary to organize data by transporter_id
+    # rows come ordered by rate, one per rate submitted, with the transporter's assignment (if any)
     transporter_data = {}
+    rates_seen = set()
+
     for entry in data:
-        bid_details = entry["bid_details"]
-        transporter_id = bid_details.transporter_id
-        rate = bid_details.rate
-        comment = bid_details.comment
+        transporter_id = entry.transporter_id
 
-        # Create or update the transporter entry
         if transporter_id not in transporter_data:
             transporter_data[transporter_id] = {
-                "name": entry["transporter_name"],
+                "name": entry.transporter_name,
                 "id": transporter_id,
                 "total_number_attempts": 0,
-                "pmr_price": None,
-                "assigned": None,
-                "lowest_price": float('inf'),
+                "pmr_price": entry.pmr_price,
+                "assigned": entry.is_assigned,
+                "lowest_price": entry.rate,
                 "last_comment": None,
                 "rates": [],
-                "fleet_assigned": None,
-                "is_pmr_approved": None,
-                "is_negotiated_by_aculead": None
+                "fleet_assigned": entry.no_of_fleets_assigned,
+                "is_pmr_approved": entry.is_pmr_approved,
+                "is_negotiated_by_aculead": entry.is_negotiated_by_aculead
             }
 
         transporter_entry = transporter_data[transporter_id]
 
-        # Update total_number_attempts
-        # transporter_entry["total_number_attempts"] += 1
-
-        if rate < transporter_entry["lowest_price"]:
-            transporter_entry["lowest_price"] = rate
-
-        existing_entry = next(
-            (item for item in transporter_entry["rates"] if item["rate"] == rate and item["comment"] == comment), None)
-        # Add rate and comment to the rates array
-        if not existing_entry:
-            transporter_entry["rates"].append(
-                {"rate": rate, "comment": comment})
-
-        if not entry["load_assigned"]:
-            transporter_entry["pmr_price"] = None
-            transporter_entry["fleet_assigned"] = None
-            transporter_entry["is_pmr_approved"] = None
-            transporter_entry["is_negotiated_by_aculead"] = None
-
-        elif transporter_id == entry["load_assigned"].la_transporter_id:
-            transporter_entry["fleet_assigned"] = entry["load_assigned"].no_of_fleets_assigned
-            transporter_entry["pmr_price"] = entry["load_assigned"].pmr_price
-            transporter_entry["assigned"] = entry["load_assigned"].is_assigned
-            transporter_entry["is_pmr_approved"] = entry["load_assigned"].is_pmr_approved
-            transporter_entry["is_negotiated_by_aculead"] = entry["load_assigned"].is_negotiated_by_aculead
-
-    # Sort the rates array for each transporter by rate
-    for transporter_entry in transporter_data.values():
-        transporter_entry["rates"].sort(key=lambda x: x["rate"])
-        transporter_entry["last_comment"] = next((rate_comment["comment"] for rate_comment in transporter_entry["rates"] if rate_comment["comment"]), None)
-        transporter_entry["total_number_attempts"] = len(
-            transporter_entry["rates"])
+        if (transporter_id, entry.rate, entry.comment) in rates_seen:
+            continue
+        rates_seen.add((transporter_id, entry.rate, entry.comment))
+
+        transporter_entry["rates"].append({"rate": entry.rate, "comment": entry.comment})
+        transporter_entry["total_number_attempts"] += 1
+        if not transporter_entry["last_comment"] and entry.comment:
+            transporter_entry["last_comment"] = entry.comment
 
     # Sort the final array by lowest_price
-    sorted_transporter_data = []
-    for transporter_entry in transporter_data.values():
-        sorted_data_for_transporter = sorted(
-            transporter_data.values(), key=lambda x: x["lowest_price"])
-        if (sorted_data_for_transporter not in sorted_transporter_data):
-            sorted_transporter_data.append(sorted_data_for_transporter)
-
-    return sorted_transporter_data
+    return sorted(transporter_data.values(), key=lambda x: x["lowest_price"])
 
 
 def structurize_transporter_bids(bids):